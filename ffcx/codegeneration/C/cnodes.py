@@ -498,6 +498,29 @@ class SizeOf(PrefixUnaryOp):
     op = "sizeof"
 
 
+class Dereference(PrefixUnaryOp):
+    __slots__ = ()
+    precedence = PRECEDENCE.DEREFERENCE
+    op = "*"
+
+
+class Cast(PrefixUnaryOp):
+    __slots__ = ("typename", )
+    precedence = PRECEDENCE.CAST
+
+    def __init__(self, typename, arg):
+        assert isinstance(typename, str)
+        self.typename = typename
+        PrefixUnaryOp.__init__(self, arg)
+
+    @property
+    def op(self):
+        return "(" + self.typename + ")"
+
+    def __eq__(self, other):
+        return isinstance(other, type(self)) and self.typename == other.typename and self.arg == other.arg
+
+
 class Neg(PrefixUnaryOp):
     __slots__ = ()
     precedence = PRECEDENCE.NEG
@@ -0,0 +1,492 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Optimization of the loops of generated code.
+
+The passes operate on trees of CNodes before formatting:
+
+- loop nests with the same ranges accumulating the same values, e.g.
+  the blocks of the components of a vector element, are fused into the
+  first of them,
+- values accumulated by several statements of a sequence are computed
+  once,
+- products of factors which don't change in a loop are hoisted out of
+  the loop, e.g. ``fw * FE0[iq][i]`` out of the loop over ``j``, and
+  reused by following loops of the same sequence.
+
+Only side effect free expressions of symbols, array accesses, literals
+and additions and multiplications are moved, and the order of the
+accumulations into each entry of an array is preserved.
+"""
+
+import itertools
+
+import numpy
+
+import ffcx.codegeneration.C.cnodes as L
+
+# Expression types which are moved by the passes
+_pure_types = (L.Symbol, L.LiteralFloat, L.LiteralInt, L.ArrayAccess, L.Product, L.Sum, L.Mul, L.Add,
+               L.Sub, L.Neg)
+
+# Statements with bodies which are optimized
+_scoped_types = (L.ForRange, L.Scope, L.If, L.ElseIf, L.Else)
+
+
+def optimize_loops(statement):
+    """Optimize the loops of a statement.
+
+    Returns the optimized statement and the number of multiplications
+    removed from its execution, see count_multiplications.
+    """
+    optimizer = LoopOptimizer()
+    optimized = L.StatementList(optimizer.optimize(_statements(statement)))
+    return optimized, count_multiplications(statement) - count_multiplications(optimized)
+
+
+def count_multiplications(node, weight=1):
+    """Count the floating point multiplications executed by a statement.
+
+    The multiplications in loops over literal ranges are counted for
+    each iteration. Multiplications in array indices and in the values
+    of array declarations are not counted.
+    """
+    if isinstance(node, L.ForRange):
+        if isinstance(node.begin, L.LiteralInt) and isinstance(node.end, L.LiteralInt):
+            weight *= max(node.end.value - node.begin.value, 0)
+        return count_multiplications(node.body, weight)
+    elif isinstance(node, (L.ArrayDecl, L.ArrayAccess)):
+        return 0
+    count = 0
+    if isinstance(node, L.Product):
+        count += (len(node.args) - 1) * weight
+    elif isinstance(node, (L.Mul, L.AssignMul)):
+        count += weight
+    return count + sum(count_multiplications(child, weight) for child in _children(node))
+
+
+class LoopOptimizer(object):
+    """Optimizer of the loops of sequences of statements, see optimize_loops."""
+
+    def __init__(self):
+        self.counters = {}
+
+    def new_symbol(self, basename):
+        """Create a new symbol for a temporary value."""
+        counter = self.counters.setdefault(basename, itertools.count())
+        return L.Symbol("{}{}".format(basename, next(counter)))
+
+    def optimize(self, statements):
+        """Optimize a sequence of statements, returning the new sequence."""
+        statements = self.fuse_loops(statements)
+        statements = [self.optimize_body(statement) for statement in statements]
+        statements = self.eliminate_common_accumulations(statements)
+        return self.hoist_invariants(statements)
+
+    def optimize_body(self, statement):
+        """Return a copy of a scoped statement with its body optimized."""
+        if not isinstance(statement, _scoped_types):
+            return statement
+        body = _as_body(self.optimize(_statements(statement.body)))
+        if isinstance(statement, L.ForRange):
+            return L.ForRange(statement.index, statement.begin, statement.end, body,
+                              index_type=statement.index_type)
+        elif isinstance(statement, (L.If, L.ElseIf)):
+            return type(statement)(statement.condition, body)
+        return type(statement)(body)
+
+    def fuse_loops(self, statements):
+        """Fuse loop nests with the same ranges accumulating the same values into the first of them."""
+        statements = list(statements)
+        first = {}
+        k = 0
+        while k < len(statements):
+            key = _accumulation_nest_key(statements[k])
+            if key is not None:
+                j = first.setdefault(key, k)
+                if j < k and _can_move_nest(statements[k], statements[j:k]):
+                    statements[j] = _fuse_nests(statements[j], statements[k])
+                    del statements[k]
+                    continue
+            k += 1
+        return statements
+
+    def eliminate_common_accumulations(self, statements):
+        """Compute values accumulated by several statements of a sequence once."""
+        positions = {}
+        for k, statement in enumerate(statements):
+            rhs = _accumulated_value(statement)
+            if isinstance(rhs, (L.Product, L.Mul)) and _is_pure(rhs):
+                positions.setdefault(rhs.ce_format(), []).append(k)
+
+        declarations = {}
+        for shared in positions.values():
+            rhs = statements[shared[0]].expr.rhs
+            reads = _read_symbols(rhs)
+
+            # Share the value until a statement writes a symbol it
+            # depends on
+            used = shared[:1]
+            for k in shared[1:]:
+                written = _written_symbols(statements[used[-1]:k])
+                if written is None or written & reads:
+                    break
+                used.append(k)
+            if len(used) < 2:
+                continue
+
+            symbol = self.new_symbol("cse")
+            declarations[used[0]] = L.VariableDecl("const ufc_scalar_t", symbol, rhs)
+            for k in used:
+                statements[k] = L.Statement(type(statements[k].expr)(statements[k].expr.lhs, symbol))
+
+        result = []
+        for k, statement in enumerate(statements):
+            if k in declarations:
+                result.append(declarations[k])
+            result.append(statement)
+        return result
+
+    def hoist_invariants(self, statements):
+        """Hoist products which are invariant in the loops of a sequence out of the loops."""
+        # Hoisted products available for reuse, with the symbols they
+        # depend on
+        available = {}
+
+        result = []
+        for statement in statements:
+            if isinstance(statement, L.ForRange):
+                declarations, statement = self.hoist_loop_invariants(statement, available)
+                result += declarations
+            result.append(statement)
+
+            written = _written_symbols([statement])
+            for key, (symbol, reads) in list(available.items()):
+                if written is None or written & reads:
+                    del available[key]
+        return result
+
+    def hoist_loop_invariants(self, loop, available):
+        """Hoist products which are invariant in a loop out of the loop.
+
+        Returns the declarations of the new hoisted products and the new
+        loop. Products in available are reused, and the new products are
+        added to it.
+        """
+        # Loops with bounds known at runtime only, e.g. over a triangle
+        # of a symmetric block, are assumed to iterate more than once
+        if (isinstance(loop.begin, L.LiteralInt) and isinstance(loop.end, L.LiteralInt)
+                and loop.end.value - loop.begin.value <= 1):
+            return [], loop
+
+        body = _statements(loop.body)
+        variant = _written_symbols(body)
+        if variant is None:
+            return [], loop
+        variant.add(loop.index.name)
+
+        declarations = []
+        for k, statement in enumerate(body):
+            factors = _product_factors(statement)
+            if factors is None:
+                continue
+            invariant = [_is_pure(f) and not (_read_symbols(f) & variant) for f in factors]
+            if sum(invariant) < 2:
+                continue
+
+            product = L.Product([f for f, inv in zip(factors, invariant) if inv])
+            key = product.ce_format()
+            if key not in available:
+                symbol = self.new_symbol("inv")
+                declarations.append(L.VariableDecl("const ufc_scalar_t", symbol, product))
+                available[key] = (symbol, _read_symbols(product))
+            symbol, _ = available[key]
+
+            value = L.float_product([symbol] + [f for f, inv in zip(factors, invariant) if not inv])
+            if isinstance(statement, L.VariableDecl):
+                body[k] = L.VariableDecl(statement.typename, statement.symbol, value)
+            else:
+                body[k] = L.Statement(type(statement.expr)(statement.expr.lhs, value))
+
+        if not declarations and all(a is b for a, b in zip(body, _statements(loop.body))):
+            return [], loop
+        return declarations, L.ForRange(loop.index, loop.begin, loop.end, _as_body(body),
+                                        index_type=loop.index_type)
+
+
+def _children(node):
+    """Iterate over the CNodes which are direct children of a node."""
+    for cls in type(node).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            value = getattr(node, name, None)
+            if isinstance(value, (list, tuple)):
+                for v in value:
+                    if isinstance(v, L.CNode):
+                        yield v
+            elif isinstance(value, L.CNode):
+                yield value
+
+
+def _statements(statement):
+    """Return a statement as a flat list of statements."""
+    if isinstance(statement, L.StatementList):
+        return [s for st in statement.statements for s in _statements(st)]
+    return [statement]
+
+
+def _as_body(statements):
+    if len(statements) == 1:
+        return statements[0]
+    return L.StatementList(statements)
+
+
+def _is_pure(expr):
+    return isinstance(expr, _pure_types) and all(_is_pure(child) for child in _children(expr))
+
+
+def _read_symbols(expr):
+    """Return the names of the symbols in an expression."""
+    if isinstance(expr, L.Symbol):
+        return {expr.name}
+    symbols = set()
+    for child in _children(expr):
+        symbols |= _read_symbols(child)
+    return symbols
+
+
+def _written_symbols(statements):
+    """Return the names of the symbols declared or assigned by statements.
+
+    Returns None if a statement may write unknown symbols. The indices
+    of loops are local to the loops and not included.
+    """
+    written = set()
+    for statement in statements:
+        if isinstance(statement, (L.VariableDecl, L.ArrayDecl)):
+            written.add(statement.symbol.name)
+        elif isinstance(statement, L.Statement):
+            symbol = _assigned_symbol(statement.expr)
+            if symbol is None:
+                return None
+            written.add(symbol)
+        elif isinstance(statement, L.StatementList):
+            statement = _written_symbols(statement.statements)
+            if statement is None:
+                return None
+            written |= statement
+        elif isinstance(statement, _scoped_types):
+            statement = _written_symbols([statement.body])
+            if statement is None:
+                return None
+            written |= statement
+        elif not isinstance(statement, (L.Comment, L.Pragma)):
+            return None
+    return written
+
+
+def _assigned_symbol(expr):
+    """Return the name of the symbol assigned by an expression statement, or None if unknown."""
+    if not isinstance(expr, L.AssignOp):
+        return None
+    lhs = expr.lhs
+    while isinstance(lhs, (L.Dereference, L.Cast, L.AddressOf)):
+        lhs = lhs.arg
+    if isinstance(lhs, L.ArrayAccess):
+        lhs = lhs.array
+    if isinstance(lhs, L.Symbol):
+        return lhs.name
+    return None
+
+
+def _accumulated_value(statement):
+    """Return the value accumulated into an array entry by a statement, or None."""
+    if (isinstance(statement, L.Statement) and isinstance(statement.expr, L.AssignAdd)
+            and isinstance(statement.expr.lhs, L.ArrayAccess)):
+        return statement.expr.rhs
+    return None
+
+
+def _product_factors(statement):
+    """Return the factors of the product assigned or declared by a statement, or None."""
+    if isinstance(statement, L.VariableDecl) and "ufc_scalar_t" in statement.typename:
+        value = statement.value
+    elif isinstance(statement, L.Statement) and isinstance(statement.expr, (L.Assign, L.AssignAdd)):
+        value = statement.expr.rhs
+    else:
+        return None
+    if isinstance(value, L.Product):
+        return list(value.args)
+    elif isinstance(value, L.Mul):
+        return [value.lhs, value.rhs]
+    return None
+
+
+def _accumulation_nest_key(statement):
+    """Return the ranges and accumulated values of a loop nest accumulating into array entries.
+
+    Returns None if the statement isn't a nest of loops with bounds
+    affine in the indices of the enclosing loops of the nest around
+    accumulations of pure values.
+    """
+    ranges = []
+    while isinstance(statement, L.ForRange):
+        outer = {index: None for index, begin, end in ranges}
+        if _affine_coefficients(statement.begin, outer) is None or _affine_coefficients(statement.end, outer) is None:
+            return None
+        ranges.append((statement.index.name, statement.begin.ce_format(), statement.end.ce_format()))
+        statement = statement.body
+    if not ranges:
+        return None
+
+    values = set()
+    for st in _statements(statement):
+        rhs = _accumulated_value(st)
+        if rhs is None or not _is_pure(rhs):
+            return None
+        values.add(rhs.ce_format())
+    return tuple(ranges), tuple(sorted(values))
+
+
+def _fuse_nests(nest0, nest1):
+    """Fuse two loop nests with the same ranges."""
+    if isinstance(nest0, L.ForRange):
+        return L.ForRange(nest0.index, nest0.begin, nest0.end, _fuse_nests(nest0.body, nest1.body),
+                          index_type=nest0.index_type)
+    return L.StatementList(_statements(nest0) + _statements(nest1))
+
+
+def _can_move_nest(nest, statements):
+    """Check if an accumulating loop nest can be moved in front of statements.
+
+    The values of the nest must not depend on symbols written by the
+    statements, and the statements must not access the array entries
+    accumulated by the nest.
+    """
+    written = _written_symbols(statements)
+    if written is None:
+        return False
+
+    loop = nest
+    indices = set()
+    while isinstance(loop, L.ForRange):
+        indices.add(loop.index.name)
+        loop = loop.body
+    accumulations = _statements(loop)
+    arrays = {_assigned_symbol(st.expr) for st in accumulations}
+    for st in accumulations:
+        if (_read_symbols(st.expr.rhs) - indices) & (written | arrays):
+            return False
+
+    for array in arrays:
+        entries = _array_entries(nest, array, {})
+        for statement in statements:
+            other = _array_entries(statement, array, {})
+            if other is None or numpy.intersect1d(entries, other).size > 0:
+                return False
+    return True
+
+
+def _array_entries(node, array, ranges):
+    """Return the entries of a flattened array accessed by a statement.
+
+    Ranges maps the indices of the enclosing loops to their ranges.
+    Returns None if the entries can't be determined, i.e. if the
+    indices aren't affine in the indices of loops with bounds affine in
+    the indices of the enclosing loops or the address of an entry is
+    taken. The entries of loops with bounds depending on the enclosing
+    loops, e.g. over a triangle, include the entries of the bounding
+    box of the loops.
+    """
+    if isinstance(node, L.ArrayAccess) and node.array.name == array:
+        if len(node.indices) != 1:
+            return None
+        coefficients = _affine_coefficients(node.indices[0], ranges)
+        if coefficients is None:
+            return None
+        entries = numpy.array(coefficients.pop(None, 0))
+        for index, c in coefficients.items():
+            entries = numpy.add.outer(entries, c * numpy.arange(*ranges[index]))
+        return numpy.unique(entries)
+    elif isinstance(node, L.AddressOf) and array in _read_symbols(node):
+        return None
+    elif isinstance(node, L.VerbatimStatement):
+        return None
+    elif isinstance(node, (L.VariableDecl, L.ArrayDecl)) and node.symbol.name == array:
+        return None
+    elif isinstance(node, L.ArrayDecl):
+        return numpy.array([], dtype=int)
+
+    if isinstance(node, L.ForRange):
+        begin = _affine_bounds(node.begin, ranges)
+        end = _affine_bounds(node.end, ranges)
+        if begin is None or end is None:
+            ranges = dict(ranges)
+            ranges.pop(node.index.name, None)
+        else:
+            ranges = dict(ranges, **{node.index.name: (begin[0], end[1])})
+    entries = [numpy.array([], dtype=int)]
+    for child in _children(node):
+        child_entries = _array_entries(child, array, ranges)
+        if child_entries is None:
+            return None
+        entries.append(child_entries)
+    return numpy.unique(numpy.concatenate(entries))
+
+
+def _affine_bounds(expr, ranges):
+    """Return the minimum and maximum of an integer expression affine in loop indices, or None."""
+    coefficients = _affine_coefficients(expr, ranges)
+    if coefficients is None:
+        return None
+    low = high = coefficients.pop(None, 0)
+    for index, c in coefficients.items():
+        begin, end = ranges[index]
+        if end <= begin:
+            continue
+        low += min(c * begin, c * (end - 1))
+        high += max(c * begin, c * (end - 1))
+    return low, high
+
+
+def _affine_coefficients(expr, ranges):
+    """Return the coefficients of an integer expression affine in loop indices, or None.
+
+    The coefficients are keyed by the name of the index, and None for
+    the constant term.
+    """
+    if isinstance(expr, L.LiteralInt):
+        return {None: expr.value}
+    elif isinstance(expr, L.Symbol):
+        return {expr.name: 1} if expr.name in ranges else None
+    elif isinstance(expr, (L.Add, L.Sub, L.Sum, L.Neg)):
+        if isinstance(expr, L.Sum):
+            terms = [(1, arg) for arg in expr.args]
+        elif isinstance(expr, L.Neg):
+            terms = [(-1, expr.arg)]
+        else:
+            terms = [(1, expr.lhs), (1 if isinstance(expr, L.Add) else -1, expr.rhs)]
+        coefficients = {}
+        for sign, term in terms:
+            term = _affine_coefficients(term, ranges)
+            if term is None:
+                return None
+            for key, c in term.items():
+                coefficients[key] = coefficients.get(key, 0) + sign * c
+        return coefficients
+    elif isinstance(expr, (L.Mul, L.Product)):
+        factors = [expr.lhs, expr.rhs] if isinstance(expr, L.Mul) else expr.args
+        coefficients = {None: 1}
+        for factor in factors:
+            factor = _affine_coefficients(factor, ranges)
+            if factor is None:
+                return None
+            if set(factor) == {None}:
+                coefficients = {key: c * factor[None] for key, c in coefficients.items()}
+            elif set(coefficients) == {None}:
+                coefficients = {key: c * coefficients[None] for key, c in factor.items()}
+            else:
+                return None
+        return coefficients
+    return None
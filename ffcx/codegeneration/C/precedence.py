@@ -30,6 +30,7 @@ class PRECEDENCE:
     DEREFERENCE = 3
     ADDRESSOF = 3
     SIZEOF = 3
+    CAST = 3
 
     MUL = 4
     DIV = 4
@@ -0,0 +1,97 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Ahead-of-time compilation of kernel bundles.
+
+A bundle is a single extension module with the forms and elements of
+many UFL files, and a manifest which maps the signature of each form
+and element to the factory functions in the module. Bundles are built
+with ``ffcx --bundle <dir> <files>`` and registered with
+:func:`ffcx.codegeneration.jit.register_bundle`, after which the JIT
+loads the bundled objects instead of compiling them.
+"""
+
+import json
+import logging
+from pathlib import Path
+
+import ufl
+import ffcx.compiler
+import ffcx.formatting
+import ffcx.naming
+import ffcx.parameters
+from ffcx.codegeneration import jit
+
+logger = logging.getLogger("ffcx")
+
+
+def build_bundle(ufl_files, output_dir, parameters=None, cffi_extra_compile_args=None, cffi_verbose=False,
+                 cffi_debug=None, cffi_libraries=None, cffi_jobs=1):
+    """Compile the forms (or elements, for files without forms) of UFL files into a bundle.
+
+    Returns the path of the manifest of the bundle.
+    """
+    p = ffcx.parameters.default_parameters()
+    if parameters is not None:
+        p.update(parameters)
+
+    # Collect objects from all files, dropping duplicates
+    forms = {}
+    elements = {}
+    for filename in ufl_files:
+        ufd = ufl.algorithms.load_ufl_file(str(filename))
+        if len(ufd.forms) > 0:
+            for form in ufd.forms:
+                forms.setdefault(jit.compute_bundle_key(form, p), form)
+        else:
+            for element in ufd.elements:
+                elements.setdefault(jit.compute_bundle_key(element, p), element)
+
+    # Generate code. Objects shared by the forms and elements, such as
+    # elements used by the forms, are generated twice and only kept once.
+    preamble = ffcx.formatting._generate_preamble(p)[1]
+    declarations = ""
+    implementations = []
+    for ufl_objects in (list(forms.values()), list(elements.values())):
+        if ufl_objects:
+            code_body, code_implementations = ffcx.compiler.compile_ufl_objects(
+                ufl_objects, prefix="JIT", parameters=p, split=True)
+            assert code_body.startswith(preamble)
+            declarations += code_body[len(preamble):]
+            implementations += [c for c in code_implementations if c not in implementations]
+    code_body = preamble + declarations
+
+    # Names of the factory functions of each object
+    objects = {}
+    for form_id, (key, form) in enumerate(forms.items()):
+        objects[key] = [ffcx.naming.form_name(form, form_id)]
+    for key, element in elements.items():
+        objects[key] = [ffcx.naming.finite_element_name(element, "JIT"), ffcx.naming.dofmap_name(element, "JIT")]
+
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = jit.UFC_HEADER_DECL.format(scalar_type) + jit.UFC_ELEMENT_DECL + jit.UFC_DOFMAP_DECL + \
+        jit.UFC_COORDINATEMAPPING_DECL + jit.UFC_INTEGRAL_DECL + jit.UFC_FORM_DECL
+    templates = {"form": "ufc_form * create_{name}(void);\n",
+                 "element": "ufc_finite_element * create_{name}(void);\n",
+                 "dofmap": "ufc_dofmap * create_{name}(void);\n"}
+    for names in objects.values():
+        for name in names:
+            decl += templates[name.split("_")[0]].format(name=name)
+
+    module_name = "libffcx_bundle_" + jit._compute_module_signature(code_body, implementations,
+                                                                    cffi_extra_compile_args, cffi_debug,
+                                                                    cffi_libraries)
+    output_dir = Path(output_dir).absolute()
+    output_dir.mkdir(exist_ok=True, parents=True)
+    jit._build_module(decl, code_body, implementations, module_name, output_dir,
+                      cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
+
+    manifest = {"module": module_name, "parameters": p, "objects": objects}
+    manifest_filename = output_dir.joinpath(jit.BUNDLE_MANIFEST)
+    with open(manifest_filename, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info("Wrote bundle {} with {} forms and {} elements".format(module_name, len(forms), len(elements)))
+    return manifest_filename
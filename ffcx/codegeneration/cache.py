@@ -0,0 +1,305 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Managed cache of JIT compiled modules.
+
+Compiled modules are recorded in a small SQLite index stored in the
+cache directory. The index maps module names to the files produced by
+the C compiler, so that a cached module can be located without scanning
+the cache directory, and keeps track of sizes and access times, which
+are used to evict the least recently used modules when the cache
+exceeds its size limits. The generated C code, which is shared by
+modules compiled with different flags, is an entry of its own, and is
+generated again if it is needed after eviction. The object files of
+modules compiled as separate translation units are indexed as well, so
+that unchanged translation units are reused when a module is recompiled.
+"""
+
+import argparse
+import contextlib
+import importlib.machinery
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+logger = logging.getLogger("ffcx")
+
+INDEX_FILENAME = "ffcx-cache-index.sqlite"
+
+# Suffixes of files written for each JIT module
+_artifact_suffixes = (".c", ".c.cached", ".c.failed", ".o") + tuple(importlib.machinery.EXTENSION_SUFFIXES)
+
+_schema = """
+CREATE TABLE IF NOT EXISTS modules (
+    name TEXT PRIMARY KEY,
+    module_file TEXT NOT NULL,
+    files TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS modules_last_access ON modules (last_access);
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    object_file TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS limits (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+
+class JITCache(object):
+    """Index of the JIT modules stored in a cache directory.
+
+    The size of the cache is bounded by ``max_size`` (in bytes) and
+    ``max_entries`` (number of modules and generated sources). Limits
+    which are ``None`` are read from the index, where they can be stored
+    persistently with :meth:`set_limits` (e.g. ``python -m ffcx cache
+    limit``). A limit of ``None`` in both places means unbounded.
+    """
+
+    def __init__(self, cache_dir, max_size=None, max_entries=None):
+        self.cache_dir = Path(cache_dir)
+        self.index_filename = self.cache_dir.joinpath(INDEX_FILENAME)
+        self._max_size = max_size
+        self._max_entries = max_entries
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # The index is created in an existing cache directory only, so
+        # that e.g. the stats of a mistyped directory don't create it
+        if not self.cache_dir.is_dir():
+            raise FileNotFoundError("JIT cache directory {} does not exist.".format(self.cache_dir))
+        # Long timeout, the index may be shared by many processes
+        connection = sqlite3.connect(str(self.index_filename), timeout=60.0)
+        try:
+            connection.executescript(_schema)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def lookup(self, module_name):
+        """Return path of the compiled extension module, or None if not cached.
+
+        A successful lookup marks the module as most recently used.
+        Generated sources are looked up by their name as well.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT module_file FROM modules WHERE name = ?", (module_name, )).fetchone()
+            if row is None:
+                return None
+            path = self.cache_dir.joinpath(row[0])
+            if not path.exists():
+                # Files were removed behind our back
+                db.execute("DELETE FROM modules WHERE name = ?", (module_name, ))
+                return None
+            db.execute("UPDATE modules SET last_access = ?, hits = hits + 1 WHERE name = ?",
+                       (time.time(), module_name))
+        return path
+
+    def register(self, module_name):
+        """Record the files of a freshly compiled module in the index."""
+        files = []
+        module_file = None
+        for suffix in _artifact_suffixes:
+            path = self.cache_dir.joinpath(module_name + suffix)
+            if path.exists():
+                files.append(path.name)
+                if suffix in importlib.machinery.EXTENSION_SUFFIXES:
+                    module_file = path.name
+        # Translation units of modules compiled in parallel
+        files += sorted(path.name for path in self.cache_dir.glob(module_name + "_unit*"))
+        if module_file is None:
+            raise ModuleNotFoundError("Unable to find JIT module {} in {}.".format(module_name, self.cache_dir))
+        size = sum(self.cache_dir.joinpath(f).stat().st_size for f in files)
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO modules (name, module_file, files, size, created, last_access)"
+                       " VALUES (?, ?, ?, ?, ?, ?)", (module_name, module_file, ";".join(files), size, now, now))
+
+    def register_source(self, source_name):
+        """Record a generated source, stored in <source_name>.json, in the index."""
+        filename = source_name + ".json"
+        try:
+            size = self.cache_dir.joinpath(filename).stat().st_size
+        except FileNotFoundError:
+            # Evicted by another process
+            return
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO modules (name, module_file, files, size, created, last_access)"
+                       " VALUES (?, ?, ?, ?, ?, ?)", (source_name, filename, filename, size, now, now))
+
+    def lookup_object(self, key):
+        """Return path of a compiled translation unit, or None if not cached.
+
+        Object files are stored with the module they were compiled for,
+        and are removed with it when the module is evicted.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT object_file FROM objects WHERE key = ?", (key, )).fetchone()
+            if row is None:
+                return None
+            path = self.cache_dir.joinpath(row[0])
+            if not path.exists():
+                db.execute("DELETE FROM objects WHERE key = ?", (key, ))
+                return None
+        return path
+
+    def register_objects(self, object_files):
+        """Record compiled translation units, a dict mapping keys to object files in the cache directory."""
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO objects (key, object_file) VALUES (?, ?)",
+                           [(key, Path(f).name) for key, f in object_files.items()])
+
+    def limits(self):
+        """Return the (max_size, max_entries) policy of this cache."""
+        with self._connect() as db:
+            stored = dict(db.execute("SELECT key, value FROM limits").fetchall())
+        max_size = self._max_size if self._max_size is not None else stored.get("max_size")
+        max_entries = self._max_entries if self._max_entries is not None else stored.get("max_entries")
+        return max_size, max_entries
+
+    def set_limits(self, **limits):
+        """Store the limits max_size and max_entries persistently in the index.
+
+        Limits which are not given are left unchanged, a limit of None
+        is removed. The cache directory is created if it doesn't exist.
+        """
+        unknown = set(limits) - {"max_size", "max_entries"}
+        if unknown:
+            raise TypeError("Unknown JIT cache limits: {}".format(", ".join(sorted(unknown))))
+
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        with self._connect() as db:
+            for key, value in limits.items():
+                if value is None:
+                    db.execute("DELETE FROM limits WHERE key = ?", (key, ))
+                else:
+                    db.execute("INSERT OR REPLACE INTO limits (key, value) VALUES (?, ?)", (key, int(value)))
+
+    def stats(self):
+        """Return a dict with statistics about the cache."""
+        max_size, max_entries = self.limits()
+        with self._connect() as db:
+            entries, size, hits = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM modules").fetchone()
+        return {"cache_dir": str(self.cache_dir), "entries": entries, "size": size, "hits": hits,
+                "max_size": max_size, "max_entries": max_entries}
+
+    def prune(self, max_size=None, max_entries=None, keep=()):
+        """Evict least recently used modules until the cache is within its limits.
+
+        Modules listed in ``keep`` are never evicted. Returns the list
+        of evicted module names.
+        """
+        default_size, default_entries = self.limits()
+        max_size = max_size if max_size is not None else default_size
+        max_entries = max_entries if max_entries is not None else default_entries
+        if max_size is None and max_entries is None:
+            return []
+
+        evicted = []
+        with self._connect() as db:
+            rows = db.execute("SELECT name, files, size FROM modules ORDER BY last_access ASC").fetchall()
+            num_entries = len(rows)
+            size = sum(row[2] for row in rows)
+            for name, files, entry_size in rows:
+                too_many = max_entries is not None and num_entries > max_entries
+                too_large = max_size is not None and size > max_size
+                if not (too_many or too_large):
+                    break
+                if name in keep:
+                    continue
+                self._remove_files(files.split(";"))
+                db.execute("DELETE FROM modules WHERE name = ?", (name, ))
+                num_entries -= 1
+                size -= entry_size
+                evicted.append(name)
+
+        if evicted:
+            logger.info("Evicted {} module(s) from JIT cache {}".format(len(evicted), self.cache_dir))
+        return evicted
+
+    def clear(self):
+        """Remove all JIT modules (and files of failed compilations) from the cache.
+
+        Lock files are kept, as they may be in use by another process,
+        see prune. Returns the number of removed files.
+        """
+        removed = 0
+        with self._connect() as db:
+            # Hold the write lock of the index while removing the files,
+            # and remove the files before the entries, as prune does
+            db.execute("BEGIN IMMEDIATE")
+            for path in self.cache_dir.glob("libffcx_*"):
+                if path.suffix != ".lock" and path.is_file():
+                    self._remove_files([path.name])
+                    removed += 1
+            db.execute("DELETE FROM modules")
+            db.execute("DELETE FROM objects")
+        return removed
+
+    def _remove_files(self, files):
+        for f in files:
+            try:
+                os.remove(self.cache_dir.joinpath(f))
+            except FileNotFoundError:
+                pass
+
+
+def parse_size(size):
+    """Parse a size such as '512M' or '2G' into a number of bytes."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def _parse_limit(parse):
+    """Return a parser of a limit on the command line, where 'none' is no limit."""
+    def parse_limit(value):
+        if value.strip().lower() == "none":
+            return None
+        return parse(value)
+    return parse_limit
+
+
+def main(args=None):
+    """Command-line interface to the JIT cache, ``python -m ffcx cache``."""
+    parser = argparse.ArgumentParser(prog="ffcx cache", description="Manage the FFCX JIT cache")
+    parser.add_argument("command", choices=("stats", "prune", "clear", "limit"))
+    parser.add_argument("cache_dir", help="JIT cache directory")
+    # Limits which are not given are left unchanged by 'limit'
+    parser.add_argument("--max-size", type=_parse_limit(parse_size), default=argparse.SUPPRESS,
+                        help="maximum size, e.g. 500M or 2G, or 'none'")
+    parser.add_argument("--max-entries", type=_parse_limit(int), default=argparse.SUPPRESS,
+                        help="maximum number of modules and generated sources, or 'none'")
+    xargs = parser.parse_args(args)
+    limits = {key: value for key, value in vars(xargs).items() if key in ("max_size", "max_entries")}
+
+    cache = JITCache(xargs.cache_dir)
+    if xargs.command != "limit" and not cache.cache_dir.is_dir():
+        parser.error("JIT cache directory {} does not exist".format(xargs.cache_dir))
+    if xargs.command == "stats":
+        for key, value in cache.stats().items():
+            print("{}: {}".format(key, value))
+    elif xargs.command == "prune":
+        evicted = cache.prune(limits.get("max_size"), limits.get("max_entries"))
+        print("Evicted {} module(s)".format(len(evicted)))
+    elif xargs.command == "clear":
+        print("Removed {} file(s)".format(cache.clear()))
+    elif xargs.command == "limit":
+        cache.set_limits(**limits)
+    return 0
@@ -14,6 +14,7 @@ UFC function from an intermediate representation (IR).
 import logging
 from collections import namedtuple
 
+from ffcx import instrumentation
 from ffcx.codegeneration.coordinate_mapping import \
     generator as coordinate_mapping_generator
 from ffcx.codegeneration.dofmap import generator as dofmap_generator
@@ -41,7 +42,10 @@ def generate_code(ir, parameters):
     code_finite_elements = [finite_element_generator(element_ir, parameters) for element_ir in ir.elements]
     code_dofmaps = [dofmap_generator(dofmap_ir, parameters) for dofmap_ir in ir.dofmaps]
     code_coordinate_mappings = [coordinate_mapping_generator(cmap_ir, parameters) for cmap_ir in ir.coordinate_mappings]
-    code_integrals = [integral_generator(integral_ir, parameters) for integral_ir in ir.integrals]
+    code_integrals = []
+    for integral_ir in ir.integrals:
+        with instrumentation.section(integral_ir.name):
+            code_integrals.append(integral_generator(integral_ir, parameters))
     code_forms = [form_generator(form_ir, parameters) for form_ir in ir.forms]
     code_expressions = [expression_generator(expression_ir, parameters) for expression_ir in ir.expressions]
 
@@ -20,6 +20,12 @@ ufc_coordinate_mapping* create_coordinate_map_{prefix}(void);
 factory = """
 // Code for coordinate mapping {factory_name}
 
+// Defined with the coordinate element, which may be in another
+// translation unit
+int evaluate_reference_basis_derivatives_{coord_element_factory_name}(double * restrict reference_values,
+                                          int order, int num_points,
+                                          const double * restrict X);
+
 ufc_coordinate_mapping* create_{factory_name}(void)
 {{
   ufc_coordinate_mapping* cmap = malloc(sizeof(*cmap));
@@ -9,6 +9,7 @@
 
 import logging
 import ffcx.codegeneration.dofmap_template as ufc_dofmap
+from ffcx.codegeneration.finite_element import generate_apply_dof_transformation
 from ffcx.codegeneration.utils import generate_return_new_switch
 
 logger = logging.getLogger("ffcx")
@@ -102,6 +103,10 @@ def generator(ir, parameters):
 
     # Functions
     d["tabulate_entity_dofs"] = tabulate_entity_dofs(L, ir)
+    d["apply_dof_transformation"] = L.StatementList(
+        generate_apply_dof_transformation(L, ir, transpose=False))
+    d["apply_dof_transformation_transpose"] = L.StatementList(
+        generate_apply_dof_transformation(L, ir, transpose=True))
     d["sub_dofmap_declaration"] = sub_dofmap_declaration(L, ir)
     d["create_sub_dofmap"] = create_sub_dofmap(L, ir)
 
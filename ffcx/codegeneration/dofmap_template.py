@@ -15,6 +15,18 @@ void tabulate_entity_dofs_{factory_name}(int* restrict dofs, int d, int i)
 {tabulate_entity_dofs}
 }}
 
+int apply_dof_transformation_{factory_name}(ufc_scalar_t* restrict data, int block_size,
+                                            uint32_t cell_permutation)
+{{
+{apply_dof_transformation}
+}}
+
+int apply_dof_transformation_transpose_{factory_name}(ufc_scalar_t* restrict data, int block_size,
+                                                      uint32_t cell_permutation)
+{{
+{apply_dof_transformation_transpose}
+}}
+
 {sub_dofmap_declaration}
 ufc_dofmap* create_sub_dofmap_{factory_name}(int i)
 {{
@@ -32,6 +44,8 @@ ufc_dofmap* create_{factory_name}(void)
   dofmap->num_entity_dofs[2] = {num_entity_dofs[2]};
   dofmap->num_entity_dofs[3] = {num_entity_dofs[3]};
   dofmap->tabulate_entity_dofs = tabulate_entity_dofs_{factory_name};
+  dofmap->apply_dof_transformation = apply_dof_transformation_{factory_name};
+  dofmap->apply_dof_transformation_transpose = apply_dof_transformation_transpose_{factory_name};
   dofmap->num_sub_dofmaps = {num_sub_dofmaps};
   dofmap->create_sub_dofmap = create_sub_dofmap_{factory_name};
   dofmap->create = create_{factory_name};
@@ -246,7 +246,7 @@ class ExpressionGenerator:
         body = []
 
         for fi_ci in blockdata.factor_indices_comp_indices:
-            f = self.get_var(F.nodes[fi_ci[0]]["expression"])
+            f = self.get_var(F.expressions[fi_ci[0]])
             Brhs = L.float_product([f] + arg_factors)
             body.append(L.AssignAdd(A[(fi_ci[1],) + A_indices], Brhs))
 
@@ -307,18 +307,16 @@ class ExpressionGenerator:
         definitions = []
         intermediates = []
 
-        for i, attr in F.nodes.items():
-            if attr['status'] != mode:
-                continue
-            v = attr['expression']
-            mt = attr.get('mt')
+        for i in F.nodes_with_status(mode):
+            v = F.expressions[i]
+            mt = F.mts.get(i)
 
             if v._ufl_is_literal_:
                 vaccess = self.backend.ufl_to_language.get(v)
             elif mt is not None:
                 # All finite element based terminals have table data, as well
                 # as some, but not all, of the symbolic geometric terminals
-                tabledata = attr.get('tr')
+                tabledata = F.table_reference(i)
 
                 # Backend specific modified terminal translation
                 vaccess = self.backend.access.get(mt.terminal, mt, tabledata, 0)
@@ -332,9 +330,10 @@ class ExpressionGenerator:
                 vops = [self.get_var(op) for op in v.ufl_operands]
 
                 # get parent operand
-                pid = F.in_edges[i][0] if F.in_edges[i] else -1
+                parents = F.in_edges(i)
+                pid = parents[0] if len(parents) else -1
                 if pid and pid > i:
-                    parent_exp = F.nodes.get(pid)['expression']
+                    parent_exp = F.expressions[pid]
                 else:
                     parent_exp = None
 
@@ -10,6 +10,7 @@
 
 from collections import defaultdict
 import logging
+import warnings
 
 import ffcx.codegeneration.finite_element_template as ufc_finite_element
 import ufl
@@ -156,6 +157,135 @@ def entity_reflection(L, i, cell_shape):
     return L.LiteralBool(False)
 
 
+def entity_rotations(L, i, cell_shape):
+    """Returns the number of times a face has been rotated."""
+    assert cell_shape in ["tetrahedron", "hexahedron"] and i[0] == 2
+    cell_info = L.Symbol("cell_permutation")
+    return L.BitwiseAnd(L.BitShiftR(cell_info, 3 * i[1] + 1), 3)
+
+
+def dof_reflection_condition(L, entities, cell_shape, entity_reflection=entity_reflection):
+    """Returns the condition stating when a dof depending on the given entities is reflected.
+
+    The reflections of the entities are given by entity_reflection,
+    which defaults to the cell_permutation argument of the element
+    functions. Integral kernels pass the symbols of their backend."""
+    c_false = L.LiteralBool(False)
+
+    # Loop through entities that the direction of the dof depends on to
+    # make a conditional
+    ref = c_false
+    for j in entities:
+        new_ref = entity_reflection(L, j, cell_shape)
+        if ref == c_false:
+            # No condition has been added yet, so overwrite false
+            ref = new_ref
+        elif ref == new_ref:
+            # A != A is false
+            ref = c_false
+        else:
+            # This is not the first condition, so XOR
+            ref = L.NE(ref, new_ref)
+    return ref
+
+
+def face_tangent_transformations(L, face_tangents, value, cell_shape, transpose, entity_reflection=entity_reflection,
+                                 entity_rotations=entity_rotations, scope=None):
+    """Generate code transforming the values of pairs of face tangent dofs in place.
+
+    The face_tangents are a list of (face, (dof0, dof1)), and value(dof)
+    is the value of a dof. The values of each pair are swapped if the
+    face is reflected, then rotated if the face is rotated. With
+    transpose, the transposed transformations are applied in reverse
+    order. The code of each pair, which declares the temporaries t0 and
+    t1, is wrapped by scope, L.Scope by default. The reflections and
+    rotations of the faces are given as in dof_reflection_condition."""
+    t0 = L.Symbol("t0")
+    t1 = L.Symbol("t1")
+    if scope is None:
+        scope = L.Scope
+
+    # Group the pairs by their face
+    faces = {}
+    for entity, dofs in face_tangents:
+        if entity[0] != 2:
+            warnings.warn("Face tangents an entity of dim != 2 not implemented.")
+            continue
+        faces.setdefault(entity, []).append(dofs)
+
+    if transpose:
+        rotated = [(-t0 + t1, -t0), (-t1, t0 - t1)]
+    else:
+        rotated = [(-t0 - t1, t0), (t1, -t0 - t1)]
+
+    code = []
+    for entity, pairs in faces.items():
+        body = [scope([L.VariableDecl("const ufc_scalar_t", t0, value(dof0)),
+                       L.Assign(value(dof0), value(dof1)),
+                       L.Assign(value(dof1), t0)]) for dof0, dof1 in pairs]
+        swap = L.If(entity_reflection(L, entity, cell_shape), body)
+        rotation = entity_rotations(L, entity, cell_shape)
+        rotate = []
+        for n, (new0, new1) in enumerate(rotated):
+            body = [scope([L.VariableDecl("const ufc_scalar_t", t0, value(dof0)),
+                           L.VariableDecl("const ufc_scalar_t", t1, value(dof1)),
+                           L.Assign(value(dof0), new0),
+                           L.Assign(value(dof1), new1)]) for dof0, dof1 in pairs]
+            rotate += [(L.ElseIf if n else L.If)(L.EQ(rotation, n + 1), body)]
+        if transpose:
+            code += rotate + [swap]
+        else:
+            code += [swap] + rotate
+    return code
+
+
+def generate_apply_dof_transformation(L, ir, transpose):
+    """Generate code applying the transformation of the dofs of an element for a cell permutation in place.
+
+    The data holds block_size consecutive values for each dof. The
+    transformation maps values for the dofs of the reference element to
+    values for the dofs of the cell (e.g. basis functions, or the rows
+    of an element tensor), the transposed transformation maps the dofs
+    of a function on the cell to the dofs of the reference element
+    (e.g. coefficients). The code is unrolled over the dofs, with one
+    branch for each reflected entity and transformed face."""
+    data = L.Symbol("data")
+    block_size = L.Symbol("block_size")
+    b = L.Symbol("b")
+    c_false = L.LiteralBool(False)
+
+    def value(dof):
+        return data[dof * block_size + b]
+
+    def block_loop(body):
+        return L.ForRange(b, 0, block_size, index_type=index_type, body=body)
+
+    # Group the reflected dofs by their condition
+    reflected_dofs = {}
+    for dof, entities in enumerate(ir.dof_reflection_entities):
+        if entities is not None:
+            condition = dof_reflection_condition(L, entities, ir.cell_shape)
+            if condition != c_false:
+                reflected_dofs.setdefault(str(condition), (condition, []))[1].append(dof)
+
+    code = []
+    for condition, dofs in reflected_dofs.values():
+        code += [L.If(condition, block_loop([L.Assign(value(dof), -value(dof)) for dof in dofs]))]
+
+    code += face_tangent_transformations(L, ir.dof_face_tangents, value, ir.cell_shape, transpose,
+                                         scope=block_loop)
+
+    return code + [L.Return(0)]
+
+
+def apply_dof_transformation(L, ir, parameters):
+    return generate_apply_dof_transformation(L, ir, transpose=False)
+
+
+def apply_dof_transformation_transpose(L, ir, parameters):
+    return generate_apply_dof_transformation(L, ir, transpose=True)
+
+
 def transform_reference_basis_derivatives(L, ir, parameters):
     data = ir.evaluate_basis
     if isinstance(data, str):
@@ -294,20 +424,7 @@ def transform_reference_basis_derivatives(L, ir, parameters):
             # Dof does not need reflecting, so put false in array
             reflect_dofs.append(c_false)
         else:
-            # Loop through entities that the direction of the dof depends on to
-            # make a conditional
-            ref = c_false
-            for j in dre:
-                new_ref = entity_reflection(L, j, ir.cell_shape)
-                if ref == c_false:
-                    # No condition has been added yet, so overwrite false
-                    ref = new_ref
-                elif ref == new_ref:
-                    # A != A is false
-                    ref = c_false
-                else:
-                    # This is not the first condition, so XOR
-                    ref = L.NE(ref, new_ref)
+            ref = dof_reflection_condition(L, dre, ir.cell_shape)
             reflect_dofs.append(ref)
             if ref != c_false:
                 # Mark this space as needing reflections
@@ -457,6 +574,12 @@ def generator(ir, parameters):
     statements = tabulate_reference_dof_coordinates(L, ir, parameters)
     d["tabulate_reference_dof_coordinates"] = L.StatementList(statements)
 
+    statements = apply_dof_transformation(L, ir, parameters)
+    d["apply_dof_transformation"] = L.StatementList(statements)
+
+    statements = apply_dof_transformation_transpose(L, ir, parameters)
+    d["apply_dof_transformation_transpose"] = L.StatementList(statements)
+
     statements = create_sub_element(L, ir)
     d["sub_element_declaration"] = sub_element_declaration(L, ir)
     d["create_sub_element"] = statements
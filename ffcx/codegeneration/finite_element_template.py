@@ -58,6 +58,18 @@ int tabulate_reference_dof_coordinates_{factory_name}(double* restrict reference
   {tabulate_reference_dof_coordinates}
 }}
 
+int apply_dof_transformation_{factory_name}(ufc_scalar_t* restrict data, int block_size,
+                                            uint32_t cell_permutation)
+{{
+  {apply_dof_transformation}
+}}
+
+int apply_dof_transformation_transpose_{factory_name}(ufc_scalar_t* restrict data, int block_size,
+                                                      uint32_t cell_permutation)
+{{
+  {apply_dof_transformation_transpose}
+}}
+
 {sub_element_declaration}
 ufc_finite_element* create_sub_element_{factory_name}(int i)
 {{
@@ -86,6 +98,8 @@ ufc_finite_element* create_{factory_name}(void)
   element->transform_reference_basis_derivatives = transform_reference_basis_derivatives_{factory_name};
   element->transform_values = transform_values_{factory_name};
   element->tabulate_reference_dof_coordinates = tabulate_reference_dof_coordinates_{factory_name};
+  element->apply_dof_transformation = apply_dof_transformation_{factory_name};
+  element->apply_dof_transformation_transpose = apply_dof_transformation_transpose_{factory_name};
   element->num_sub_elements = {num_sub_elements};
   element->create_sub_element = create_sub_element_{factory_name};
   element->create = create_{factory_name};
@@ -5,8 +5,10 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
 import collections
+import copy
 import itertools
 import logging
+import re
 import warnings
 
 import numpy
@@ -14,12 +16,25 @@ import numpy
 import ufl
 from ffcx.codegeneration import integrals_template as ufc_integrals
 from ffcx.codegeneration.backend import FFCXBackend
+from ffcx.codegeneration.C.cnodes import CNode
 from ffcx.codegeneration.C.format_lines import format_indented_lines
+from ffcx.codegeneration.C.optimization import optimize_loops
+from ffcx.codegeneration.finite_element import dof_reflection_condition, face_tangent_transformations
 from ffcx.ir.elementtables import piecewise_ttypes
+from ffcx.ir.representationutils import SignatureCache
 
 logger = logging.getLogger("ffcx")
 
 
+# Code generated for the integrals compiled by this process, keyed by
+# integral signature
+integral_code_cache = SignatureCache()
+
+# Maximum number of static variants of a table for the transformations
+# of its dofs, see IntegralGenerator.declare_table_variants
+_max_table_variants = 64
+
+
 def generator(ir, parameters):
 
     logger.info("Generating code for integral:")
@@ -27,6 +42,17 @@ def generator(ir, parameters):
     logger.info("--- name: {}".format(ir.name))
 
     """Generate code for an integral."""
+    # The signature covers the parameters, see compute_integral_signature
+    code = integral_code_cache.get(ir.signature)
+    if code is None:
+        code = _generate_integral(ir, parameters)
+        integral_code_cache.put(ir.signature, code)
+    else:
+        logger.info("--- reusing code of unchanged integral")
+    return code
+
+
+def _generate_integral(ir, parameters):
     factory_name = ir.name
     integral_type = ir.integral_type
 
@@ -44,6 +70,9 @@ def generator(ir, parameters):
 
     # Generate code ast for the tabulate_tensor body
     parts = ig.generate()
+    if parameters["optimize_loops"]:
+        parts, removed = optimize_loops(parts)
+        logger.info("--- loop optimization removed {} multiplications".format(removed))
 
     # Format code as string
     body = format_indented_lines(parts.cs_format(ir.precision), 1)
@@ -79,6 +108,27 @@ def generator(ir, parameters):
     tabulate_tensor_fn = tabulate_tensor_declaration.format(
         factory_name=factory_name, tabulate_tensor=code["tabulate_tensor"])
 
+    # Format batch kernel, repeating the body for each cell of the batch
+    batch_size = parameters["batch_size"]
+    if batch_size > 0 and integral_type != "custom":
+        if ig.vector_width:
+            # Vector accesses are not strided by the batch, generate
+            # the body again with scalar loops
+            ig = IntegralGenerator(ir, FFCXBackend(ir, parameters), vector_width=0)
+            parts = ig.generate()
+            if parameters["optimize_loops"]:
+                parts, _ = optimize_loops(parts)
+        batch_parts = ig.generate_batch(parts, batch_size)
+        batch_body = format_indented_lines(batch_parts.cs_format(ir.precision), 1)
+        if parameters["tabulate_tensor_void"]:
+            batch_body = ""
+        tabulate_tensor_fn += ufc_integrals.tabulate_batch_implementation[integral_type].format(
+            factory_name=factory_name, tabulate_tensor=batch_body)
+        tabulate_tensor_batch = "tabulate_tensor_batch_{}".format(factory_name)
+    else:
+        batch_size = 0
+        tabulate_tensor_batch = "NULL"
+
     # Format implementation code
 
     if integral_type == "custom":
@@ -90,16 +140,58 @@ def generator(ir, parameters):
         implementation = ufc_integrals.factory.format(
             factory_name=factory_name,
             enabled_coefficients=code["enabled_coefficients"],
-            tabulate_tensor=tabulate_tensor_fn)
+            tabulate_tensor=tabulate_tensor_fn,
+            batch_size=batch_size,
+            tabulate_tensor_batch=tabulate_tensor_batch,
+            upper_triangle="true" if ir.symmetric and parameters["symmetric_tensor"] == "upper" else "false")
 
     return declaration, implementation
 
 
+def _map_cnode(node, replace, cache):
+    """Apply replace to each node of a tree of CNodes, in place.
+
+    The children of nodes which are not replaced, i.e. for which
+    replace returns None, are visited. Shared nodes are visited once.
+    """
+    if id(node) in cache:
+        return cache[id(node)]
+    new = replace(node)
+    if new is None:
+        new = node
+        for cls in type(node).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                value = getattr(node, name, None)
+                if value is not None:
+                    setattr(node, name, _map_cnode_value(value, replace, cache))
+    cache[id(node)] = new
+    return new
+
+
+def _map_cnode_value(value, replace, cache):
+    if isinstance(value, (list, tuple)):
+        return type(value)(_map_cnode_value(v, replace, cache) for v in value)
+    elif isinstance(value, numpy.ndarray) and value.dtype == object:
+        return numpy.vectorize(lambda v: _map_cnode_value(v, replace, cache), otypes=[object])(value)
+    elif isinstance(value, CNode):
+        return _map_cnode(value, replace, cache)
+    return value
+
+
 class IntegralGenerator(object):
-    def __init__(self, ir, backend):
+    def __init__(self, ir, backend, vector_width=None):
         # Store ir
         self.ir = ir
 
+        # Number of scalars in the vectors of the innermost loops over
+        # dofs, which load element tables of doubles as scalars
+        if vector_width is None:
+            vector_width = ir.params["vector_width"]
+        if ir.params["scalar_type"] != "double":
+            vector_width = 0
+        self.vector_width = vector_width
+        self.vector_loops = False
+
         # Backend specific plugin with attributes
         # - language: for translating ufl operators to target language
         # - symbols: for translating ufl operators to target language
@@ -120,6 +212,52 @@ class IntegralGenerator(object):
         # Set of counters used for assigning names to intermediate variables
         self.symbol_counters = collections.defaultdict(int)
 
+        # Code evaluating sum factorized coefficients before each
+        # quadrature loop
+        self.sum_factorized_coefficients = {}
+
+        # Names of tables accessed directly, through their one
+        # dimensional factors, and through stacked coefficient tables
+        self.direct_tables = set()
+        self.sum_factorized_tables = set()
+        self.stacked_tables = set()
+
+        # Coefficients may be evaluated by a matrix-vector product with
+        # their stacked tables, by name, before the quadrature loops
+        mode = ir.params["coefficient_evaluation"]
+        if mode not in ("pointwise", "matvec"):
+            raise RuntimeError("Unknown coefficient evaluation mode: {}".format(mode))
+        self.coefficient_matvec = mode == "matvec"
+        self.stacked_coefficient_tables = {}
+
+        # Quadrature rules with weights used in the generated code
+        self.weights_used = set()
+
+        # Strategy for the dof transformations of the tables, the
+        # arguments and coefficients in
+        # ir.argument_dof_transformations and
+        # ir.coefficient_dof_transformations are transformed outside of
+        # the quadrature loops
+        strategy = ir.params["dof_transformations"]
+        if strategy not in ("conditional", "tables", "post"):
+            raise RuntimeError("Unknown dof transformations strategy: {}".format(strategy))
+        self.table_variants = strategy == "tables"
+        self.backend.symbols.transformed_coefficients = set(ir.coefficient_dof_transformations)
+
+        # Only the upper triangle of symmetric element tensors is
+        # accumulated, in a local tensor if it is mirrored or transformed
+        # after the quadrature loops
+        mode = ir.params["symmetric_tensor"]
+        if mode not in ("none", "mirror", "upper"):
+            raise RuntimeError("Unknown symmetric tensor mode: {}".format(mode))
+        self.mirror = ir.symmetric and (mode == "mirror" or bool(ir.argument_dof_transformations))
+
+    def element_tensor(self):
+        """Symbol of the tensor the blocks are accumulated into."""
+        if self.ir.argument_dof_transformations or self.mirror:
+            return self.backend.symbols.reference_element_tensor()
+        return self.backend.symbols.element_tensor()
+
     def init_scopes(self):
         """Initialize variable scope dicts."""
         # Reset variables, separate sets for each quadrature rule
@@ -197,12 +335,6 @@ class IntegralGenerator(object):
                           "coordinate_dofs = (const double*)__builtin_assume_aligned(coordinate_dofs, {});"
                           .format(alignment))]
 
-        # Generate the tables of quadrature points and weights
-        parts += self.generate_quadrature_tables()
-
-        # Generate the tables of basis function values and preintegrated blocks
-        parts += self.generate_element_tables()
-
         # Loop generation code will produce parts to go before quadloops,
         # to define the quadloops, and to go after the quadloops
         all_preparts = []
@@ -217,12 +349,196 @@ class IntegralGenerator(object):
             all_preparts += preparts
             all_quadparts += quadparts
 
+        # Generate the tables of quadrature points and weights
+        parts += self.generate_quadrature_tables()
+
+        # Generate the tables of basis function values and preintegrated
+        # blocks, after the loops which determine the tables used
+        parts += self.generate_element_tables()
+
+        # Type of the vectors of the innermost loops over dofs, aligned
+        # as scalars to allow access at any dof
+        if self.vector_loops:
+            parts.insert(0, L.VerbatimStatement(
+                "typedef ufc_scalar_t ufc_vec_t __attribute__((vector_size({} * sizeof(ufc_scalar_t)), "
+                "aligned(sizeof(ufc_scalar_t)), may_alias));".format(self.vector_width)))
+
+        # Accumulate the blocks of the arguments with transformed dofs,
+        # or the upper triangle of a symmetric tensor, in a local
+        # element tensor
+        if self.ir.argument_dof_transformations or self.mirror:
+            size = int(numpy.prod(self.ir.tensor_shape))
+            parts += [L.ArrayDecl("ufc_scalar_t", self.backend.symbols.reference_element_tensor(), (size, ),
+                                  values=0, alignas=self.ir.params["alignas"])]
+
         # Collect parts before, during, and after quadrature loops
+        parts += self.generate_coefficient_dof_transformations()
         parts += all_preparts
         parts += all_quadparts
+        if self.mirror:
+            parts += self.generate_element_tensor_mirror()
+        if self.ir.argument_dof_transformations:
+            parts += self.generate_element_tensor_dof_transformations()
 
         return L.StatementList(parts)
 
+    def generate_batch(self, parts, batch_size):
+        """Generate the body of the batch kernel from the body of the kernel for a single cell.
+
+        The body is repeated in a loop over the cells of the batch, with
+        the values of each cell accessed in structure-of-arrays layout.
+        """
+        L = self.backend.language
+        ib = self.backend.symbols.batch_index()
+
+        # Arguments with values for each cell
+        arrays = ("A", "w", "coordinate_dofs", "quadrature_permutation")
+
+        def replace(node):
+            if isinstance(node, L.ArrayAccess) and isinstance(node.array, L.Symbol) and node.array.name in arrays:
+                index, = node.indices
+                index = _map_cnode(index, replace, cache)
+                return node.array[index * batch_size + ib]
+            elif isinstance(node, L.Symbol):
+                if node.name == "cell_permutation":
+                    return node[ib]
+                # Entity symbols are formatted with their index, see
+                # FFCXBackendSymbols.entity
+                match = re.match(r"^(facet|vertex)\[(\d)\]$", node.name)
+                if match:
+                    return L.Symbol(match.group(1))[int(match.group(2)) * batch_size + ib]
+            return None
+
+        # Static tables at the beginning of the body are shared by all
+        # cells
+        statements = list(parts.statements)
+        n = 0
+        for i, statement in enumerate(statements):
+            if isinstance(statement, L.VerbatimStatement) or (
+                    isinstance(statement, L.ArrayDecl) and statement.typename.startswith("static")):
+                n = i + 1
+            elif not isinstance(statement, L.Comment):
+                break
+
+        cache = {}
+        body = _map_cnode(copy.deepcopy(L.StatementList(statements[n:])), replace, cache)
+        return L.StatementList(statements[:n] + [L.ForRange(ib, 0, batch_size, body=body)])
+
+    def declare_dof_signs(self, symbol, reflections):
+        """Declare the signs of the dofs of an element for the reflections of the entities of the cell.
+
+        Returns an empty list if no dofs are reflected."""
+        L = self.backend.language
+        c_false = L.LiteralBool(False)
+        conditions = [c_false if entities is None else self.get_dof_reflection_condition(entities)
+                      for entities in reflections]
+        if all(condition == c_false for condition in conditions):
+            return []
+        values = numpy.array([1.0 if condition == c_false else L.Conditional(condition, -1.0, 1.0)
+                              for condition in conditions], dtype=L.CExpr)
+        return [L.ArrayDecl("const double", symbol, values.shape, values)]
+
+    def generate_face_tangent_transformations(self, values, rotations, transpose):
+        """Generate code transforming the values of the face tangent dofs of an element in place.
+
+        The values of the pairs of dofs are swapped if their face is
+        reflected, then rotated if their face is rotated, as in
+        declare_table. With transpose, the transposed transformations
+        are applied in reverse order."""
+        symbols = self.backend.symbols
+        return face_tangent_transformations(self.backend.language, rotations, values, self.ir.cell_shape, transpose,
+                                            symbols.entity_reflection, symbols.entity_rotations)
+
+    def generate_coefficient_dof_transformations(self):
+        """Generate arrays of the dofs of the coefficients with transformed dofs.
+
+        The dofs are transformed such that the coefficients are
+        evaluated with the tables of the untransformed dofs."""
+        L = self.backend.language
+        ic = self.backend.symbols.coefficient_dof_sum_index()
+        w = L.Symbol("w")
+
+        parts = []
+        transformations = self.ir.coefficient_dof_transformations
+        for coefficient in sorted(transformations, key=lambda c: self.ir.coefficient_numbering[c]):
+            reflections, rotations = transformations[coefficient]
+            dofs = self.backend.symbols.reference_coefficient_dofs(coefficient)
+            signs = L.Symbol("{}_signs".format(dofs.name))
+            signs_decl = self.declare_dof_signs(signs, reflections)
+
+            value = w[self.ir.coefficient_offsets[coefficient] + ic]
+            if signs_decl:
+                value = signs[ic] * value
+            parts += signs_decl
+            parts += [L.ArrayDecl("ufc_scalar_t", dofs, (len(reflections), )),
+                      L.ForRange(ic, 0, len(reflections), body=[L.Assign(dofs[ic], value)])]
+            parts += self.generate_face_tangent_transformations(lambda dof: dofs[dof], rotations, transpose=True)
+
+        return L.commented_code_list(parts, "Transformed dofs of coefficients")
+
+    def generate_element_tensor_dof_transformations(self):
+        """Generate code adding the transformed element tensor of the untransformed dofs to the element tensor."""
+        L = self.backend.language
+        shape = self.ir.tensor_shape
+        A = L.FlattenedArray(self.backend.symbols.element_tensor(), dims=shape)
+        A_ref = L.FlattenedArray(self.backend.symbols.reference_element_tensor(), dims=shape)
+        indices = [self.backend.symbols.argument_loop_index(i) for i in range(len(shape))]
+
+        parts = []
+        factors = []
+        signs = {}
+        for i, (reflections, rotations) in sorted(self.ir.argument_dof_transformations.items()):
+            # Arguments with the same element share the signs
+            key = str(reflections)
+            if key not in signs:
+                symbol = L.Symbol("signs{}".format(i))
+                signs_decl = self.declare_dof_signs(symbol, reflections)
+                parts += signs_decl
+                signs[key] = symbol if signs_decl else None
+            if signs[key] is not None:
+                factors.append(signs[key][indices[i]])
+
+            # Transform the face tangent dofs along the axis of the
+            # argument
+            body = self.generate_face_tangent_transformations(
+                lambda dof: A_ref[indices[:i] + [dof] + indices[i + 1:]], rotations, transpose=False)
+            if body:
+                for k in reversed(range(len(shape))):
+                    if k != i:
+                        body = [L.ForRange(indices[k], 0, shape[k], body=body)]
+                parts += body
+
+        # Face tangent dofs are not reflected, so the signs can be
+        # applied last
+        body = L.AssignAdd(A[indices], L.float_product(factors + [A_ref[indices]]))
+        for k in reversed(range(len(shape))):
+            body = L.ForRange(indices[k], 0, shape[k], body=body)
+        parts += [body]
+
+        return L.commented_code_list(parts, "Transform the element tensor of the untransformed dofs")
+
+    def generate_element_tensor_mirror(self):
+        """Generate code completing the upper triangle of a symmetric element tensor below the diagonal.
+
+        The local tensor is mirrored in place if its dofs are
+        transformed afterwards, and otherwise added to the element
+        tensor with its mirror.
+        """
+        L = self.backend.language
+        shape = self.ir.tensor_shape
+        A = L.FlattenedArray(self.backend.symbols.element_tensor(), dims=shape)
+        A_ref = L.FlattenedArray(self.backend.symbols.reference_element_tensor(), dims=shape)
+        i, j = (self.backend.symbols.argument_loop_index(k) for k in range(2))
+
+        if self.ir.argument_dof_transformations:
+            body = L.ForRange(j, i + 1, shape[1], body=L.Assign(A_ref[j, i], A_ref[i, j]))
+        else:
+            body = [L.ForRange(j, i, shape[1], body=L.AssignAdd(A[i, j], A_ref[i, j])),
+                    L.ForRange(j, i + 1, shape[1], body=L.AssignAdd(A[j, i], A_ref[i, j]))]
+        body = L.ForRange(i, 0, shape[0], body=body)
+
+        return L.commented_code_list(body, "Mirror the upper triangle of the symmetric element tensor")
+
     def generate_quadrature_tables(self):
         """Generate static tables of quadrature points and weights."""
         L = self.backend.language
@@ -240,6 +556,9 @@ class IntegralGenerator(object):
 
         # Loop over quadrature rules
         for quadrature_rule, integrand in self.ir.integrand.items():
+            if quadrature_rule not in self.weights_used:
+                # All blocks are preintegrated
+                continue
 
             num_points = quadrature_rule.weights.shape[0]
             # Generate quadrature weights array
@@ -269,13 +588,38 @@ class IntegralGenerator(object):
             # Define only piecewise tables
             table_names = [name for name in sorted(tables) if table_types[name] in piecewise_ttypes]
         else:
-            # Define all tables
-            table_names = sorted(tables)
+            # Define all tables, except those only accessed through
+            # their one dimensional factors or stacked tables
+            indirect_tables = self.sum_factorized_tables | self.stacked_tables
+            table_names = [name for name in sorted(tables)
+                           if name not in indirect_tables or name in self.direct_tables]
 
         for name in table_names:
             table = tables[name]
             parts += self.declare_table(name, table, alignas, padlen)
 
+        # Preintegrated blocks, except those skipped below the diagonal
+        # of symmetric element tensors
+        for integrand in self.ir.integrand.values():
+            for name, table in sorted(integrand["preintegrated_tables"].items()):
+                if name not in self.direct_tables:
+                    continue
+                parts += [L.ArrayDecl("static const double", name, table.shape, table,
+                                      alignas=alignas, padlen=padlen)]
+
+        # One dimensional tables of sum factorized tables
+        declared = set()
+        for integrand in self.ir.integrand.values():
+            for name, factors in sorted(integrand["tensor_factors"].items()):
+                if name in self.sum_factorized_tables and name not in declared:
+                    declared.add(name)
+                    parts += self.declare_tensor_factors(name, factors, alignas, padlen)
+
+        # Stacked tables of coefficients
+        for name, table in sorted(self.stacked_coefficient_tables.items()):
+            parts += [L.ArrayDecl("static const double", name, table.shape, table,
+                                  alignas=alignas, padlen=padlen)]
+
         # Add leading comment if there are any tables
         parts = L.commented_code_list(parts, [
             "Precomputed values of basis functions and precomputations",
@@ -283,6 +627,25 @@ class IntegralGenerator(object):
         ])
         return parts
 
+    def declare_tensor_factors(self, name, factors, alignas, padlen):
+        """Declare the one dimensional tables, scales and dofs of a sum factorized table."""
+        L = self.backend.language
+        parts = []
+        for k, table in enumerate(factors.tables):
+            parts += [L.ArrayDecl("static const double", "{}_F{}".format(name, k), table.shape, table,
+                                  alignas=alignas, padlen=padlen)]
+        # The dofs are relative to the first dof of the table, which
+        # differs between the components of vector elements sharing it
+        dofs = factors.columns
+        parts += [L.ArrayDecl("static const double", "{}_S".format(name), factors.scales.shape, factors.scales),
+                  L.ArrayDecl("static const int", "{}_D".format(name), dofs.shape, dofs)]
+        return parts
+
+    def get_dof_reflection_condition(self, entities):
+        """Gets the condition stating when a dof depending on the given entities is reflected."""
+        return dof_reflection_condition(self.backend.language, entities, self.ir.cell_shape,
+                                        self.backend.symbols.entity_reflection)
+
     def get_entity_reflection_conditions(self, table, name):
         """Gets an array of conditions stating when each dof is reflected."""
         L = self.backend.language
@@ -295,21 +658,96 @@ class IntegralGenerator(object):
         for dof, entities in enumerate(ref):
             if entities is None or dof not in dofmap:
                 continue
+            condition = self.get_dof_reflection_condition(entities)
             for indices in itertools.product(*[range(n) for n in table.shape[:-1]]):
-                indices += (dofmap.index(dof), )
-                for entity in entities:
-                    entity_ref = self.backend.symbols.entity_reflection(L, entity, self.ir.cell_shape)
-                    if conditions[indices] == c_false:
-                        # No condition has been added yet, so overwrite false
-                        conditions[indices] = entity_ref
-                    elif conditions[indices] == entity_ref:
-                        # A != A is always false
-                        conditions[indices] = c_false
-                    else:
-                        # This is not the first condition, so XOR
-                        conditions[indices] = L.NE(entity_ref, conditions[indices])
+                conditions[indices + (dofmap.index(dof), )] = condition
         return conditions
 
+    def get_transformed_table(self, name, table, reflected, rotations):
+        """Apply the transformations of the dofs of a table for given entity reflections and rotations.
+
+        Reflected maps entities to whether they are reflected, rotations
+        maps faces to their number of rotations. The values are
+        transformed like the table built by declare_table."""
+        ref = self.ir.table_dof_reflection_entities[name]
+        rot = self.ir.table_dof_face_tangents[name]
+        dofmap = self.ir.table_dofmaps[name]
+
+        table = numpy.array(table)
+        for dof, entities in enumerate(ref):
+            if entities is not None and dof in dofmap and sum(reflected[e] for e in entities) % 2 == 1:
+                table[..., dofmap.index(dof)] *= -1
+        for entity, dofs in rot:
+            if entity in rotations:
+                di0 = dofmap.index(dofs[0])
+                di1 = dofmap.index(dofs[1])
+                t0 = table[..., di0].copy()
+                t1 = table[..., di1].copy()
+                if reflected[entity]:
+                    t0, t1 = t1, t0
+                if rotations[entity] == 1:
+                    t0, t1 = -t0 - t1, t0
+                elif rotations[entity] == 2:
+                    t0, t1 = t1, -t0 - t1
+                table[..., di0] = t0
+                table[..., di1] = t1
+        return table
+
+    def declare_table_variants(self, name, table, alignas, padlen):
+        """Declare static variants of a table for each transformation of its dofs.
+
+        The variant for the cell permutation is selected at runtime
+        through a pointer with the name of the table. Returns None if
+        the table has more than _max_table_variants variants."""
+        L = self.backend.language
+
+        rot = self.ir.table_dof_face_tangents[name]
+        ref = self.ir.table_dof_reflection_entities[name]
+        dofmap = self.ir.table_dofmaps[name]
+
+        # Faces with rotated tangent dofs in the table, see declare_table
+        rotated = [entity for entity, dofs in rot
+                   if entity[0] == 2 and all(dof in dofmap for dof in dofs)]
+        entities = set(rotated)
+        for dof, dof_entities in enumerate(ref):
+            if dof_entities is not None and dof in dofmap:
+                entities.update(dof_entities)
+        entities = sorted(entities)
+
+        # Each reflected entity selects one of 2 variants, each rotated
+        # face one of 6 (reflected or not, times 3 rotations)
+        sizes = [6 if entity in rotated else 2 for entity in entities]
+        num_variants = int(numpy.prod(sizes))
+        if num_variants > _max_table_variants:
+            return None
+
+        variants = []
+        for state in itertools.product(*[range(n) for n in sizes]):
+            reflected = {entity: s % 2 == 1 for entity, s in zip(entities, state)}
+            rotations = {entity: s // 2 for entity, s in zip(entities, state) if entity in rotated}
+            variants.append(self.get_transformed_table(name, table, reflected, rotations))
+        variants = numpy.array(variants)
+
+        # Index of the variant, the state of the last entity varies
+        # fastest
+        terms = []
+        stride = 1
+        for entity, size in reversed(list(zip(entities, sizes))):
+            field = self.backend.symbols.entity_reflection(L, entity, self.ir.cell_shape)
+            if entity in rotated:
+                rotations = self.backend.symbols.entity_rotations(L, entity, self.ir.cell_shape)
+                field = L.Sum([field, 2 * rotations])
+            terms.append(field if stride == 1 else stride * field)
+            stride *= size
+        variant = L.Symbol("{}_variant".format(name))
+        dims = L.pad_innermost_dim(table.shape, padlen)[1:]
+
+        return [L.ArrayDecl("static const double", "{}_variants".format(name), variants.shape, variants,
+                            alignas=alignas, padlen=padlen),
+                L.VariableDecl("const int", variant, L.Sum(terms[::-1])),
+                L.VerbatimStatement("const double (*{0})[{1}] = {0}_variants[{2}];".format(
+                    name, "][".join(str(n) for n in dims), variant))]
+
     def declare_table(self, name, table, alignas, padlen):
         """Declare a table.
         If the dof dimensions of the table have dof rotations, apply these rotations."""
@@ -326,6 +764,13 @@ class IntegralGenerator(object):
             return [L.ArrayDecl(
                 "static const double", name, table.shape, table, alignas=alignas, padlen=padlen)]
 
+        # Select one of the static tables of all transformations at
+        # runtime, if there are not too many
+        if self.table_variants:
+            parts = self.declare_table_variants(name, table, alignas, padlen)
+            if parts is not None:
+                return parts
+
         dofmap = self.ir.table_dofmaps[name]
         index_names = ["ind_" + str(i) if j > 1 else 0 for i, j in enumerate(table.shape[:-1])]
 
@@ -423,6 +868,10 @@ class IntegralGenerator(object):
         """Generate quadrature loop with for this num_points."""
         L = self.backend.language
 
+        # Evaluate coefficients in all points before the loop, before
+        # the varying partition refers to their values
+        stackedparts = self.generate_stacked_coefficients(quadrature_rule)
+
         # Generate varying partition
         body = self.generate_varying_partition(quadrature_rule)
         body = L.commented_code_list(
@@ -430,10 +879,14 @@ class IntegralGenerator(object):
 
         # Generate dofblock parts, some of this
         # will be placed before or after quadloop
-        preparts, quadparts = \
+        preparts, quadparts, postparts = \
             self.generate_dofblock_partition(quadrature_rule)
         body += quadparts
 
+        # Stacked and sum factorized coefficients are evaluated before
+        # the loop
+        preparts = stackedparts + self.sum_factorized_coefficients.pop(quadrature_rule, []) + preparts
+
         # Wrap body in loop or scope
         if not body:
             # Could happen for integral with everything zero and optimized away
@@ -443,6 +896,9 @@ class IntegralGenerator(object):
             iq = self.backend.symbols.quadrature_loop_index()
             quadparts = [L.ForRange(iq, 0, num_points, body=body)]
 
+        # Contractions of sum factorized blocks follow the loop
+        quadparts += postparts
+
         return preparts, quadparts
 
     def generate_runtime_quadrature_loop(self):
@@ -470,7 +926,7 @@ class IntegralGenerator(object):
 
         # Generate dofblock parts, some of this
         # will be placed before or after quadloop
-        preparts, quadparts = \
+        preparts, quadparts, postparts = \
             self.generate_dofblock_partition(num_points)
         body += quadparts
 
@@ -584,11 +1040,9 @@ class IntegralGenerator(object):
         definitions = []
         intermediates = []
 
-        for i, attr in F.nodes.items():
-            if attr['status'] != mode:
-                continue
-            v = attr['expression']
-            mt = attr.get('mt')
+        for i in F.nodes_with_status(mode):
+            v = F.expressions[i]
+            mt = F.mts.get(i)
 
             # Generate code only if the expression is not already in cache
             if not self.get_var(quadrature_rule, v):
@@ -597,23 +1051,32 @@ class IntegralGenerator(object):
                 elif mt is not None:
                     # All finite element based terminals have table data, as well
                     # as some, but not all, of the symbolic geometric terminals
-                    tabledata = attr.get('tr')
+                    tabledata = F.table_reference(i)
 
-                    # Backend specific modified terminal translation
-                    vaccess = self.backend.access.get(mt.terminal, mt, tabledata, quadrature_rule)
-                    vdef = self.backend.definitions.get(mt.terminal, mt, tabledata, quadrature_rule, vaccess)
-
-                    # Store definitions of terminals in list
-                    assert isinstance(vdef, list)
-                    definitions.extend(vdef)
+                    factors = self.get_coefficient_tensor_factors(quadrature_rule, mt, tabledata, mode)
+                    if factors is not None:
+                        values = self.generate_sum_factorized_coefficient(quadrature_rule, mt, tabledata,
+                                                                          factors)
+                        vaccess = values[self.backend.symbols.quadrature_loop_index()]
+                    else:
+                        # Backend specific modified terminal translation
+                        vaccess = self.backend.access.get(mt.terminal, mt, tabledata, quadrature_rule)
+                        vdef = self.backend.definitions.get(mt.terminal, mt, tabledata, quadrature_rule, vaccess)
+                        if tabledata is not None:
+                            self.direct_tables.add(tabledata.name)
+
+                        # Store definitions of terminals in list
+                        assert isinstance(vdef, list)
+                        definitions.extend(vdef)
                 else:
                     # Get previously visited operands
                     vops = [self.get_var(quadrature_rule, op) for op in v.ufl_operands]
 
                     # get parent operand
-                    pid = F.in_edges[i][0] if F.in_edges[i] else -1
+                    parents = F.in_edges(i)
+                    pid = parents[0] if len(parents) else -1
                     if pid and pid > i:
-                        parent_exp = F.nodes.get(pid)['expression']
+                        parent_exp = F.expressions[pid]
                     else:
                         parent_exp = None
 
@@ -663,11 +1126,114 @@ class IntegralGenerator(object):
             parts += intermediates
         return parts
 
+    def get_coefficient_tensor_factors(self, quadrature_rule, mt, tabledata, mode):
+        """Return the factorization of the table of a coefficient, or None if it is not sum factorized."""
+        if mode != "varying" or tabledata is None or mt.restriction is not None or mt.averaged:
+            return None
+        if not isinstance(mt.terminal, ufl.classes.Coefficient):
+            return None
+        return self.ir.integrand[quadrature_rule]["tensor_factors"].get(tabledata.name)
+
+    def is_stacked_coefficient(self, quadrature_rule, mt, tabledata):
+        """Check if a coefficient is evaluated in all points by a product with a stacked table."""
+        if tabledata is None or tabledata.is_piecewise or tabledata.is_permuted:
+            return False
+        if not isinstance(mt.terminal, ufl.classes.Coefficient) or mt.restriction is not None or mt.averaged:
+            return False
+        if self.get_coefficient_tensor_factors(quadrature_rule, mt, tabledata, "varying") is not None:
+            return False
+        # Tables with dof transformations depend on the cell
+        name = tabledata.name
+        return (self.ir.unique_tables[name].shape[0] == 1 and not self.ir.table_dof_face_tangents[name]
+                and all(e is None for e in self.ir.table_dof_reflection_entities[name]))
+
+    def generate_stacked_coefficients(self, quadrature_rule):
+        """Generate evaluation of coefficients in all points, before the quadrature loop.
+
+        The tables of the modified terminals of each coefficient sharing
+        dofs are stacked into one matrix, of dimensions
+        [entities][dofs][points * values], which is multiplied by the
+        dofs. The values of a point are contiguous in the result.
+        Coefficients (or components) sharing a stacked table are
+        evaluated by a single matrix-matrix product.
+        """
+        L = self.backend.language
+        if not self.coefficient_matvec:
+            return []
+
+        F = self.ir.integrand[quadrature_rule]["factorization"]
+        num_points = quadrature_rule.weights.shape[0]
+        iq = self.backend.symbols.quadrature_loop_index()
+        ic = self.backend.symbols.coefficient_dof_sum_index()
+        iv = L.Symbol("iv")
+        alignas = self.ir.params["alignas"]
+
+        # Modified terminals of each coefficient
+        terminals = collections.defaultdict(list)
+        for i in F.nodes_with_status("varying"):
+            mt = F.mts.get(i)
+            if mt is not None and self.is_stacked_coefficient(quadrature_rule, mt, F.table_reference(i)):
+                terminals[mt.terminal].append((F.expressions[i], F.table_reference(i)))
+
+        # Dofs multiplied by each stacked table
+        products = collections.OrderedDict()
+        for coefficient in sorted(terminals, key=lambda c: self.ir.coefficient_numbering[c]):
+            # Stack the modified terminals with overlapping dof ranges,
+            # e.g. the derivatives of a component of a vector element
+            stacks = []
+            for v, tabledata in sorted(terminals[coefficient], key=lambda vt: vt[1].dofrange):
+                begin, end = tabledata.dofrange
+                if stacks and begin < stacks[-1][1]:
+                    stacks[-1][1] = max(stacks[-1][1], end)
+                    stacks[-1][2].append((v, tabledata))
+                else:
+                    stacks.append([begin, end, [(v, tabledata)]])
+
+            for begin, end, values in stacks:
+                # The components of vector elements share their tables,
+                # and thereby the stacked table
+                key = (end - begin, ) + tuple((tabledata.name, tuple(numpy.asarray(tabledata.dofmap) - begin))
+                                              for v, tabledata in values)
+                FS, defined = self.get_temp_symbol("FS", key)
+                if not defined:
+                    tables = [self.ir.unique_tables[tabledata.name] for v, tabledata in values]
+                    num_entities = max(table.shape[1] for table in tables)
+                    stacked = numpy.zeros((num_entities, end - begin, num_points * len(values)))
+                    for k, ((v, tabledata), table) in enumerate(zip(values, tables)):
+                        for j, dof in enumerate(tabledata.dofmap):
+                            stacked[:, dof - begin, k::len(values)] = table[0, :, :, j]
+                    self.stacked_coefficient_tables[FS.name] = stacked
+                self.stacked_tables.update(tabledata.name for v, tabledata in values)
+
+                ws = self.new_temp_symbol("ws")
+                products.setdefault(FS.name, []).append((coefficient, begin, ws))
+                for k, (v, tabledata) in enumerate(values):
+                    self.set_var(quadrature_rule, v, ws[iq * len(values) + k])
+
+        parts = []
+        for name, dofs in products.items():
+            num_entities, num_dofs, num_values = self.stacked_coefficient_tables[name].shape
+            if num_entities > 1:
+                entity = self.backend.symbols.entity(self.ir.entitytype, None)
+            else:
+                entity = 0
+            FS = self.backend.symbols.named_table(name)
+
+            body = []
+            for coefficient, begin, ws in dofs:
+                dof = self.backend.symbols.coefficient_dof_access(coefficient, ic + begin)
+                parts += [L.ArrayDecl("ufc_scalar_t", ws, num_values, values=0, alignas=alignas)]
+                body += [L.AssignAdd(ws[iv], L.float_product([dof, FS[entity][ic][iv]]))]
+            parts += [L.ForRange(ic, 0, num_dofs, body=L.ForRange(iv, 0, num_values, body=body))]
+
+        return L.commented_code_list(parts, "Evaluation of coefficients in all quadrature points")
+
     def generate_dofblock_partition(self, quadrature_rule):
         block_contributions = self.ir.integrand[quadrature_rule]["block_contributions"]
 
         preparts = []
         quadparts = []
+        postparts = []
         blocks = [(blockmap, blockdata)
                   for blockmap, contributions in sorted(block_contributions.items())
                   for blockdata in contributions]
@@ -675,7 +1241,7 @@ class IntegralGenerator(object):
         for blockmap, blockdata in blocks:
 
             # Define code for block depending on mode
-            block_preparts, block_quadparts = \
+            block_preparts, block_quadparts, block_postparts = \
                 self.generate_block_parts(quadrature_rule, blockmap, blockdata)
 
             # Add definitions
@@ -684,7 +1250,10 @@ class IntegralGenerator(object):
             # Add computations
             quadparts.extend(block_quadparts)
 
-        return preparts, quadparts
+            # Add computations after the quadrature loop
+            postparts.extend(block_postparts)
+
+        return preparts, quadparts, postparts
 
     def get_entities(self, blockdata):
         L = self.backend.language
@@ -740,6 +1309,7 @@ class IntegralGenerator(object):
             #       now because it assumes too much about indices.
 
             table = self.backend.symbols.element_table(td, self.ir.entitytype, mt.restriction)
+            self.direct_tables.add(td.name)
 
             assert td.ttype != "zeros"
 
@@ -764,6 +1334,7 @@ class IntegralGenerator(object):
         # The parts to return
         preparts = []
         quadparts = []
+        postparts = []
 
         block_rank = len(blockmap)
         blockdims = tuple(len(dofmap) for dofmap in blockmap)
@@ -772,6 +1343,11 @@ class IntegralGenerator(object):
         if "zeros" in ttypes:
             raise RuntimeError("Not expecting zero arguments to be left in dofblock generation.")
 
+        # Blocks below the diagonal of a symmetric element tensor are
+        # accumulated by their transposed blocks
+        if self.ir.symmetric and not self.get_symmetric_block_rows(blockmap):
+            return preparts, quadparts, postparts
+
         iq = self.backend.symbols.quadrature_loop_index()
 
         # Override dof index with quadrature loop index for arguments with
@@ -791,10 +1367,28 @@ class IntegralGenerator(object):
         # We have scalar integrand here, take just the factor index
         factor_index = blockdata.factor_indices_comp_indices[0][0]
 
-        v = F.nodes[factor_index]['expression']
+        v = F.expressions[factor_index]
         f = self.get_var(quadrature_rule, v)
 
+        A_shape = self.ir.tensor_shape
+        A = L.FlattenedArray(self.element_tensor(), dims=A_shape)
+        A_indices = [arg_indices[i] + blockmap[i][0] for i in range(block_rank)]
+
+        if blockdata.name is not None:
+            # Scale the preintegrated block by the piecewise factor
+            # after the quadrature loop
+            P = self.backend.symbols.named_table(blockdata.name)
+            self.direct_tables.add(blockdata.name)
+            if self.ir.integrand[quadrature_rule]["preintegrated_tables"][blockdata.name].shape[0] > 1:
+                entity = self.backend.symbols.entity(self.ir.entitytype, None)
+            else:
+                entity = 0
+            body = L.AssignAdd(A[A_indices], L.float_product([f, P[entity][arg_indices]]))
+            postparts += self.generate_block_loops(body, arg_indices, blockmap)
+            return preparts, quadparts, postparts
+
         # Quadrature weight was removed in representation, add it back now
+        self.weights_used.add(quadrature_rule)
         if self.ir.integral_type in ufl.custom_integral_types:
             weights = self.backend.symbols.custom_weights_table()
             weight = weights[iq]
@@ -805,10 +1399,24 @@ class IntegralGenerator(object):
         # Define fw = f * weight
         assert not blockdata.transposed, "Not handled yet"
 
+        fw_rhs = L.float_product([f, weight])
+
+        factors = self.get_block_tensor_factors(quadrature_rule, blockdata)
+        if factors is not None:
+            # Store fw in each point, and contract with the one
+            # dimensional tables after the quadrature loop
+            key = (quadrature_rule, factor_index, blockdata.all_factors_piecewise)
+            fw, defined = self.get_temp_symbol("fws", key)
+            if not defined:
+                num_points = quadrature_rule.points.shape[0]
+                preparts.append(L.ArrayDecl("ufc_scalar_t", fw, num_points))
+                quadparts.append(L.Assign(fw[iq], fw_rhs))
+            postparts += self.generate_sum_factorized_block(quadrature_rule, blockmap, blockdata, factors, fw)
+            return preparts, quadparts, postparts
+
         # Fetch code to access modified arguments
         arg_factors = self.get_arg_factors(blockdata, block_rank, quadrature_rule, iq, B_indices)
 
-        fw_rhs = L.float_product([f, weight])
         if not isinstance(fw_rhs, L.Product):
             fw = fw_rhs
         else:
@@ -820,22 +1428,186 @@ class IntegralGenerator(object):
 
         # Naively accumulate integrand for this block in the innermost loop
         assert not blockdata.transposed
-        A_shape = self.ir.tensor_shape
+        B_rhs = L.float_product([fw] + arg_factors)
+        body = L.AssignAdd(A[A_indices], B_rhs)
+
+        W = self.vector_width
+        if W and block_rank > 0 and blockdims[-1] >= W and arg_factors[-1] != 1:
+            # Accumulate vectors of W consecutive dofs of the last
+            # argument, and the remaining dofs in scalar loop
+            self.vector_loops = True
+            n = blockdims[-1] // W
+            jv = L.Symbol(B_indices[-1].name + "v")
+            vector_indices = B_indices[:-1] + [W * jv]
+            vector_factors = self.get_arg_factors(blockdata, block_rank, quadrature_rule, iq, vector_indices)
+            vector_factors[-1] = L.Dereference(L.Cast("const ufc_vec_t*", L.AddressOf(vector_factors[-1])))
+            A_vector = L.Dereference(L.Cast("ufc_vec_t*", L.AddressOf(
+                A[A_indices[:-1] + [W * jv + blockmap[-1][0]]])))
+            vector_body = L.AssignAdd(A_vector, L.float_product([fw] + vector_factors))
+            remainder = []
+            if blockdims[-1] > W * n:
+                remainder = [L.ForRange(B_indices[-1], W * n, blockdims[-1], body=L.AssignAdd(A[A_indices], B_rhs))]
+            if self.ir.symmetric:
+                # Start at the vector containing the diagonal, the
+                # entries below the diagonal are ignored
+                for begin, end, column in self.get_symmetric_block_rows(blockmap):
+                    column = L.Div(column, W) if isinstance(column, L.CExpr) else 0
+                    body = L.StatementList([L.ForRange(jv, column, n, body=vector_body)] + remainder)
+                    quadparts += [L.ForRange(B_indices[0], begin, end, body=body)]
+                return preparts, quadparts, postparts
+            body = L.StatementList([L.ForRange(jv, 0, n, body=vector_body)] + remainder)
+            for i in reversed(range(block_rank - 1)):
+                body = L.ForRange(B_indices[i], 0, blockdims[i], body=body)
+            quadparts += [body]
+            return preparts, quadparts, postparts
+
+        quadparts += self.generate_block_loops(body, B_indices, blockmap)
+
+        return preparts, quadparts, postparts
+
+    def get_symmetric_block_rows(self, blockmap):
+        """Return the rows of a block of a symmetric element tensor with entries on or above the diagonal.
+
+        Returns a list of ranges of rows (begin, end, column), where
+        column is the first column on or above the diagonal in each row
+        of the range, as a function of the row index.
+        """
+        i = self.backend.symbols.argument_loop_index(0)
+        num_rows, num_columns = (len(dofmap) for dofmap in blockmap)
+
+        # Entry (i, j) of the block is on or above the diagonal if
+        # j >= i + offset, the first rows are full for negative offsets
+        offset = blockmap[0][0] - blockmap[1][0]
+        full = min(num_rows, max(-offset, 0))
+        end = min(num_rows, num_columns - offset)
+
+        rows = []
+        if full > 0:
+            rows.append((0, full, 0))
+        if end > full:
+            rows.append((full, end, i + offset if offset >= 0 else i - (-offset)))
+        return rows
+
+    def generate_block_loops(self, body, indices, blockmap):
+        """Generate the loops over the dofs of a block around the accumulation body.
+
+        For symmetric element tensors the loops are restricted to the
+        entries on and above the diagonal.
+        """
+        L = self.backend.language
+        blockdims = tuple(len(dofmap) for dofmap in blockmap)
+        if self.ir.symmetric:
+            return [L.ForRange(indices[0], begin, end, body=L.ForRange(indices[1], column, blockdims[1], body=body))
+                    for begin, end, column in self.get_symmetric_block_rows(blockmap)]
+
+        for i in reversed(range(len(blockmap))):
+            body = L.ForRange(indices[i], 0, blockdims[i], body=body)
+        return [body]
+
+    def get_block_tensor_factors(self, quadrature_rule, blockdata):
+        """Return the factorizations of the argument tables of a block, or None if it is not sum factorized."""
+        tensor_factors = self.ir.integrand[quadrature_rule]["tensor_factors"]
+        if not blockdata.unames or blockdata.transposed:
+            return None
+        if any(r is not None for r in blockdata.restrictions):
+            return None
+        if not all(name in tensor_factors for name in blockdata.unames):
+            return None
+        return [tensor_factors[name] for name in blockdata.unames]
+
+    def generate_sum_factorized_block(self, quadrature_rule, blockmap, blockdata, factors, fw):
+        """Generate sum factorized accumulation of a block after the quadrature loop.
+
+        The values fw in the points of the tensor product grid are
+        contracted with the one dimensional tables of the arguments
+        along one direction of the grid at a time, starting with the
+        last.
+        """
+        L = self.backend.language
+        grid = self.ir.integrand[quadrature_rule]["point_grid"]
+        d = len(grid)
+        rank = len(factors)
 
-        Asym = self.backend.symbols.element_tensor()
-        A = L.FlattenedArray(Asym, dims=A_shape)
+        iq = [L.Symbol("iq{}".format(k)) for k in range(d)]
+        indices = []
+        for a in range(rank):
+            name = self.backend.symbols.argument_loop_index(a).name
+            indices.append([L.Symbol("{}{}".format(name, k)) for k in range(d)])
+        tables = [[L.Symbol("{}_F{}".format(name, k)) for k in range(d)] for name in blockdata.unames]
+        dims = [f.columns.shape for f in factors]
+        self.sum_factorized_tables.update(blockdata.unames)
 
-        B_rhs = L.float_product([fw] + arg_factors)
-        A_indices = []
+        A = L.FlattenedArray(self.element_tensor(), dims=self.ir.tensor_shape)
 
-        for i, bm in enumerate(blockmap):
-            offset = blockmap[i][0]
-            A_indices.append(arg_indices[i] + offset)
+        parts = []
+        T = L.FlattenedArray(fw, dims=grid)
+        for k in reversed(range(d)):
+            # Loops over the remaining points and the argument indices
+            # along the eliminated directions, summing over points along
+            # direction k
+            loops = [(iq[j], grid[j]) for j in range(k)]
+            for a in range(rank):
+                loops += [(indices[a][j], dims[a][j]) for j in range(k, d)]
+
+            rhs = L.float_product([tables[a][k][iq[k], indices[a][k]] for a in range(rank)]
+                                  + [T[iq[:k + 1] + sum((indices[a][k + 1:] for a in range(rank)), [])]])
+            if k > 0:
+                Tk = self.new_temp_symbol("fwt")
+                Tdims = tuple(grid[:k]) + sum((dims[a][k:] for a in range(rank)), ())
+                parts.append(L.ArrayDecl("ufc_scalar_t", Tk, int(numpy.product(Tdims)), values=0))
+                T = L.FlattenedArray(Tk, dims=Tdims)
+                body = L.AssignAdd(T[iq[:k] + sum((indices[a][k:] for a in range(rank)), [])], rhs)
+            else:
+                # Scatter to the element tensor
+                scales = [L.Symbol("{}_S".format(name))[indices[a]] for a, name in enumerate(blockdata.unames)]
+                dofs = [L.Symbol("{}_D".format(name))[indices[a]] + blockmap[a][0]
+                        for a, name in enumerate(blockdata.unames)]
+                body = L.AssignAdd(A[dofs], L.float_product(scales + [rhs]))
 
-        body = L.AssignAdd(A[A_indices], B_rhs)
+            body = L.ForRange(iq[k], 0, grid[k], body=body)
+            for index, n in reversed(loops):
+                body = L.ForRange(index, 0, n, body=body)
+            parts.append(body)
 
-        for i in reversed(range(block_rank)):
-            body = L.ForRange(B_indices[i], 0, blockdims[i], body=body)
-        quadparts += [body]
+        return L.commented_code_list(parts, "Sum factorized accumulation of block {}".format(blockdata.unames))
 
-        return preparts, quadparts
+    def generate_sum_factorized_coefficient(self, quadrature_rule, mt, tabledata, factors):
+        """Generate sum factorized evaluation of a coefficient in all points, before the quadrature loop.
+
+        Returns the array of values in the points.
+        """
+        L = self.backend.language
+        grid = self.ir.integrand[quadrature_rule]["point_grid"]
+        d = len(grid)
+        dims = factors.columns.shape
+        self.sum_factorized_tables.add(tabledata.name)
+
+        iq = [L.Symbol("iq{}".format(k)) for k in range(d)]
+        ic = [L.Symbol("ic{}".format(k)) for k in range(d)]
+        tables = [L.Symbol("{}_F{}".format(tabledata.name, k)) for k in range(d)]
+
+        # Scaled dofs of the coefficient
+        dof = L.Symbol("{}_D".format(tabledata.name))[ic] + tabledata.dofmap[0]
+        scale = L.Symbol("{}_S".format(tabledata.name))[ic]
+        S = L.float_product([scale, self.backend.symbols.coefficient_dof_access(mt.terminal, dof)])
+
+        parts = []
+        for k in range(d):
+            # Loops over the points along the directions done and the
+            # remaining dofs, summing over dofs along direction k
+            loops = [(iq[j], grid[j]) for j in range(k + 1)] + [(ic[j], dims[j]) for j in range(k + 1, d)]
+            rhs = L.float_product([tables[k][iq[k], ic[k]], S])
+            Sk = self.new_temp_symbol("wq")
+            Sdims = tuple(grid[:k + 1]) + tuple(dims[k + 1:])
+            parts.append(L.ArrayDecl("ufc_scalar_t", Sk, int(numpy.product(Sdims)), values=0))
+            S = L.FlattenedArray(Sk, dims=Sdims)
+            body = L.AssignAdd(S[iq[:k + 1] + ic[k + 1:]], rhs)
+            body = L.ForRange(ic[k], 0, dims[k], body=body)
+            for index, n in reversed(loops):
+                body = L.ForRange(index, 0, n, body=body)
+            parts.append(body)
+            S = S[iq[:k + 1] + ic[k + 1:]]
+
+        parts = L.commented_code_list(parts, "Sum factorized evaluation of {}".format(tabledata.name))
+        self.sum_factorized_coefficients.setdefault(quadrature_rule, []).extend(parts)
+        return Sk
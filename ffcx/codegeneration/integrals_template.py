@@ -80,6 +80,61 @@ void tabulate_tensor_{factory_name}(ufc_scalar_t* restrict A,
 """
 }
 
+tabulate_batch_implementation = {
+    "cell":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A,
+                                          const ufc_scalar_t* restrict w,
+                                          const ufc_scalar_t* restrict c,
+                                          const double* restrict coordinate_dofs,
+                                          const int* restrict unused_local_index,
+                                          const uint8_t* restrict quadrature_permutation,
+                                          const uint32_t* restrict cell_permutation)
+{{
+{tabulate_tensor}
+}}
+""",
+    "exterior_facet":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A,
+                                          const ufc_scalar_t* restrict w,
+                                          const ufc_scalar_t* restrict c,
+                                          const double* restrict coordinate_dofs,
+                                          const int* restrict facet,
+                                          const uint8_t* restrict quadrature_permutation,
+                                          const uint32_t* restrict cell_permutation)
+{{
+{tabulate_tensor}
+}}
+""",
+    "interior_facet":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A,
+                                          const ufc_scalar_t* restrict w,
+                                          const ufc_scalar_t* restrict c,
+                                          const double* restrict coordinate_dofs,
+                                          const int* restrict facet,
+                                          const uint8_t* restrict quadrature_permutation,
+                                          const uint32_t* restrict cell_permutation)
+{{
+{tabulate_tensor}
+}}
+""",
+    "vertex":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A,
+                                          const ufc_scalar_t* restrict w,
+                                          const ufc_scalar_t* restrict c,
+                                          const double* restrict coordinate_dofs,
+                                          const int* restrict vertex,
+                                          const uint8_t* restrict quadrature_permutation,
+                                          const uint32_t* restrict cell_permutation)
+{{
+{tabulate_tensor}
+}}
+"""
+}
+
 factory = """
 // Code for integral {factory_name}
 
@@ -91,6 +146,9 @@ ufc_integral* create_{factory_name}(void)
   ufc_integral* integral = malloc(sizeof(*integral));
   integral->enabled_coefficients = enabled;
   integral->tabulate_tensor = tabulate_tensor_{factory_name};
+  integral->batch_size = {batch_size};
+  integral->tabulate_tensor_batch = {tabulate_tensor_batch};
+  integral->upper_triangle = {upper_triangle};
   return integral;
 }}
 
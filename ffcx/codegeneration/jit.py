@@ -4,19 +4,36 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
-from contextlib import redirect_stdout
+import collections
+import concurrent.futures
+import contextlib
 import importlib
-import io
+import hashlib
+import json
 import logging
 import os
 import re
+import shlex
+import shutil
+import subprocess
+import sys
+import sysconfig
 import tempfile
+import threading
 import time
+import weakref
 from pathlib import Path
 
-import cffi
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 import ffcx
 import ffcx.naming
+import ffcx.parameters
+from ffcx import instrumentation
+from ffcx.codegeneration.cache import JITCache
 
 logger = logging.getLogger("ffcx")
 
@@ -39,6 +56,7 @@ UFC_FORM_DECL = '\n'.join(re.findall('typedef struct ufc_form.*?ufc_form;', ufc_
 
 UFC_INTEGRAL_DECL = '\n'.join(re.findall(r'typedef void ?\(ufc_tabulate_tensor\).*?\);', ufc_h, re.DOTALL))
 UFC_INTEGRAL_DECL += '\n'.join(re.findall(r'typedef void ?\(ufc_tabulate_tensor_custom\).*?\);', ufc_h, re.DOTALL))
+UFC_INTEGRAL_DECL += '\n'.join(re.findall(r'typedef void ?\(ufc_tabulate_tensor_batch\).*?\);', ufc_h, re.DOTALL))
 UFC_INTEGRAL_DECL += '\n'.join(re.findall('typedef struct ufc_integral.*?ufc_integral;',
                                           ufc_h, re.DOTALL))
 UFC_INTEGRAL_DECL += '\n'.join(re.findall('typedef struct ufc_custom_integral.*?ufc_custom_integral;',
@@ -46,59 +64,169 @@ UFC_INTEGRAL_DECL += '\n'.join(re.findall('typedef struct ufc_custom_integral.*?
 UFC_EXPRESSION_DECL = '\n'.join(re.findall('typedef struct ufc_expression.*?ufc_expression;', ufc_h, re.DOTALL))
 
 
+# Modules loaded by this process, with the compiled objects, by the
+# least recently used. Entries are removed when one of their UFL
+# objects is garbage collected, objects which can not be weakly
+# referenced (e.g. ufl.Form) are only bounded by the number of entries.
+_loaded_modules = collections.OrderedDict()
+_loaded_modules_max_entries = 128
+
+# Guards _loaded_modules, reentrant as entries are removed by weakref
+# callbacks, which may run during garbage collection in any thread
+_loaded_modules_lock = threading.RLock()
+
+# Locks of the modules being loaded, so that concurrent compilations of
+# the same objects compile them once
+_loading_locks = {}
+
+# Executor for background compilation, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+# Objects in registered bundles, see register_bundle, and the loaded
+# bundle modules
+BUNDLE_MANIFEST = "ffcx-bundle.json"
+_bundle_objects = {}
+_bundle_modules = {}
+
+
 def _compute_parameter_signature(parameters):
     """Return parameters signature (some parameters should not affect signature)."""
-    return str(sorted(parameters.items()))
+    return str(sorted(ffcx.parameters.code_parameters(parameters).items()))
 
 
-def get_cached_module(module_name, object_names, cache_dir, timeout):
-    """Look for an existing C file and wait for compilation, or if it does not exist, create it."""
-    cache_dir = Path(cache_dir)
-    c_filename = cache_dir.joinpath(module_name).with_suffix(".c")
-    ready_name = c_filename.with_suffix(".c.cached")
+def compute_bundle_key(ufl_object, parameters):
+    """Return the key of a form or element in the manifest of a bundle."""
+    return ffcx.naming.compute_signature([ufl_object], _compute_parameter_signature(parameters))
 
-    # Ensure cache dir exists
-    cache_dir.mkdir(exist_ok=True, parents=True)
 
-    try:
-        # Create C file with exclusive access
-        open(c_filename, "x")
+def register_bundle(path):
+    """Register a bundle of precompiled objects, built with 'ffcx --bundle'.
+
+    The JIT functions load forms and elements found in registered
+    bundles from the bundle instead of compiling them. Objects are
+    matched on their UFL signature and the FFCX parameters, so a bundle
+    is only used with the parameters it was built with.
+    """
+    path = Path(path).absolute()
+    manifest_filename = path.joinpath(BUNDLE_MANIFEST) if path.is_dir() else path
+    with open(manifest_filename, "r") as f:
+        manifest = json.load(f)
+
+    bundle = (str(manifest_filename.parent), manifest["module"])
+    for key, names in manifest["objects"].items():
+        _bundle_objects[key] = (bundle, names)
+    logger.info("Registered bundle {} with {} objects".format(manifest_filename, len(manifest["objects"])))
+
+
+def unregister_bundle(path):
+    """Unregister a bundle registered with register_bundle.
+
+    Objects of the bundle are compiled by the JIT functions again.
+    Objects which were also registered by another bundle are only
+    removed if the bundle is the one they are currently loaded from.
+    """
+    path = Path(path).absolute()
+    manifest_filename = path.joinpath(BUNDLE_MANIFEST) if path.is_dir() else path
+    bundle_dir = str(manifest_filename.parent)
+
+    for key, (bundle, names) in list(_bundle_objects.items()):
+        if bundle[0] == bundle_dir:
+            del _bundle_objects[key]
+    for bundle in list(_bundle_modules):
+        if bundle[0] == bundle_dir:
+            del _bundle_modules[bundle]
+    logger.info("Unregistered bundle {}".format(manifest_filename))
+
+
+def _load_from_bundle(ufl_objects, parameters):
+    """Load objects from a registered bundle, returning (None, None) if not all are bundled."""
+    if not _bundle_objects:
         return None, None
-    except FileExistsError:
-        logger.info("Cached C file already exists: " + str(c_filename))
-        finder = importlib.machinery.FileFinder(
-            str(cache_dir), (importlib.machinery.ExtensionFileLoader, importlib.machinery.EXTENSION_SUFFIXES))
-        finder.invalidate_caches()
 
-        # Now, wait for ready
-        for i in range(timeout):
-            if os.path.exists(ready_name):
-                spec = finder.find_spec(module_name)
-                if spec is None:
-                    raise ModuleNotFoundError("Unable to find JIT module.")
-                compiled_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(compiled_module)
+    entries = [_bundle_objects.get(compute_bundle_key(ufl_object, parameters)) for ufl_object in ufl_objects]
+    if None in entries or len(set(bundle for bundle, names in entries)) != 1:
+        return None, None
 
-                compiled_objects = [getattr(compiled_module.lib, "create_" + name)() for name in object_names]
-                return compiled_objects, compiled_module
+    bundle = entries[0][0]
+    if bundle not in _bundle_modules:
+        bundle_dir, module_name = bundle
+        _bundle_modules[bundle] = _load_objects(Path(bundle_dir), module_name, [])[1]
+    module = _bundle_modules[bundle]
 
-            logger.info("Waiting for {} to appear.".format(str(ready_name)))
-            time.sleep(1)
-        raise TimeoutError("""JIT compilation timed out, probably due to a failed previous compile.
-        Try cleaning cache (e.g. remove {}) or increase timeout parameter.""".format(c_filename))
+    object_names = [name for bundle, names in entries for name in names]
+    return _create_objects(module, object_names), module
 
 
-def compile_elements(elements, parameters=None, cache_dir=None, timeout=10, cffi_extra_compile_args=None,
-                     cffi_verbose=False, cffi_debug=None, cffi_libraries=None):
+def get_cached_module(module_name, object_names, cache_dir):
+    """Load a compiled module from the cache, returning (None, None) if it is not cached."""
+    cache_dir = Path(cache_dir)
+    cache = JITCache(cache_dir)
+
+    module_file = cache.lookup(module_name)
+    if module_file is not None:
+        return _load_objects(cache_dir, module_name, object_names, module_file)
+
+    # Module compiled before the cache index was created
+    ready_name = cache_dir.joinpath(module_name + ".c.cached")
+    if ready_name.exists():
+        cache.register(module_name)
+        return _load_objects(cache_dir, module_name, object_names)
+
+    return None, None
+
+
+@contextlib.contextmanager
+def _module_lock(cache_dir, module_name, timeout=None):
+    """Hold an exclusive advisory lock on a module while it is compiled.
+
+    Processes which need the same module block on the lock and wake up
+    as soon as the compiling process releases it. The lock is released
+    by the operating system if the compiling process dies, so a crashed
+    compile is picked up by the next waiting process. The optional
+    timeout is wall-clock time in seconds.
+    """
+    if fcntl is None:
+        # No advisory locks on this platform
+        yield
+        return
+
+    lock_filename = cache_dir.joinpath(module_name + ".lock")
+    with open(lock_filename, "a") as lock_file:
+        if timeout is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            t0 = time.time()
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.time() - t0 > timeout:
+                        raise TimeoutError("""JIT compilation of {} timed out after {} seconds waiting for another
+                        process. Increase the timeout parameter.""".format(module_name, timeout))
+                    time.sleep(delay)
+                    delay = min(2 * delay, 0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def compile_elements(elements, parameters=None, cache_dir=None, timeout=None, cffi_extra_compile_args=None,
+                     cffi_verbose=False, cffi_debug=None, cffi_libraries=None, cffi_jobs=1):
     """Compile a list of UFL elements and dofmaps into Python objects."""
     p = ffcx.parameters.default_parameters()
     if parameters is not None:
         p.update(parameters)
 
-    # Get a signature for these elements
-    module_name = 'libffcx_elements_' + \
-        ffcx.naming.compute_signature(elements, _compute_parameter_signature(p)
-                                      + str(cffi_extra_compile_args) + str(cffi_debug))
+    objects, module = _load_from_bundle(elements, p)
+    if objects is not None:
+        return list(zip(objects[::2], objects[1::2])), module
+
+    # Get a signature for the code generated for these elements
+    signature = ffcx.naming.compute_signature(elements, _compute_parameter_signature(p))
 
     names = []
     for e in elements:
@@ -107,84 +235,52 @@ def compile_elements(elements, parameters=None, cache_dir=None, timeout=10, cffi
         name = ffcx.naming.dofmap_name(e, "JIT")
         names.append(name)
 
-    if cache_dir is not None:
-        cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, names, cache_dir, timeout)
-        if obj is not None:
-            # Pair up elements with dofmaps
-            obj = list(zip(obj[::2], obj[1::2]))
-            return obj, mod
-    else:
-        cache_dir = Path(tempfile.mkdtemp())
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL
+    element_template = "ufc_finite_element * create_{name}(void);\n"
+    dofmap_template = "ufc_dofmap * create_{name}(void);\n"
+    for i in range(len(elements)):
+        decl += element_template.format(name=names[i * 2])
+        decl += dofmap_template.format(name=names[i * 2 + 1])
 
-    try:
-        scalar_type = p["scalar_type"].replace("complex", "_Complex")
-        decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL
-        element_template = "ufc_finite_element * create_{name}(void);\n"
-        dofmap_template = "ufc_dofmap * create_{name}(void);\n"
-        for i in range(len(elements)):
-            decl += element_template.format(name=names[i * 2])
-            decl += dofmap_template.format(name=names[i * 2 + 1])
-
-        _compile_objects(decl, elements, names, module_name, p, cache_dir,
-                         cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries)
-    except Exception:
-        # remove c file so that it will not timeout next time
-        c_filename = cache_dir.joinpath(module_name + ".c")
-        os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        raise
+    objects, module = _compile_and_load(decl, elements, names, "libffcx_elements_", signature, p, cache_dir, timeout,
+                                        cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
 
-    objects, module = _load_objects(cache_dir, module_name, names)
     # Pair up elements with dofmaps
     objects = list(zip(objects[::2], objects[1::2]))
     return objects, module
 
 
-def compile_forms(forms, parameters=None, cache_dir=None, timeout=10, cffi_extra_compile_args=None,
-                  cffi_verbose=False, cffi_debug=None, cffi_libraries=None):
+def compile_forms(forms, parameters=None, cache_dir=None, timeout=None, cffi_extra_compile_args=None,
+                  cffi_verbose=False, cffi_debug=None, cffi_libraries=None, cffi_jobs=1):
     """Compile a list of UFL forms into UFC Python objects."""
     p = ffcx.parameters.default_parameters()
     if parameters is not None:
         p.update(parameters)
 
-    # Get a signature for these forms
-    module_name = 'libffcx_forms_' + \
-        ffcx.naming.compute_signature(forms, _compute_parameter_signature(p)
-                                      + str(cffi_extra_compile_args) + str(cffi_debug))
-
-    form_names = [ffcx.naming.form_name(form, i) for i, form in enumerate(forms)]
+    objects, module = _load_from_bundle(forms, p)
+    if objects is not None:
+        return objects, module
 
-    if cache_dir is not None:
-        cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, form_names, cache_dir, timeout)
-        if obj is not None:
-            return obj, mod
-    else:
-        cache_dir = Path(tempfile.mkdtemp())
+    # Get a signature for the code generated for these forms
+    signature = ffcx.naming.compute_signature(forms, _compute_parameter_signature(p))
 
-    try:
-        scalar_type = p["scalar_type"].replace("complex", "_Complex")
-        decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL + \
-            UFC_COORDINATEMAPPING_DECL + UFC_INTEGRAL_DECL + UFC_FORM_DECL
+    form_names = [ffcx.naming.form_name(form, i) for i, form in enumerate(forms)]
 
-        form_template = "ufc_form * create_{name}(void);\n"
-        for name in form_names:
-            decl += form_template.format(name=name)
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL + \
+        UFC_COORDINATEMAPPING_DECL + UFC_INTEGRAL_DECL + UFC_FORM_DECL
 
-        _compile_objects(decl, forms, form_names, module_name, p, cache_dir,
-                         cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries)
-    except Exception:
-        # remove c file so that it will not timeout next time
-        c_filename = cache_dir.joinpath(module_name + ".c")
-        os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        raise
+    form_template = "ufc_form * create_{name}(void);\n"
+    for name in form_names:
+        decl += form_template.format(name=name)
 
-    obj, module = _load_objects(cache_dir, module_name, form_names)
-    return obj, module
+    return _compile_and_load(decl, forms, form_names, "libffcx_forms_", signature, p, cache_dir, timeout,
+                             cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
 
 
-def compile_expressions(expressions, parameters=None, cache_dir=None, timeout=10, cffi_extra_compile_args=None,
-                        cffi_verbose=False, cffi_debug=None, cffi_libraries=None):
+def compile_expressions(expressions, parameters=None, cache_dir=None, timeout=None, cffi_extra_compile_args=None,
+                        cffi_verbose=False, cffi_debug=None, cffi_libraries=None, cffi_jobs=1):
     """Compile a list of UFL expressions into UFC Python objects.
 
     Parameters
@@ -197,95 +293,282 @@ def compile_expressions(expressions, parameters=None, cache_dir=None, timeout=10
     if parameters is not None:
         p.update(parameters)
 
-    # Get a signature for these forms
-    module_name = 'libffcx_expressions_' + ffcx.naming.compute_signature(expressions, '', p)
+    # Get a signature for the code generated for these expressions
+    signature = ffcx.naming.compute_signature(expressions, _compute_parameter_signature(p))
 
-    expr_names = ["expression_{!s}".format(ffcx.naming.compute_signature([expression], "", p))
+    expr_names = ["expression_{!s}".format(ffcx.naming.compute_signature([expression], ""))
                   for expression in expressions]
 
-    if cache_dir is not None:
-        cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, expr_names, cache_dir, timeout)
-        if obj is not None:
-            return obj, mod
-    else:
-        cache_dir = Path(tempfile.mkdtemp())
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL + \
+        UFC_COORDINATEMAPPING_DECL + UFC_INTEGRAL_DECL + UFC_FORM_DECL + UFC_EXPRESSION_DECL
 
-    try:
-        scalar_type = p["scalar_type"].replace("complex", "_Complex")
-        decl = UFC_HEADER_DECL.format(scalar_type) + UFC_ELEMENT_DECL + UFC_DOFMAP_DECL + \
-            UFC_COORDINATEMAPPING_DECL + UFC_INTEGRAL_DECL + UFC_FORM_DECL + UFC_EXPRESSION_DECL
+    expression_template = "ufc_expression* create_{name}(void);\n"
+    for name in expr_names:
+        decl += expression_template.format(name=name)
 
-        expression_template = "ufc_expression* create_{name}(void);\n"
-        for name in expr_names:
-            decl += expression_template.format(name=name)
+    return _compile_and_load(decl, expressions, expr_names, "libffcx_expressions_", signature, p, cache_dir, timeout,
+                             cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
 
-        _compile_objects(decl, expressions, expr_names, module_name, p, cache_dir,
-                         cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries)
-    except Exception:
-        # remove c file so that it will not timeout next time
-        c_filename = cache_dir.joinpath(module_name + ".c")
-        os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        raise
 
-    obj, module = _load_objects(cache_dir, module_name, expr_names)
-    return obj, module
-
-
-def compile_coordinate_maps(meshes, parameters=None, cache_dir=None, timeout=10, cffi_extra_compile_args=None,
-                            cffi_verbose=False, cffi_debug=None, cffi_libraries=None):
+def compile_coordinate_maps(meshes, parameters=None, cache_dir=None, timeout=None, cffi_extra_compile_args=None,
+                            cffi_verbose=False, cffi_debug=None, cffi_libraries=None, cffi_jobs=1):
     """Compile a list of UFL coordinate mappings into UFC Python objects."""
     p = ffcx.parameters.default_parameters()
     if parameters is not None:
         p.update(parameters)
 
-    # Get a signature for these cmaps
-    module_name = 'libffcx_cmaps_' + \
-        ffcx.naming.compute_signature(meshes, _compute_parameter_signature(
-            p) + str(cffi_extra_compile_args) + str(cffi_debug), True)
+    # Get a signature for the code generated for these cmaps
+    signature = ffcx.naming.compute_signature(meshes, _compute_parameter_signature(p), True)
 
     cmap_names = [ffcx.naming.coordinate_map_name(
         mesh.ufl_coordinate_element(), "JIT") for mesh in meshes]
 
-    if cache_dir is not None:
-        cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, cmap_names, cache_dir, timeout)
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = UFC_HEADER_DECL.format(scalar_type) + UFC_COORDINATEMAPPING_DECL + UFC_DOFMAP_DECL
+    cmap_template = "ufc_coordinate_mapping * create_{name}(void);\n"
+
+    for name in cmap_names:
+        decl += cmap_template.format(name=name)
+
+    return _compile_and_load(decl, meshes, cmap_names, "libffcx_cmaps_", signature, p, cache_dir, timeout,
+                             cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
+
+
+def compile_elements_async(elements, executor=None, **kwargs):
+    """Compile a list of UFL elements and dofmaps in the background.
+
+    Returns a concurrent.futures.Future for the result of
+    compile_elements, which is called with the keyword arguments. An
+    executor can be passed, otherwise a thread pool shared by all
+    background compilations is used.
+    """
+    return _submit(executor, compile_elements, elements, **kwargs)
+
+
+def compile_forms_async(forms, executor=None, **kwargs):
+    """Compile a list of UFL forms in the background, see compile_elements_async."""
+    return _submit(executor, compile_forms, forms, **kwargs)
+
+
+def compile_expressions_async(expressions, executor=None, **kwargs):
+    """Compile a list of UFL expressions in the background, see compile_elements_async."""
+    return _submit(executor, compile_expressions, expressions, **kwargs)
+
+
+def compile_coordinate_maps_async(meshes, executor=None, **kwargs):
+    """Compile a list of UFL coordinate mappings in the background, see compile_elements_async."""
+    return _submit(executor, compile_coordinate_maps, meshes, **kwargs)
+
+
+def _submit(executor, fn, ufl_objects, **kwargs):
+    global _executor
+    if executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Threads, as compiled objects can not be passed between
+                # processes. The C compiler runs in separate processes.
+                _executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="ffcx-jit")
+        executor = _executor
+    return executor.submit(fn, ufl_objects, **kwargs)
+
+
+def _compile_and_load(decl, ufl_objects, object_names, module_prefix, signature, parameters, cache_dir, timeout,
+                      cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs):
+    """Load a module from the cache, or compile and load it if it is not cached.
+
+    The cache has two levels. The generated C code is cached under the
+    signature of the UFL objects and the code generation parameters,
+    and the compiled module under a hash of the C code and the compiler
+    flags. Recompiling with different flags only reruns the C compiler.
+
+    Modules loaded by this process are memoized, so that compiling the
+    same objects again returns the already loaded objects, until one of
+    the objects is garbage collected or the module is evicted from the
+    bounded memo, see _loaded_modules.
+    """
+    key = (module_prefix + signature, tuple(object_names), str(cache_dir), str(cffi_extra_compile_args),
+           str(cffi_debug), str(cffi_libraries))
+    with _loaded_modules_lock:
+        try:
+            _loaded_modules.move_to_end(key)
+            return _loaded_modules[key]
+        except KeyError:
+            key_lock = _loading_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        # The module may have been loaded by another thread while waiting
+        with _loaded_modules_lock:
+            if key in _loaded_modules:
+                return _loaded_modules[key]
+        try:
+            result = _compile_or_load_cached(
+                decl, ufl_objects, object_names, module_prefix, signature, parameters, cache_dir, timeout,
+                cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
+            with _loaded_modules_lock:
+                _loaded_modules[key] = result
+                while len(_loaded_modules) > _loaded_modules_max_entries:
+                    _loaded_modules.popitem(last=False)
+        finally:
+            with _loaded_modules_lock:
+                _loading_locks.pop(key, None)
+
+    for ufl_object in ufl_objects:
+        # Expressions are passed as (expression, points) tuples
+        if isinstance(ufl_object, tuple):
+            ufl_object = ufl_object[0]
+        try:
+            weakref.finalize(ufl_object, _forget_loaded_module, key)
+        except TypeError:
+            # Object can not be weakly referenced
+            pass
+
+    return result
+
+
+def _forget_loaded_module(key):
+    with _loaded_modules_lock:
+        _loaded_modules.pop(key, None)
+
+
+def _compile_or_load_cached(decl, ufl_objects, object_names, module_prefix, signature, parameters, cache_dir,
+                            timeout, cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs):
+    if cache_dir is None:
+        cache_dir = Path(tempfile.mkdtemp())
+        code_body, implementations = _generate_source(ufl_objects, parameters)
+        module_name = module_prefix + _compute_module_signature(code_body, implementations, cffi_extra_compile_args,
+                                                                cffi_debug, cffi_libraries)
+        _build_module(decl, code_body, implementations, module_name, cache_dir,
+                      cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs)
+        return _load_objects(cache_dir, module_name, object_names)
+
+    # Absolute path, as the module is built in another working directory
+    cache_dir = Path(cache_dir).absolute()
+    cache_dir.mkdir(exist_ok=True, parents=True)
+
+    code_body, implementations = get_cached_source(module_prefix, signature, ufl_objects, parameters, cache_dir)
+    module_name = module_prefix + _compute_module_signature(code_body, implementations, cffi_extra_compile_args,
+                                                            cffi_debug, cffi_libraries)
+
+    # Fast path, module already compiled
+    obj, mod = get_cached_module(module_name, object_names, cache_dir)
+    if obj is not None:
+        return obj, mod
+
+    with _module_lock(cache_dir, module_name, timeout):
+        # The module may have been compiled by another process while waiting
+        obj, mod = get_cached_module(module_name, object_names, cache_dir)
         if obj is not None:
             return obj, mod
-    else:
-        cache_dir = Path(tempfile.mkdtemp())
 
-    try:
-        scalar_type = p["scalar_type"].replace("complex", "_Complex")
-        decl = UFC_HEADER_DECL.format(scalar_type) + UFC_COORDINATEMAPPING_DECL + UFC_DOFMAP_DECL
-        cmap_template = "ufc_coordinate_mapping * create_{name}(void);\n"
+        _build_module(decl, code_body, implementations, module_name, cache_dir,
+                      cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs,
+                      object_cache=JITCache(cache_dir))
 
-        for name in cmap_names:
-            decl += cmap_template.format(name=name)
+        # Record the new module and enforce the cache size limits
+        cache = JITCache(cache_dir)
+        cache.register(module_name)
+        cache.prune(keep=(module_name, ))
 
-        _compile_objects(decl, meshes, cmap_names, module_name, p, cache_dir,
-                         cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries)
-    except Exception:
-        # remove c file so that it will not timeout next time
-        c_filename = cache_dir.joinpath(module_name + ".c")
-        os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        raise
+    return _load_objects(cache_dir, module_name, object_names)
+
+
+def get_cached_source(module_prefix, signature, ufl_objects, parameters, cache_dir):
+    """Load generated C code from the cache, generating and caching it if it is not cached.
 
-    obj, module = _load_objects(cache_dir, module_name, cmap_names)
-    return obj, module
+    Returns the source shared by all translation units and the list of
+    implementations of the objects, see ffcx.formatting.format_units.
+    The source is recorded in the cache index, so that it is evicted
+    with the modules.
+    """
+    cache = JITCache(cache_dir)
+    source_name = module_prefix + "source_" + signature
+    source_filename = Path(cache_dir).joinpath(source_name + ".json")
+    try:
+        with open(source_filename, "r") as f:
+            source = json.load(f)
+        code_body, implementations = source["code_body"], source["implementations"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    else:
+        # Mark as recently used, recording sources cached before the index
+        if cache.lookup(source_name) is None:
+            cache.register_source(source_name)
+        return code_body, implementations
+
+    code_body, implementations = _generate_source(ufl_objects, parameters)
 
+    # Write to a temporary file first, so that concurrent readers never
+    # see a partially written file. The temporary file is unique, as
+    # threads of one process may generate the same source, e.g. when
+    # compiling the same forms with different compiler flags.
+    with tempfile.NamedTemporaryFile("w", dir=str(cache_dir), prefix=source_filename.name + ".",
+                                     suffix=".tmp", delete=False) as f:
+        json.dump({"code_body": code_body, "implementations": implementations}, f)
+    os.replace(f.name, source_filename)
+    cache.register_source(source_name)
 
-def _compile_objects(decl, ufl_objects, object_names, module_name, parameters, cache_dir,
-                     cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries):
+    return code_body, implementations
 
+
+def _generate_source(ufl_objects, parameters):
     import ffcx.compiler
+    return ffcx.compiler.compile_ufl_objects(ufl_objects, prefix="JIT", parameters=parameters, split=True)
+
+
+def _compiler_command(cffi_extra_compile_args, cffi_debug):
+    """Return the command used to compile translation units to object files."""
+    # Use the compiler and flags which are used for extension modules
+    cc = os.environ.get("CC", sysconfig.get_config_var("CC") or "cc")
+    cflags = os.environ.get("CFLAGS", sysconfig.get_config_var("CFLAGS") or "")
+    command = shlex.split(cc) + shlex.split(cflags) + shlex.split(sysconfig.get_config_var("CCSHARED") or "")
+    command += ["-I" + ffcx.codegeneration.get_include_path()]
+    if cffi_debug:
+        command += ["-g"]
+    if cffi_extra_compile_args is not None:
+        command += list(cffi_extra_compile_args)
+    return command
+
+
+def _compute_module_signature(code_body, implementations, cffi_extra_compile_args, cffi_debug, cffi_libraries):
+    """Return signature of the compiled module for given C code, compiler and flags."""
+    h = hashlib.sha1()
+    h.update(code_body.encode("utf-8"))
+    for implementation in implementations:
+        h.update(implementation.encode("utf-8"))
+    h.update(str(_compiler_command(cffi_extra_compile_args, cffi_debug)).encode("utf-8"))
+    h.update(str(cffi_libraries).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _build_module(decl, code_body, implementations, module_name, cache_dir,
+                  cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs, object_cache=None):
+    try:
+        _compile_objects(decl, code_body, implementations, module_name, cache_dir,
+                         cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs,
+                         object_cache)
+    except Exception:
+        # Keep the C file of the failed compile for inspection
+        c_filename = cache_dir.joinpath(module_name + ".c")
+        if c_filename.exists():
+            os.replace(c_filename, c_filename.with_suffix(".c.failed"))
+        raise
+
 
-    _, code_body = ffcx.compiler.compile_ufl_objects(ufl_objects, prefix="JIT", parameters=parameters)
+def _compile_objects(decl, code_body, implementations, module_name, cache_dir,
+                     cffi_extra_compile_args, cffi_verbose, cffi_debug, cffi_libraries, cffi_jobs,
+                     object_cache=None):
 
-    ffibuilder = cffi.FFI()
-    ffibuilder.set_source(module_name, code_body, include_dirs=[ffcx.codegeneration.get_include_path()],
-                          extra_compile_args=cffi_extra_compile_args, libraries=cffi_libraries)
-    ffibuilder.cdef(decl)
+    if cffi_jobs > 1 or object_cache is not None:
+        # Compile each object in a separate translation unit, and link
+        # the object files into the extension module. With a cache, the
+        # object files of unchanged objects are reused when recompiling.
+        with instrumentation.section("C compiler, translation units"):
+            extra_objects = _compile_units(code_body, implementations, module_name, cache_dir,
+                                           cffi_extra_compile_args, cffi_debug, cffi_jobs, object_cache)
+    else:
+        code_body += "".join(implementations)
+        extra_objects = []
 
     c_filename = cache_dir.joinpath(module_name + ".c")
     ready_name = c_filename.with_suffix(".c.cached")
@@ -297,34 +580,135 @@ def _compile_objects(decl, ufl_objects, object_names, module_name, parameters, c
     logger.info("Calling JIT C compiler")
     logger.info(79 * "#")
 
+    # cffi changes the working directory while building, and the
+    # compiler prints to stdout, both of which are global to the
+    # process. Build in a separate process, so that other threads (e.g.
+    # of the caller of a background compilation) are not affected.
+    build = {"module_name": module_name, "source": code_body, "decl": decl,
+             "include_dirs": [ffcx.codegeneration.get_include_path()],
+             "extra_compile_args": cffi_extra_compile_args, "libraries": cffi_libraries,
+             "extra_objects": extra_objects, "tmpdir": str(cache_dir), "debug": cffi_debug}
+
     t0 = time.time()
-    f = io.StringIO()
-    with redirect_stdout(f):
-        ffibuilder.compile(tmpdir=cache_dir, verbose=True, debug=cffi_debug)
-    s = f.getvalue()
+    with instrumentation.section("C compiler"):
+        result = subprocess.run([sys.executable, "-c", _BUILD_SCRIPT], input=json.dumps(build),
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    s = result.stdout
     if (cffi_verbose):
         print(s)
+    if result.returncode != 0:
+        raise RuntimeError("Compilation of {} failed:\n{}".format(c_filename, s))
 
     logger.info("JIT C compiler finished in {:.4f}".format(time.time() - t0))
 
-    # Create a "status ready" file. If this fails, it is an error,
-    # because it should not exist yet.
-    # Copy the stdout verbose output of the build into the ready file
-    fd = open(ready_name, "x")
-    fd.write(s)
-    fd.close()
+    # Create a "status ready" file, with the stdout verbose output of
+    # the build
+    with open(ready_name, "w") as fd:
+        fd.write(s)
+
+
+# Script building an extension module with cffi, run by _compile_objects
+# in a separate process with the arguments as JSON on stdin
+_BUILD_SCRIPT = """
+import json
+import sys
+
+import cffi
 
+build = json.load(sys.stdin)
+ffibuilder = cffi.FFI()
+ffibuilder.set_source(build["module_name"], build["source"], include_dirs=build["include_dirs"],
+                      extra_compile_args=build["extra_compile_args"], libraries=build["libraries"],
+                      extra_objects=build["extra_objects"])
+ffibuilder.cdef(build["decl"])
+ffibuilder.compile(tmpdir=build["tmpdir"], verbose=True, debug=build["debug"])
+"""
 
-def _load_objects(cache_dir, module_name, object_names):
 
-    # Create module finder that searches the compile path
-    finder = importlib.machinery.FileFinder(
-        str(cache_dir), (importlib.machinery.ExtensionFileLoader, importlib.machinery.EXTENSION_SUFFIXES))
+def _compute_unit_signature(command, code_body, implementation):
+    """Return signature of the object file compiled from a translation unit.
 
-    # Find module. Clear search cache to be sure dynamically created
-    # (new) modules are found
-    finder.invalidate_caches()
-    spec = finder.find_spec(module_name)
+    The declarations of the objects in the shared source are left out,
+    as declarations of objects which are not referenced by the
+    implementation don't change the compiled object. Objects are named
+    by the signature of their code, so a referenced object which changes
+    changes the implementation as well.
+    """
+    h = hashlib.sha1()
+    h.update(str(command).encode("utf-8"))
+    for line in code_body.splitlines():
+        if not _declaration_re.match(line):
+            h.update(line.encode("utf-8"))
+    h.update(implementation.encode("utf-8"))
+    return h.hexdigest()
+
+
+# Declaration of a function in the generated code
+_declaration_re = re.compile(r"^\w[\w ]*\*? ?\w+\(.*\);$")
+
+
+def _compile_units(code_body, implementations, module_name, cache_dir,
+                   cffi_extra_compile_args, cffi_debug, cffi_jobs, object_cache=None):
+    """Compile translation units concurrently, returning the list of object files.
+
+    If an object_cache (JITCache) is given, translation units which were
+    compiled before, e.g. the unchanged integrals of a modified form,
+    are copied from the cache instead of compiled.
+    """
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    command = _compiler_command(cffi_extra_compile_args, cffi_debug)
+    keys = [_compute_unit_signature(command, code_body, implementation) for implementation in implementations]
+
+    def compile_unit(i):
+        c_filename = cache_dir.joinpath("{}_unit{}.c".format(module_name, i))
+        o_filename = c_filename.with_suffix(".o")
+        if object_cache is not None:
+            cached_filename = object_cache.lookup_object(keys[i])
+            if cached_filename is not None:
+                try:
+                    shutil.copyfile(cached_filename, o_filename)
+                    return str(o_filename), False
+                except FileNotFoundError:
+                    # Evicted by another process
+                    pass
+        with open(c_filename, "w") as fd:
+            fd.write(code_body + implementations[i])
+        result = subprocess.run(command + ["-c", str(c_filename), "-o", str(o_filename)],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if result.returncode != 0:
+            raise RuntimeError("Compilation of {} failed:\n{}".format(c_filename, result.stdout))
+        return str(o_filename), True
+
+    logger.info("Compiling {} translation units with {} jobs".format(len(implementations), cffi_jobs))
+
+    # Threads are sufficient, the work is done by the compiler processes
+    with concurrent.futures.ThreadPoolExecutor(max_workers=cffi_jobs) as executor:
+        results = list(executor.map(compile_unit, range(len(implementations))))
+
+    num_compiled = sum(compiled for o_filename, compiled in results)
+    if num_compiled < len(results):
+        logger.info("Reused {} unchanged translation units".format(len(results) - num_compiled))
+    if object_cache is not None:
+        object_cache.register_objects({key: o_filename for key, (o_filename, compiled) in zip(keys, results)})
+
+    return [o_filename for o_filename, compiled in results]
+
+
+def _load_objects(cache_dir, module_name, object_names, module_file=None):
+
+    if module_file is not None:
+        # Location of the extension module is known, e.g. from the cache index
+        loader = importlib.machinery.ExtensionFileLoader(module_name, str(module_file))
+        spec = importlib.util.spec_from_file_location(module_name, str(module_file), loader=loader)
+    else:
+        # Create module finder that searches the compile path
+        finder = importlib.machinery.FileFinder(
+            str(cache_dir), (importlib.machinery.ExtensionFileLoader, importlib.machinery.EXTENSION_SUFFIXES))
+
+        # Find module. Clear search cache to be sure dynamically created
+        # (new) modules are found
+        finder.invalidate_caches()
+        spec = finder.find_spec(module_name)
     if spec is None:
         raise ModuleNotFoundError("Unable to find JIT module.")
 
@@ -332,6 +716,10 @@ def _load_objects(cache_dir, module_name, object_names):
     compiled_module = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(compiled_module)
 
+    return _create_objects(compiled_module, object_names), compiled_module
+
+
+def _create_objects(compiled_module, object_names):
     compiled_objects = []
     for name in object_names:
         # Call UFC factory to create object data struct (calls malloc)
@@ -340,4 +728,4 @@ def _load_objects(cache_dir, module_name, object_names):
         # Set garbage collector to use C free()
         compiled_objects.append(compiled_module.ffi.gc(obj, compiled_module.lib.free))
 
-    return compiled_objects, compiled_module
+    return compiled_objects
@@ -68,10 +68,18 @@ class FFCXBackendSymbols(object):
         # True = XYZXYZXYZXYZ, False = XXXXYYYYZZZZ
         self.interleaved_components = True
 
+        # Coefficients with dofs transformed into local arrays before
+        # the quadrature loops
+        self.transformed_coefficients = set()
+
     def element_tensor(self):
         """Symbol for the element tensor itself."""
         return self.S("A")
 
+    def reference_element_tensor(self):
+        """Symbol for the element tensor of the untransformed dofs."""
+        return self.S("A_ref")
+
     def entity(self, entitytype, restriction):
         """Entity index for lookup in element tables."""
         if entitytype == "cell":
@@ -87,6 +95,10 @@ class FFCXBackendSymbols(object):
         else:
             logging.exception("Unknown entitytype {}".format(entitytype))
 
+    def batch_index(self):
+        """Loop index for the cells of a batch."""
+        return self.S("ib")
+
     def argument_loop_index(self, iarg):
         """Loop index for argument #iarg."""
         indices = ["i", "j", "k", "l"]
@@ -191,10 +203,17 @@ class FFCXBackendSymbols(object):
 
     def coefficient_dof_access(self, coefficient, dof_number):
         # TODO: Add domain number?
+        if coefficient in self.transformed_coefficients:
+            return self.reference_coefficient_dofs(coefficient)[dof_number]
         offset = self.coefficient_offsets[coefficient]
         w = self.S("w")
         return w[offset + dof_number]
 
+    def reference_coefficient_dofs(self, coefficient):
+        """Symbol for the array of transformed dofs of a coefficient."""
+        c = self.coefficient_numbering[coefficient]
+        return self.S("w%d_ref" % (c, ))
+
     def coefficient_value(self, mt):
         """Symbol for variable holding value or derivative component of coefficient."""
 
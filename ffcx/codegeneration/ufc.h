@@ -147,6 +147,27 @@ extern "C"
     int (*tabulate_reference_dof_coordinates)(
         double* restrict reference_dof_coordinates);
 
+    /// Apply the transformation of the dofs for the reflections and
+    /// rotations of the entities of the cell to data in place
+    /// @param[in,out] data The data, with block_size consecutive values
+    ///         for each dof. The transformation maps values for the dofs
+    ///         of the reference element to values for the dofs of the
+    ///         cell, e.g. the rows of an element tensor.
+    /// @param[in] block_size The number of values for each dof
+    /// @param[in] cell_permutation An integer that says how each entity
+    ///         of the cell of dimension < tdim has been permuted relative
+    ///         to a low-to-high ordering of the cell.
+    int (*apply_dof_transformation)(ufc_scalar_t* restrict data,
+                                    int block_size,
+                                    uint32_t cell_permutation);
+
+    /// Apply the transpose of the transformation of the dofs to data
+    /// in place, e.g. mapping the dofs of a coefficient on the cell to
+    /// the dofs of the reference element. See apply_dof_transformation.
+    int (*apply_dof_transformation_transpose)(ufc_scalar_t* restrict data,
+                                              int block_size,
+                                              uint32_t cell_permutation);
+
     /// Return the number of sub elements (for a mixed element)
     int num_sub_elements;
 
@@ -184,6 +205,27 @@ extern "C"
     /// Tabulate the local-to-local mapping of dofs on entity (d, i)
     void (*tabulate_entity_dofs)(int* restrict dofs, int d, int i);
 
+    /// Apply the transformation of the dofs for the reflections and
+    /// rotations of the entities of the cell to data in place
+    /// @param[in,out] data The data, with block_size consecutive values
+    ///         for each dof. The transformation maps values for the dofs
+    ///         of the reference element to values for the dofs of the
+    ///         cell, e.g. the rows of an element tensor.
+    /// @param[in] block_size The number of values for each dof
+    /// @param[in] cell_permutation An integer that says how each entity
+    ///         of the cell of dimension < tdim has been permuted relative
+    ///         to a low-to-high ordering of the cell.
+    int (*apply_dof_transformation)(ufc_scalar_t* restrict data,
+                                    int block_size,
+                                    uint32_t cell_permutation);
+
+    /// Apply the transpose of the transformation of the dofs to data
+    /// in place, e.g. mapping the dofs of a coefficient on the cell to
+    /// the dofs of the reference element. See apply_dof_transformation.
+    int (*apply_dof_transformation_transpose)(ufc_scalar_t* restrict data,
+                                              int block_size,
+                                              uint32_t cell_permutation);
+
     /// Return the number of sub dofmaps (for a mixed element)
     int num_sub_dofmaps;
 
@@ -291,10 +333,38 @@ extern "C"
       const double* restrict quadrature_weights,
       const double* restrict facet_normals);
 
+  /// Tabulate integral into tensors A of a batch of cells
+  ///
+  /// The arrays of the batch are in a structure-of-arrays layout: the
+  /// value k of cell b is at index k * batch_size + b, where k is the
+  /// index of the value in the corresponding argument of
+  /// ufc_tabulate_tensor for a single cell. The constants c are shared
+  /// by all cells of the batch.
+  ///
+  /// @see ufc_tabulate_tensor
+  ///
+  typedef void(ufc_tabulate_tensor_batch)(
+      ufc_scalar_t* restrict A, const ufc_scalar_t* restrict w,
+      const ufc_scalar_t* restrict c, const double* restrict coordinate_dofs,
+      const int* restrict entity_local_index,
+      const uint8_t* restrict quadrature_permutation,
+      const uint32_t* restrict cell_permutation);
+
   typedef struct ufc_integral
   {
     const bool* enabled_coefficients;
     ufc_tabulate_tensor* tabulate_tensor;
+
+    /// Number of cells tabulated by tabulate_tensor_batch
+    int batch_size;
+
+    /// Tabulate a batch of cells, or NULL if not generated
+    ufc_tabulate_tensor_batch* tabulate_tensor_batch;
+
+    /// True if the element tensor is symmetric and the kernels only
+    /// compute its entries on and above the diagonal, the entries below
+    /// the diagonal of A are undefined
+    bool upper_triangle;
   } ufc_integral;
 
   typedef struct ufc_custom_integral
@@ -68,9 +68,10 @@ import os
 import typing
 from time import time
 
+from ffcx import instrumentation
 from ffcx.analysis import analyze_ufl_objects
 from ffcx.codegeneration.codegeneration import generate_code
-from ffcx.formatting import format_code
+from ffcx.formatting import format_code, format_units
 from ffcx.ir.representation import compute_ir
 
 logger = logging.getLogger("ffcx")
@@ -85,13 +86,18 @@ def compile_ufl_objects(ufl_objects: typing.Union[typing.List, typing.Tuple],
                         object_names: typing.Dict = {},
                         prefix: str = None,
                         parameters: typing.Dict = None,
-                        visualise: bool = False):
+                        visualise: bool = False,
+                        split: bool = False):
     """Generate UFC code for a given UFL objects.
 
     Parameters
     ----------
     @param ufl_objects:
         Objects to be compiled. Accepts elements, forms, integrals or coordinate mappings.
+    @param split:
+        If True, return the source shared by all translation units and a
+        list with the implementation of each object (see
+        ffcx.formatting.format_units) instead of header and source.
 
     """
     if prefix != os.path.basename(prefix):
@@ -99,22 +105,29 @@ def compile_ufl_objects(ufl_objects: typing.Union[typing.List, typing.Tuple],
 
     # Stage 1: analysis
     cpu_time = time()
-    analysis = analyze_ufl_objects(ufl_objects, parameters)
+    with instrumentation.section("analysis"):
+        analysis = analyze_ufl_objects(ufl_objects, parameters)
     _print_timing(1, time() - cpu_time)
 
     # Stage 2: intermediate representation
     cpu_time = time()
-    ir = compute_ir(analysis, object_names, prefix, parameters, visualise)
+    with instrumentation.section("intermediate representation"):
+        ir = compute_ir(analysis, object_names, prefix, parameters, visualise)
     _print_timing(2, time() - cpu_time)
 
     # Stage 3: code generation
     cpu_time = time()
-    code = generate_code(ir, parameters)
+    with instrumentation.section("code generation"):
+        code = generate_code(ir, parameters)
     _print_timing(3, time() - cpu_time)
 
     # Stage 4: format code
     cpu_time = time()
-    code_h, code_c = format_code(code, parameters)
+    with instrumentation.section("formatting"):
+        if split:
+            code_h, code_c = format_units(code, parameters)
+        else:
+            code_h, code_c = format_code(code, parameters)
     _print_timing(4, time() - cpu_time)
 
     return code_h, code_c
@@ -21,6 +21,7 @@ from collections import namedtuple
 
 from ffcx import __version__ as FFCX_VERSION
 from ffcx.codegeneration import __version__ as UFC_VERSION
+from ffcx.parameters import code_parameters
 
 logger = logging.getLogger("ffcx")
 
@@ -66,23 +67,7 @@ def format_code(code: namedtuple, parameters):
     logger.info("Compiler stage 5: Formatting code")
     logger.info(79 * "*")
 
-    # Generate code for comment at top of file
-    code_h_pre = _generate_comment(parameters) + "\n"
-    code_c_pre = _generate_comment(parameters) + "\n"
-
-    # Generate code for header
-    code_h_pre += FORMAT_TEMPLATE["header_h"]
-    code_c_pre += FORMAT_TEMPLATE["header_c"]
-
-    # Define ufc_scalar before including ufc.h
-    scalar_type = _define_scalar(parameters)
-    code_h_pre += scalar_type
-    code_c_pre += scalar_type
-
-    # Generate includes and add to preamble
-    includes_h, includes_c = _generate_includes(parameters)
-    code_h_pre += includes_h
-    code_c_pre += includes_c
+    code_h_pre, code_c_pre = _generate_preamble(parameters)
 
     # Enclose header with 'extern "C"'
     code_h_pre += c_extern_pre
@@ -102,6 +87,30 @@ def format_code(code: namedtuple, parameters):
     return code_h, code_c
 
 
+def format_units(code: namedtuple, parameters):
+    """Format given code in UFC format as separate translation units.
+
+    Returns the source shared by all units (preamble and declarations
+    of all objects) and a list with the implementation of each object.
+    Each unit is compiled from the shared source followed by one
+    implementation.
+    """
+
+    logger.info(79 * "*")
+    logger.info("Compiler stage 5: Formatting code")
+    logger.info(79 * "*")
+
+    _, code_c_pre = _generate_preamble(parameters)
+
+    declarations = ""
+    implementations = []
+    for parts_code in code:
+        declarations += "".join([c[0] for c in parts_code])
+        implementations += [c[1] for c in parts_code if c[1]]
+
+    return code_c_pre + declarations, implementations
+
+
 def write_code(code_h, code_c, prefix, output_dir):
     _write_file(code_h, prefix, ".h", output_dir)
     _write_file(code_c, prefix, ".c", output_dir)
@@ -114,6 +123,30 @@ def _write_file(output, prefix, postfix, output_dir):
         hfile.write(output)
 
 
+def _generate_preamble(parameters):
+    """Generate code at the top of the header and source files."""
+
+    # Generate code for comment at top of file
+    code_h_pre = _generate_comment(parameters) + "\n"
+    code_c_pre = _generate_comment(parameters) + "\n"
+
+    # Generate code for header
+    code_h_pre += FORMAT_TEMPLATE["header_h"]
+    code_c_pre += FORMAT_TEMPLATE["header_c"]
+
+    # Define ufc_scalar before including ufc.h
+    scalar_type = _define_scalar(parameters)
+    code_h_pre += scalar_type
+    code_c_pre += scalar_type
+
+    # Generate includes and add to preamble
+    includes_h, includes_c = _generate_includes(parameters)
+    code_h_pre += includes_h
+    code_c_pre += includes_c
+
+    return code_h_pre, code_c_pre
+
+
 def _generate_comment(parameters):
     """Generate code for comment on top of file."""
 
@@ -124,7 +157,7 @@ def _generate_comment(parameters):
     comment += "//\n"
     comment += "// This code was generated with the following parameters:\n"
     comment += "//\n"
-    comment += textwrap.indent(pprint.pformat(parameters), "//  ")
+    comment += textwrap.indent(pprint.pformat(code_parameters(parameters)), "//  ")
     comment += "\n"
 
     return comment
@@ -0,0 +1,124 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Compile-time instrumentation.
+
+The compiler marks its stages and the objects it processes (integrals,
+element tables, factorization, C compilation, ...) as sections. When
+collection is enabled with :func:`collect`, the wall time and peak
+memory of each section are recorded in a tree of sections, which can
+be dumped to JSON::
+
+    with ffcx.instrumentation.collect() as report:
+        ffcx.codegeneration.jit.compile_forms(forms)
+    report.dump("timings.json")
+
+Sections are cheap no-ops when collection is not enabled. Collection is
+per thread.
+"""
+
+import contextlib
+import json
+import threading
+import time
+import tracemalloc
+
+_state = threading.local()
+
+
+class Section(object):
+    """Wall time and peak memory of a section, with its nested sections."""
+
+    def __init__(self, name):
+        self.name = name
+        self.time = 0.0
+        self.peak_memory = None
+        self.sections = []
+
+        # Traced memory at entry, and highest traced memory seen so far
+        self._start_memory = 0
+        self._peak = 0
+
+    def as_dict(self):
+        return {"name": self.name, "time": self.time, "peak_memory": self.peak_memory,
+                "sections": [s.as_dict() for s in self.sections]}
+
+    def dump(self, filename):
+        """Write the sections to a JSON file."""
+        with open(filename, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+@contextlib.contextmanager
+def collect(memory=True):
+    """Collect the sections executed in the block into a report.
+
+    Yields the root Section. Peak memory (in bytes, above the memory in
+    use when the section was entered) is traced with tracemalloc if
+    ``memory`` is True, which slows down compilation considerably.
+    """
+    report = Section("ffcx")
+    stack = getattr(_state, "stack", None)
+    if stack:
+        # Nested collection, record as a section of the outer one
+        stack[-1].sections.append(report)
+
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    _state.stack = [report]
+    try:
+        with _timed(report):
+            yield report
+    finally:
+        _state.stack = stack
+        if start_tracing:
+            tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def section(name):
+    """Record wall time and peak memory of the block, if collection is enabled."""
+    stack = getattr(_state, "stack", None)
+    if not stack:
+        yield
+        return
+
+    s = Section(name)
+    stack[-1].sections.append(s)
+    stack.append(s)
+    try:
+        with _timed(s):
+            yield
+    finally:
+        stack.pop()
+
+
+@contextlib.contextmanager
+def _timed(s):
+    stack = _state.stack
+    parent = stack[-2] if len(stack) > 1 else None
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent._peak = max(parent._peak, peak)
+        s._start_memory = current
+        s._peak = current
+        if hasattr(tracemalloc, "reset_peak"):
+            # Python >= 3.9, otherwise peaks are those of the enclosing
+            # section
+            tracemalloc.reset_peak()
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        s.time = time.perf_counter() - t0
+        if tracing:
+            s._peak = max(s._peak, tracemalloc.get_traced_memory()[1])
+            s.peak_memory = s._peak - s._start_memory
+            if parent is not None:
+                parent._peak = max(parent._peak, s._peak)
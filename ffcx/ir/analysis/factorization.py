@@ -22,8 +22,8 @@ def build_argument_indices(S):
     """Build ordered list of indices to modified arguments."""
 
     arg_indices = []
-    for i, v in S.nodes.items():
-        arg = strip_modified_terminal(v['expression'])
+    for i, v in enumerate(S.expressions):
+        arg = strip_modified_terminal(v)
         if isinstance(arg, Argument):
             arg_indices.append(i)
 
@@ -31,20 +31,20 @@ def build_argument_indices(S):
     def arg_ordering_key(i):
         """Return a key for sorting argument vertex indices.
         Key is based on the properties of the modified terminal."""
-        mt = analyse_modified_terminal(S.nodes[i]['expression'])
+        mt = analyse_modified_terminal(S.expressions[i])
         return mt.argument_ordering_key()
 
     ordered_arg_indices = sorted(arg_indices, key=arg_ordering_key)
     return ordered_arg_indices
 
 
-def graph_insert(F, expr):
-    """Add new expression expr to factorisation graph or return existing index."""
-    fi = F.e2i.get(expr)
+def graph_insert(FV, e2i, expr):
+    """Add new expression expr to list of factorisation graph vertices or return existing index."""
+    fi = e2i.get(expr)
     if fi is None:
-        fi = F.number_of_nodes()
-        F.add_node(fi, expression=expr)
-        F.e2i[expr] = fi
+        fi = len(FV)
+        FV.append(expr)
+        e2i[expr] = fi
     return fi
 
 
@@ -53,7 +53,7 @@ noargs = {}
 
 
 @singledispatch
-def handler(v, fac, sf, F):
+def handler(v, fac, sf, FV, e2i):
     # Error checking
     if any(fac):
         raise RuntimeError(
@@ -64,7 +64,7 @@ def handler(v, fac, sf, F):
 
 
 @handler.register(Sum)
-def handle_sum(v, fac, sf, F):
+def handle_sum(v, fac, sf, FV, e2i):
     if len(fac) != 2:
         raise RuntimeError("Assuming binary sum here. This can be fixed if needed.")
 
@@ -87,9 +87,9 @@ def handle_sum(v, fac, sf, F):
             elif fi1 is None:
                 fisum = fi0
             else:
-                f0 = F.nodes[fi0]['expression']
-                f1 = F.nodes[fi1]['expression']
-                fisum = graph_insert(F, f0 + f1)
+                f0 = FV[fi0]
+                f1 = FV[fi1]
+                fisum = graph_insert(FV, e2i, f0 + f1)
             factors[argkey] = fisum
 
     else:  # non-arg + non-arg
@@ -99,7 +99,7 @@ def handle_sum(v, fac, sf, F):
 
 
 @handler.register(Product)
-def handle_product(v, fac, sf, F):
+def handle_product(v, fac, sf, FV, e2i):
     if len(fac) != 2:
         raise RuntimeError("Assuming binary product here. This can be fixed if needed.")
     fac0 = fac[0]
@@ -113,39 +113,39 @@ def handle_product(v, fac, sf, F):
         f0 = sf[0]
         factors = {}
         for k1 in sorted(fac1):
-            f1 = F.nodes[fac1[k1]]['expression']
-            factors[k1] = graph_insert(F, f0 * f1)
+            f1 = FV[fac1[k1]]
+            factors[k1] = graph_insert(FV, e2i, f0 * f1)
 
     elif not fac1:  # arg * non-arg
         # Record products of non-arg operand with each factor of arg-dependent operand
         f1 = sf[1]
         factors = {}
         for k0 in sorted(fac0):
-            f0 = F.nodes[fac0[k0]]['expression']
-            factors[k0] = graph_insert(F, f1 * f0)
+            f0 = FV[fac0[k0]]
+            factors[k0] = graph_insert(FV, e2i, f1 * f0)
 
     else:  # arg * arg
         # Record products of each factor of arg-dependent operand
         factors = {}
         for k0 in sorted(fac0):
-            f0 = F.nodes[fac0[k0]]['expression']
+            f0 = FV[fac0[k0]]
             for k1 in sorted(fac1):
-                f1 = F.nodes[fac1[k1]]['expression']
+                f1 = FV[fac1[k1]]
                 argkey = tuple(sorted(k0 + k1))  # sort key for canonical representation
-                factors[argkey] = graph_insert(F, f0 * f1)
+                factors[argkey] = graph_insert(FV, e2i, f0 * f1)
 
     return factors
 
 
 @handler.register(Conj)
-def handle_conj(v, fac, sf, F):
+def handle_conj(v, fac, sf, FV, e2i):
 
     fac = fac[0]
     if fac:
         factors = {}
         for k in fac:
-            f0 = F.nodes[fac[k]]['expression']
-            factors[k] = graph_insert(F, Conj(f0))
+            f0 = FV[fac[k]]
+            factors[k] = graph_insert(FV, e2i, Conj(f0))
     else:
         raise RuntimeError("No arguments")
 
@@ -153,7 +153,7 @@ def handle_conj(v, fac, sf, F):
 
 
 @handler.register(Division)
-def handle_division(v, fac, sf, F):
+def handle_division(v, fac, sf, FV, e2i):
     fac0 = fac[0]
     fac1 = fac[1]
     assert not fac1, "Cannot divide by arguments."
@@ -163,8 +163,8 @@ def handle_division(v, fac, sf, F):
         f1 = sf[1]
         factors = {}
         for k0 in sorted(fac0):
-            f0 = F.nodes[fac0[k0]]['expression']
-            factors[k0] = graph_insert(F, f0 / f1)
+            f0 = FV[fac0[k0]]
+            factors[k0] = graph_insert(FV, e2i, f0 / f1)
 
     else:  # non-arg / non-arg
         raise RuntimeError("No arguments")
@@ -173,7 +173,7 @@ def handle_division(v, fac, sf, F):
 
 
 @handler.register(Conditional)
-def handle_conditional(v, fac, sf, F):
+def handle_conditional(v, fac, sf, FV, e2i):
     fac0 = fac[0]
     fac1 = fac[1]
     fac2 = fac[2]
@@ -201,9 +201,9 @@ def handle_conditional(v, fac, sf, F):
         for k in mas:
             fi1 = fac1.get(k)
             fi2 = fac2.get(k)
-            f1 = z if fi1 is None else F.nodes[fi1]['expression']
-            f2 = z if fi2 is None else F.nodes[fi2]['expression']
-            factors[k] = graph_insert(F, conditional(f0, f1, f2))
+            f1 = z if fi1 is None else FV[fi1]
+            f2 = z if fi2 is None else FV[fi2]
+            factors[k] = graph_insert(FV, e2i, conditional(f0, f1, f2))
 
     return factors
 
@@ -241,22 +241,23 @@ def compute_argument_factorization(S, rank):
     """
     # Extract argument component subgraph
     arg_indices = build_argument_indices(S)
-    AV = [S.nodes[i]['expression'] for i in arg_indices]
+    arg_positions = {si: ai for ai, si in enumerate(arg_indices)}
+    AV = [S.expressions[i] for i in arg_indices]
 
-    # Data structure for building non-argument factors
-    F = ExpressionGraph()
-    # Attach a quick lookup dict for expression to index
-    F.e2i = {}
+    # Vertices of the graph of non-argument factors, with a quick
+    # lookup dict for expression to index
+    FV = []
+    e2i = {}
 
     # Insert arguments as first entries in factorisation graph
     # They will not be connected to other nodes, but will be available
     # and referred to by the factorisation indices of the 'target' nodes.
     for v in AV:
-        graph_insert(F, v)
+        graph_insert(FV, e2i, v)
 
     # Adding 1.0 as an expression allows avoiding special representation
     # of arguments when first visited by representing "v" as "1*v"
-    one_index = graph_insert(F, as_ufl(1.0))
+    one_index = graph_insert(FV, e2i, as_ufl(1.0))
 
     # Intermediate factorization for each vertex in SV on the format
     # SV_factors[si] = None # if SV[si] does not depend on arguments
@@ -265,22 +266,22 @@ def compute_argument_factorization(S, rank):
     #   argkey is a tuple with indices into SV for each of the argument components SV[si] depends on
     # SV_factors[si] = { argkey1: fi1, argkey2: fi2, ... } # if SV[si]
     # is a linear combination of multiple argkey configurations
+    SV_factors = []
 
     # Factorize each subexpression in order:
-    for si, attr in S.nodes.items():
-        deps = S.out_edges[si]
-        v = attr['expression']
+    for si, v in enumerate(S.expressions):
+        deps = S.out_edges(si)
 
-        if si in arg_indices:
+        if si in arg_positions:
             assert len(deps) == 0
             # v is a modified Argument
             factors = {(si, ): one_index}
         else:
-            fac = [S.nodes[d]['factors'] for d in deps]
+            fac = [SV_factors[d] for d in deps]
             if not any(fac):
                 # Entirely scalar (i.e. no arg factors)
                 # Just add unchanged to F
-                graph_insert(F, v)
+                graph_insert(FV, e2i, v)
                 factors = noargs
             else:
                 # Get scalar factors for dependencies
@@ -290,25 +291,23 @@ def compute_argument_factorization(S, rank):
                     if fac[i]:
                         sf.append(None)
                     else:
-                        sf.append(S.nodes[d]['expression'])
+                        sf.append(S.expressions[d])
                 # Use appropriate handler to deal with Sum, Product, etc.
-                factors = handler(v, fac, sf, F)
+                factors = handler(v, fac, sf, FV, e2i)
 
-        attr['factors'] = factors
+        SV_factors.append(factors)
 
-    assert len(F.nodes) == len(F.e2i)
+    assert len(FV) == len(e2i)
 
     # Prepare a mapping from component of expression to factors
     factors = {}
-    S_targets = [i for i, v in S.nodes.items() if v.get('target', False)]
-
-    for S_target in S_targets:
+    for S_target in S.targets():
         # Get the factorizations of the target values
-        if S.nodes[S_target]['factors'] == {}:
+        if SV_factors[S_target] == {}:
             if rank == 0:
                 # Functionals and expressions: store as no args * factor
-                for comp in S.nodes[S_target]["component"]:
-                    factors[comp] = {(): F.e2i[S.nodes[S_target]['expression']]}
+                for comp in S.target_components[S_target]:
+                    factors[comp] = {(): e2i[S.expressions[S_target]]}
             else:
                 # Zero form of arity 1 or higher: make factors empty
                 pass
@@ -316,28 +315,30 @@ def compute_argument_factorization(S, rank):
             # Forms of arity 1 or higher:
             # Map argkeys from indices into SV to indices into AV,
             # and resort keys for canonical representation
-            for argkey, fi in S.nodes[S_target]['factors'].items():
-                ai_fi = {tuple(sorted(arg_indices.index(si) for si in argkey)): fi}
-                for comp in S.nodes[S_target]["component"]:
+            for argkey, fi in SV_factors[S_target].items():
+                ai_fi = {tuple(sorted(arg_positions[si] for si in argkey)): fi}
+                for comp in S.target_components[S_target]:
                     if factors.get(comp):
                         factors[comp].update(ai_fi)
                     else:
                         factors[comp] = ai_fi
 
+    F = ExpressionGraph(FV)
+    F.e2i = e2i
+
     # Indices into F that are needed for final result
     for comp, target in factors.items():
         for argkey, fi in target.items():
-            F.nodes[fi]["target"] = F.nodes[fi].get("target", [])
-            F.nodes[fi]["target"].append(argkey)
-
-            F.nodes[fi]["component"] = F.nodes[fi].get("component", [])
-            F.nodes[fi]["component"].append(comp)
+            F.add_target(fi, comp, argkey)
 
     # Compute dependencies in FV
-    for i, v in F.nodes.items():
-        expr = v['expression']
+    sources = []
+    targets = []
+    for i, expr in enumerate(FV):
         if not expr._ufl_is_terminal_ and not expr._ufl_is_terminal_modifier_:
             for o in expr.ufl_operands:
-                F.add_edge(i, F.e2i[o])
+                sources.append(i)
+                targets.append(e2i[o])
+    F.set_edges(sources, targets)
 
     return F
@@ -17,54 +17,147 @@ from ffcx.ir.analysis.valuenumbering import ValueNumberer
 logger = logging.getLogger("ffcx")
 
 
+# Status of the nodes of a factorization graph, see
+# ffcx.ir.integral.analyse_dependencies
+INACTIVE = 0
+PIECEWISE = 1
+VARYING = 2
+status_codes = {"inactive": INACTIVE, "piecewise": PIECEWISE, "varying": VARYING}
+
+
 class ExpressionGraph(object):
-    """A directed multi-edge graph.
-    ExpressionGraph allows multiple edges between the same nodes,
-    and respects the insertion order of nodes and edges."""
+    """A directed multi-edge graph of expressions, stored in arrays.
+
+    Nodes are numbered 0, ..., n-1 and node i represents the expression
+    expressions[i]. Edges are added in bulk with :meth:`set_edges` and
+    stored in compressed sparse row format in both directions, so that
+    out_edges(i) and in_edges(i) are array slices. Multiple edges
+    between the same nodes are allowed, and the edges of a node are
+    kept in insertion order.
+
+    Node attributes are stored in arrays:
+
+    - target: whether the node is a target of the graph; the components
+      (and, for factorization graphs, the argument keys) of the targets
+      are stored in the dicts target_components and target_argkeys
+    - status: one of INACTIVE, PIECEWISE or VARYING
+    - table_index: index into table_references of the table of the
+      modified terminal, or -1; modified terminals are stored in the
+      dict mts
+    """
+
+    def __init__(self, expressions):
+        self.expressions = list(expressions)
+        n = len(self.expressions)
 
-    def __init__(self):
+        self.target = numpy.zeros(n, dtype=bool)
+        self.target_components = {}
+        self.target_argkeys = {}
+        self.status = numpy.zeros(n, dtype=numpy.int8)
+        self.mts = {}
+        self.table_references = []
+        self.table_index = numpy.full(n, -1, dtype=numpy.int32)
 
-        # Data structures for directed multi-edge graph
-        self.nodes = {}
-        self.out_edges = {}
-        self.in_edges = {}
+        self.set_edges([], [])
 
     def number_of_nodes(self):
-        return len(self.nodes)
+        return len(self.expressions)
+
+    def set_edges(self, sources, targets):
+        """Set the directed edges from sources[k] to targets[k]."""
+        n = len(self.expressions)
+        sources = numpy.asarray(sources, dtype=numpy.int64)
+        targets = numpy.asarray(targets, dtype=numpy.int64)
+        if sources.size and (min(sources.min(), targets.min()) < 0 or max(sources.max(), targets.max()) >= n):
+            raise KeyError("Adding edge to unknown node")
 
-    def add_node(self, key, **kwargs):
-        """Add a node with optional properties."""
-        self.nodes[key] = kwargs
-        self.out_edges[key] = []
-        self.in_edges[key] = []
+        # Stable sorts keep the insertion order of the edges of each node
+        order = numpy.argsort(sources, kind="stable")
+        sources = sources[order]
+        targets = targets[order]
+        self.out_offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(sources, minlength=n), out=self.out_offsets[1:])
+        self.out_indices = targets
+
+        order = numpy.argsort(targets, kind="stable")
+        self.in_offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(targets, minlength=n), out=self.in_offsets[1:])
+        self.in_indices = sources[order]
+
+    def out_edges(self, i):
+        """Return the nodes node i has edges to."""
+        return self.out_indices[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def in_edges(self, i):
+        """Return the nodes with edges to node i."""
+        return self.in_indices[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def targets(self):
+        """Return the target nodes, in order."""
+        return numpy.flatnonzero(self.target)
+
+    def add_target(self, i, component, argkey=None):
+        """Mark node i as a target for a component (and argument key) of the graph."""
+        self.target[i] = True
+        self.target_components.setdefault(i, []).append(component)
+        if argkey is not None:
+            self.target_argkeys.setdefault(i, []).append(argkey)
+
+    def set_table_reference(self, i, tr):
+        """Set the table reference of node i."""
+        self.table_index[i] = len(self.table_references)
+        self.table_references.append(tr)
+
+    def table_reference(self, i):
+        """Return the table reference of node i, or None."""
+        k = self.table_index[i]
+        return None if k < 0 else self.table_references[k]
+
+    def nodes_with_status(self, status):
+        """Return the nodes with the given status ('inactive', 'piecewise' or 'varying'), in order."""
+        return numpy.flatnonzero(self.status == status_codes[status])
+
+    def reachable(self, nodes, reverse=False, mask=None):
+        """Return boolean array of the nodes reachable from nodes.
+
+        Edges are followed backwards if reverse is True. If mask is
+        given, only nodes where mask is True are visited.
+        """
+        if reverse:
+            offsets, indices = self.in_offsets, self.in_indices
+        else:
+            offsets, indices = self.out_offsets, self.out_indices
 
-    def add_edge(self, node1, node2):
-        """Add a directed edge from node1 to node2."""
-        if node1 not in self.nodes or node2 not in self.nodes:
-            raise KeyError("Adding edge to unknown node")
+        visited = numpy.zeros(len(self.expressions), dtype=bool)
+        frontier = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64))
+        if mask is not None:
+            frontier = frontier[mask[frontier]]
+        while frontier.size:
+            visited[frontier] = True
 
-        self.out_edges[node1] += [node2]
-        self.in_edges[node2] += [node1]
+            # Gather the edges of all nodes in the frontier at once
+            starts = offsets[frontier]
+            counts = offsets[frontier + 1] - starts
+            positions = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            frontier = numpy.unique(indices[positions])
+
+            frontier = frontier[~visited[frontier]]
+            if mask is not None:
+                frontier = frontier[mask[frontier]]
+        return visited
 
 
 def build_graph_vertices(expressions, skip_terminal_modifiers=False):
     # Count unique expression nodes
-    G = ExpressionGraph()
-    G.e2i = _count_nodes_with_unique_post_traversal(expressions, skip_terminal_modifiers)
+    e2i = _count_nodes_with_unique_post_traversal(expressions, skip_terminal_modifiers)
 
     # Invert the map to get index->expression
-    GV = sorted(G.e2i, key=G.e2i.get)
-
-    # Add nodes to 'new' graph structure
-    for i, v in enumerate(GV):
-        G.add_node(i, expression=v)
+    G = ExpressionGraph(sorted(e2i, key=e2i.get))
+    G.e2i = e2i
 
     for comp, expr in enumerate(expressions):
         # Get vertex index representing input expression root
-        V_target = G.e2i[expr]
-        G.nodes[V_target]['target'] = True
-        G.nodes[V_target]['component'] = G.nodes[V_target].get("component", [])
-        G.nodes[V_target]['component'].append(comp)
+        G.add_target(G.e2i[expr], comp)
 
     return G
 
@@ -78,24 +171,27 @@ def build_scalar_graph(expression):
     # Build more fine grained computational graph of scalar subexpressions
     scalar_expressions = rebuild_with_scalar_subexpressions(G)
 
+    return build_graph_from_scalar_expressions(scalar_expressions)
+
+
+def build_graph_from_scalar_expressions(scalar_expressions):
+    """Build graph of scalar operations with a target for each of the scalar expressions."""
+
     # Build new list representation of graph where all
     # vertices of V represent single scalar operations
     G = build_graph_vertices(scalar_expressions, skip_terminal_modifiers=True)
 
     # Compute graph edges
-    V_deps = []
-    for i, v in G.nodes.items():
-        expr = v['expression']
-        if expr._ufl_is_terminal_ or expr._ufl_is_terminal_modifier_:
-            V_deps.append(())
-        else:
-            V_deps.append([G.e2i[o] for o in expr.ufl_operands])
-
-    for i, edges in enumerate(V_deps):
-        for j in edges:
-            if i == j:
-                continue
-            G.add_edge(i, j)
+    sources = []
+    targets = []
+    for i, expr in enumerate(G.expressions):
+        if not (expr._ufl_is_terminal_ or expr._ufl_is_terminal_modifier_):
+            for o in expr.ufl_operands:
+                j = G.e2i[o]
+                if i != j:
+                    sources.append(i)
+                    targets.append(j)
+    G.set_edges(sources, targets)
 
     return G
 
@@ -129,8 +225,7 @@ def rebuild_with_scalar_subexpressions(G):
     W = numpy.empty(total_unique_symbols, dtype=object)
 
     # Iterate over each graph node in order
-    for i, v in G.nodes.items():
-        expr = v['expression']
+    for i, expr in enumerate(G.expressions):
         # Find symbols of v components
         vs = V_symbols[i]
 
@@ -54,12 +54,10 @@ class ValueNumberer(object):
         return begin
 
     def get_node_symbols(self, expr):
-        idx = [i for i, v in self.G.nodes.items() if v['expression'] == expr][0]
-        return self.V_symbols[idx]
+        return self.V_symbols[self.G.e2i[expr]]
 
     def compute_symbols(self):
-        for i, v in self.G.nodes.items():
-            expr = v['expression']
+        for expr in self.G.expressions:
             symbol = None
             # First look for exact type match
             f = self.call_lookup.get(type(expr), False)
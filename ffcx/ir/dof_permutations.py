@@ -53,8 +53,10 @@ def face_tangents(ufl_element):
 
     # If the element has sub elements, combine their rotations
     rotations = []
+    offset = 0
     for e in ufl_element.sub_elements():
-        rotations += face_tangents(e)
+        rotations += [(entity, tuple(offset + dof for dof in dofs)) for entity, dofs in face_tangents(e)]
+        offset += len(reflection_entities(e))
     return rotations
 
 
@@ -5,11 +5,18 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 """Tools for precomputed tables of terminal values."""
 
+import bisect
 import collections
+import functools
+import hashlib
 import logging
+import pickle
+import threading
 
 import numpy
 
+import FIAT
+import ffcx
 import ufl
 import ufl.utils.derivativetuples
 from ffcx.fiatinterface import create_element
@@ -24,7 +31,7 @@ default_rtol = 1e-5
 default_atol = 1e-8
 
 table_origin_t = collections.namedtuple(
-    "table_origin", ["element", "avg", "derivatives", "flat_component", "dofrange", "dofmap"])
+    "table_origin_t", ["element", "avg", "derivatives", "flat_component", "dofrange", "dofmap"])
 
 piecewise_ttypes = ("piecewise", "fixed", "ones", "zeros")
 uniform_ttypes = ("fixed", "ones", "zeros", "uniform")
@@ -32,10 +39,14 @@ uniform_ttypes = ("fixed", "ones", "zeros", "uniform")
 valid_ttypes = set(("quadrature", )) | set(piecewise_ttypes) | set(uniform_ttypes)
 
 unique_table_reference_t = collections.namedtuple(
-    "unique_table_reference",
+    "unique_table_reference_t",
     ["name", "values", "dofrange", "dofmap", "original_dim", "ttype", "is_piecewise", "is_uniform",
      "is_permuted"])
 
+# Factorization of a table on a tensor product grid of points, see
+# factorize_tensor_product_table
+tensor_factors_t = collections.namedtuple("tensor_factors_t", ["tables", "columns", "scales"])
+
 
 # TODO: Get restriction postfix from somewhere central
 def ufc_restriction_offset(restriction, length):
@@ -93,6 +104,88 @@ def strip_table_zeros(table, rtol=default_rtol, atol=default_atol):
     return dofrange, dofmap, stripped_table
 
 
+class TableIndex(object):
+    """Index for finding a table equal (see equal_tables) to a given table.
+
+    Tables are bucketed by shape. Within a bucket, tables are sorted by
+    a projection p(u) = sum(w*u) with fixed positive pseudo-random
+    weights w. If allclose(u, t) or allclose(t, u) holds, then
+
+        |p(u) - p(t)| <= sum(w*(atol + rtol*(|t| + atol)/(1 - rtol))),
+
+    so only tables with a projection in this window need to be compared
+    with equal_tables. The window is a necessary condition, so the
+    result is exactly that of comparing with all tables, and candidates
+    are compared in the order they were added to keep the first match.
+    """
+
+    def __init__(self, rtol=default_rtol, atol=default_atol):
+        self.rtol = rtol
+        self.atol = atol
+        # {shape: (weights, sorted projections, table numbers in same order)}
+        self._buckets = {}
+        # Tables with non-finite values, compared one by one
+        self._nonfinite = []
+        self._tables = []
+        self._removed = set()
+
+    def _bucket(self, shape):
+        bucket = self._buckets.get(shape)
+        if bucket is None:
+            weights = numpy.random.RandomState(0).uniform(0.5, 1.5, size=shape)
+            bucket = (weights, [], [])
+            self._buckets[shape] = bucket
+        return bucket
+
+    def add(self, table):
+        """Add table to the index, returning its number."""
+        table = numpy.asarray(table)
+        i = len(self._tables)
+        self._tables.append(table)
+        weights, projections, numbers = self._bucket(table.shape)
+        p = numpy.sum(weights * table)
+        if numpy.isfinite(p):
+            k = bisect.bisect_right(projections, p)
+            projections.insert(k, p)
+            numbers.insert(k, i)
+        else:
+            self._nonfinite.append(i)
+        return i
+
+    def remove(self, i):
+        """Exclude table number i from further searches."""
+        self._removed.add(i)
+
+    def find(self, table, relative_to_added=False):
+        """Return number of the first added table equal to table, or -1 if none.
+
+        Equality is equal_tables(added, table), with the tolerance
+        relative to table, or equal_tables(table, added) if
+        relative_to_added is True.
+        """
+        table = numpy.asarray(table)
+        weights, projections, numbers = self._bucket(table.shape)
+        p = numpy.sum(weights * table)
+        if numpy.isfinite(p):
+            bound = numpy.sum(weights * (self.atol + self.rtol * (abs(table) + self.atol) / (1 - self.rtol)))
+            # Allow for rounding errors in the projections
+            magnitude = numpy.sum(weights * abs(table))
+            bound += 4 * table.size * numpy.finfo(float).eps * (2 * magnitude + bound)
+            begin = bisect.bisect_left(projections, p - bound)
+            end = bisect.bisect_right(projections, p + bound)
+            candidates = sorted(numbers[begin:end])
+        else:
+            candidates = self._nonfinite
+
+        for i in candidates:
+            if i in self._removed:
+                continue
+            a, b = (table, self._tables[i]) if relative_to_added else (self._tables[i], table)
+            if equal_tables(a, b, rtol=self.rtol, atol=self.atol):
+                return i
+        return -1
+
+
 def build_unique_tables(tables, rtol=default_rtol, atol=default_atol):
     """Return list of unique tables.
 
@@ -100,6 +193,7 @@ def build_unique_tables(tables, rtol=default_rtol, atol=default_atol):
     and a dict of unique table indices for each input table key."""
     unique = []
     mapping = {}
+    index = TableIndex(rtol=rtol, atol=atol)
 
     if isinstance(tables, list):
         keys = list(range(len(tables)))
@@ -108,19 +202,99 @@ def build_unique_tables(tables, rtol=default_rtol, atol=default_atol):
 
     for k in keys:
         t = tables[k]
-        found = -1
-        for i, u in enumerate(unique):
-            if equal_tables(u, t, rtol=rtol, atol=atol):
-                found = i
-                break
-        if found == -1:
-            i = len(unique)
+        i = index.find(t)
+        if i == -1:
+            i = index.add(t)
             unique.append(t)
         mapping[k] = i
 
     return unique, mapping
 
 
+class TabulationCache(object):
+    """Least recently used cache of FIAT element tabulations.
+
+    Tabulations are keyed on the UFL element (and index of the FIAT
+    sub element, for mixed elements), the derivative order and a hash
+    of the points, and are shared by all integrals and forms compiled by
+    the process. The memory used by the cached tables is bounded by
+    ``max_size`` bytes. The cache can be saved to and loaded from disk
+    to share tabulations between processes.
+    """
+
+    def __init__(self, max_size=256 * 1024**2):
+        self.max_size = max_size
+        self.size = 0
+        self._tables = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def tabulate(self, ufl_element, sub_element_index, deriv_order, points):
+        """Return FIAT tabulation (read-only) of element, or of sub element if sub_element_index is given."""
+        points = numpy.ascontiguousarray(points, dtype=numpy.float64)
+        key = (repr(ufl_element), sub_element_index, deriv_order, points.shape,
+               hashlib.sha1(points.tobytes()).hexdigest())
+        with self._lock:
+            tabulation = self._tables.get(key)
+            if tabulation is not None:
+                self._tables.move_to_end(key)
+                return tabulation
+
+        fiat_element = create_element(ufl_element)
+        if sub_element_index is not None:
+            fiat_element = fiat_element.elements()[sub_element_index]
+        tabulation = fiat_element.tabulate(deriv_order, points)
+        for tbl in tabulation.values():
+            tbl.setflags(write=False)
+
+        self._insert(key, tabulation)
+        return tabulation
+
+    def _insert(self, key, tabulation):
+        with self._lock:
+            if key in self._tables:
+                return
+            self._tables[key] = tabulation
+            self.size += sum(tbl.nbytes for tbl in tabulation.values())
+            while self.size > self.max_size and len(self._tables) > 1:
+                _, evicted = self._tables.popitem(last=False)
+                self.size -= sum(tbl.nbytes for tbl in evicted.values())
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self.size = 0
+
+    def save(self, filename):
+        """Save the cached tabulations to file."""
+        with self._lock:
+            tables = list(self._tables.items())
+        with open(filename, "wb") as f:
+            pickle.dump((_tabulation_cache_version(), tables), f)
+
+    def load(self, filename):
+        """Add tabulations saved with another process to the cache.
+
+        Files saved with other versions of FFCX or FIAT are ignored.
+        """
+        with open(filename, "rb") as f:
+            version, tables = pickle.load(f)
+        if version != _tabulation_cache_version():
+            logger.info("Ignoring tabulation cache {} from other version".format(filename))
+            return
+        for key, tabulation in tables:
+            for tbl in tabulation.values():
+                tbl.setflags(write=False)
+            self._insert(key, tabulation)
+
+
+def _tabulation_cache_version():
+    return (ffcx.__version__, FIAT.__version__)
+
+
+# Tabulations shared by all compilations in this process
+tabulation_cache = TabulationCache()
+
+
 def get_ffcx_table_values(points, cell, integral_type, ufl_element, avg, entitytype,
                           derivative_counts, flat_component):
     """Extract values from ffcx element table.
@@ -128,7 +302,21 @@ def get_ffcx_table_values(points, cell, integral_type, ufl_element, avg, entityt
     Returns a 3D numpy array with axes
     (entity number, quadrature point number, dof number)
     """
+    return get_ffcx_permuted_table_values([points], cell, integral_type, ufl_element, avg, entitytype,
+                                          derivative_counts, flat_component)[0]
+
+
+def get_ffcx_permuted_table_values(permuted_points, cell, integral_type, ufl_element, avg, entitytype,
+                                   derivative_counts, flat_component):
+    """Extract values from ffcx element table for a list of permutations of the points.
+
+    The points of all permutations and entities are tabulated at once.
+
+    Returns a 4D numpy array with axes
+    (permutation number, entity number, quadrature point number, dof number)
+    """
     deriv_order = sum(derivative_counts)
+    num_perms = len(permuted_points)
 
     if integral_type in ufl.custom_integral_types:
         # Use quadrature points on cell for analysis in custom integral types
@@ -142,9 +330,6 @@ def get_ffcx_table_values(points, cell, integral_type, ufl_element, avg, entityt
     if avg in ("cell", "facet"):
         # Redefine points to compute average tables
 
-        # Make sure this is not called with points, that doesn't make sense
-        # assert points is None
-
         # Not expecting derivatives of averages
         assert not any(derivative_counts)
         assert deriv_order == 0
@@ -156,43 +341,45 @@ def get_ffcx_table_values(points, cell, integral_type, ufl_element, avg, entityt
         elif avg == "facet":
             integral_type = "exterior_facet"
 
-        # Make quadrature rule and get points and weights
+        # Make quadrature rule and get points and weights. The average
+        # doesn't depend on the permutation, so tabulate it only once.
         points, weights = create_quadrature_points_and_weights(integral_type, cell,
                                                                ufl_element.degree(), "default")
+        permuted_points = [points]
 
-    # Tabulate table of basis functions and derivatives in points for each entity
+    # Stack the points of all permutations and entities, with axes
+    # (permutation, entity, point)
     tdim = cell.topological_dimension()
     entity_dim = integral_type_to_entity_dim(integral_type, tdim)
     num_entities = ufl.cell.num_cell_entities[cell.cellname()][entity_dim]
-
-    fiat_element = create_element(ufl_element)
-
-    # Extract arrays for the right scalar component
-    component_tables = []
+    all_points = numpy.concatenate([map_integral_points(points, integral_type, cell, entity)
+                                    for points in permuted_points
+                                    for entity in range(num_entities)])
+    num_points = all_points.shape[0] // (len(permuted_points) * num_entities)
+
+    # Tabulate table of basis functions and derivatives in all points,
+    # and extract array for the right scalar component, with axes
+    # (dof, point)
     sh = ufl_element.value_shape()
     if sh == ():
         # Scalar valued element
-        for entity in range(num_entities):
-            entity_points = map_integral_points(points, integral_type, cell, entity)
-            tbl = fiat_element.tabulate(deriv_order, entity_points)[derivative_counts]
-            component_tables.append(tbl)
+        tbl = tabulation_cache.tabulate(ufl_element, None, deriv_order, all_points)[derivative_counts]
     elif len(sh) > 0 and ufl_element.num_sub_elements() == 0:
         # 2-tensor-valued elements, not a tensor product
         # mapping flat_component back to tensor component
         (_, f2t) = ufl.permutation.build_component_numbering(sh, ufl_element.symmetry())
         t_comp = f2t[flat_component]
 
-        for entity in range(num_entities):
-            entity_points = map_integral_points(points, integral_type, cell, entity)
-            tbl = fiat_element.tabulate(deriv_order, entity_points)[derivative_counts]
-            if len(sh) == 1:
-                component_tables.append(tbl[:, t_comp[0], :])
-            elif len(sh) == 2:
-                component_tables.append(tbl[:, t_comp[0], t_comp[1], :])
-            else:
-                raise RuntimeError("Cannot tabulate tensor valued element with rank > 2")
+        tbl = tabulation_cache.tabulate(ufl_element, None, deriv_order, all_points)[derivative_counts]
+        if len(sh) == 1:
+            tbl = tbl[:, t_comp[0], :]
+        elif len(sh) == 2:
+            tbl = tbl[:, t_comp[0], t_comp[1], :]
+        else:
+            raise RuntimeError("Cannot tabulate tensor valued element with rank > 2")
     else:
         # Vector-valued or mixed element
+        fiat_element = create_element(ufl_element)
         sub_dims = [0] + list(e.space_dimension() for e in fiat_element.elements())
         sub_cmps = [0] + list(numpy.prod(e.value_shape(), dtype=int)
                               for e in fiat_element.elements())
@@ -205,44 +392,26 @@ def get_ffcx_table_values(points, cell, integral_type, ufl_element, avg, entityt
         ir = irange[component_element_index:component_element_index + 2]
         cr = crange[component_element_index:component_element_index + 2]
 
-        component_element = fiat_element.elements()[component_element_index]
-
-        # Follows from FIAT's MixedElement tabulation
-        # Tabulating MixedElement in FIAT would result in tabulated subelements
-        # padded with zeros
-        for entity in range(num_entities):
-            entity_points = map_integral_points(points, integral_type, cell, entity)
-
-            # Tabulate subelement, this is dense nonzero table, [a, b, c]
-            tbl = component_element.tabulate(deriv_order, entity_points)[derivative_counts]
+        # Tabulate subelement, this is dense nonzero table, [a, b, c]
+        sub_tbl = tabulation_cache.tabulate(ufl_element, int(component_element_index), deriv_order,
+                                            all_points)[derivative_counts]
+        sub_tbl = sub_tbl.reshape(ir[1] - ir[0], cr[1] - cr[0], -1)
 
-            # Prepare a padded table with zeros
-            padded_shape = (fiat_element.space_dimension(),) + fiat_element.value_shape() + (len(entity_points), )
-            padded_tbl = numpy.zeros(padded_shape, dtype=tbl.dtype)
+        # Follows from FIAT's MixedElement tabulation: the subelement
+        # table padded with zeros for the dofs of the other subelements
+        tbl = numpy.zeros((fiat_element.space_dimension(), all_points.shape[0]), dtype=sub_tbl.dtype)
+        tbl[slice(*ir)] = sub_tbl[:, flat_component - cr[0], :]
 
-            tab = tbl.reshape(ir[1] - ir[0], cr[1] - cr[0], -1)
-            padded_tbl[slice(*ir), slice(*cr)] = tab
-
-            component_tables.append(padded_tbl[:, flat_component, :])
+    num_dofs = tbl.shape[0]
+    tbl = tbl.reshape(num_dofs, len(permuted_points), num_entities, num_points)
 
     if avg in ("cell", "facet"):
         # Compute numeric integral of the each component table
-        wsum = sum(weights)
-        for entity, tbl in enumerate(component_tables):
-            num_dofs = tbl.shape[0]
-            tbl = numpy.dot(tbl, weights) / wsum
-            tbl = numpy.reshape(tbl, (num_dofs, 1))
-            component_tables[entity] = tbl
-
-    # Loop over entities and fill table blockwise (each block = points x dofs)
-    # Reorder axes as (points, dofs) instead of (dofs, points)
-    assert len(component_tables) == num_entities
-    num_dofs, num_points = component_tables[0].shape
-    shape = (num_entities, num_points, num_dofs)
-    res = numpy.zeros(shape)
-    for entity in range(num_entities):
-        res[entity, :, :] = numpy.transpose(component_tables[entity])
-    return res
+        tbl = numpy.dot(tbl, weights)[..., numpy.newaxis] / sum(weights)
+        tbl = numpy.broadcast_to(tbl, (num_dofs, num_perms, num_entities, 1))
+
+    # Reorder axes as (permutation, entity, points, dofs)
+    return numpy.array(numpy.transpose(tbl, (1, 2, 3, 0)), dtype=numpy.float64)
 
 
 def generate_psi_table_name(quadrature_rule, element_counter, averaged, entitytype, derivative_counts,
@@ -335,42 +504,49 @@ def get_modified_terminal_element(mt):
 
 
 def permute_quadrature_interval(points, reflections=0):
-    output = points.copy()
-    for p in output:
-        assert len(p) < 2 or numpy.isclose(p[1], 0)
-        assert len(p) < 3 or numpy.isclose(p[2], 0)
+    output = numpy.array(points, dtype=numpy.float64)
+    assert output.shape[1] < 2 or numpy.allclose(output[:, 1], 0)
+    assert output.shape[1] < 3 or numpy.allclose(output[:, 2], 0)
     for i in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [1 - p[0]]
+        output[:] = (1 - output[:, 0])[:, numpy.newaxis]
     return output
 
 
 def permute_quadrature_triangle(points, reflections=0, rotations=0):
-    output = points.copy()
-    for p in output:
-        assert len(p) < 3 or numpy.isclose(p[2], 0)
+    output = numpy.array(points, dtype=numpy.float64)
+    assert output.shape[1] < 3 or numpy.allclose(output[:, 2], 0)
     for i in range(rotations):
-        for n, p in enumerate(output):
-            output[n] = [p[1], 1 - p[0] - p[1]]
+        output[:] = numpy.column_stack((output[:, 1], 1 - output[:, 0] - output[:, 1]))
     for i in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [p[1], p[0]]
+        output[:] = output[:, ::-1]
     return output
 
 
 def permute_quadrature_quadrilateral(points, reflections=0, rotations=0):
-    output = points.copy()
-    for p in output:
-        assert len(p) < 3 or numpy.isclose(p[2], 0)
+    output = numpy.array(points, dtype=numpy.float64)
+    assert output.shape[1] < 3 or numpy.allclose(output[:, 2], 0)
     for i in range(rotations):
-        for n, p in enumerate(output):
-            output[n] = [p[1], 1 - p[0]]
+        output[:] = numpy.column_stack((output[:, 1], 1 - output[:, 0]))
     for i in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [p[1], p[0]]
+        output[:] = output[:, ::-1]
     return output
 
 
+def permute_quadrature_points(points, cell):
+    """Return the permutations of facet quadrature points for each reflection and rotation of a facet."""
+    tdim = cell.topological_dimension()
+    if tdim == 1:
+        return [points]
+    elif tdim == 2:
+        return [permute_quadrature_interval(points, ref) for ref in range(2)]
+    elif cell.cellname() == "tetrahedron":
+        return [permute_quadrature_triangle(points, ref, rot) for rot in range(3) for ref in range(2)]
+    elif cell.cellname() == "hexahedron":
+        return [permute_quadrature_quadrilateral(points, ref, rot) for rot in range(4) for ref in range(2)]
+    else:
+        raise RuntimeError("Cannot permute facet quadrature points of cell {}".format(cell.cellname()))
+
+
 def build_element_tables(quadrature_rule,
                          cell,
                          integral_type,
@@ -417,49 +593,13 @@ def build_element_tables(quadrature_rule,
         name = generate_psi_table_name(quadrature_rule, element_number, avg, entitytype,
                                        local_derivatives, flat_component)
         if name not in tables:
-            tdim = cell.topological_dimension()
             if entitytype == "facet":
-                if tdim == 1:
-                    tables[name] = numpy.array([
-                        get_ffcx_table_values(quadrature_rule.points, cell,
-                                              integral_type, element, avg, entitytype,
-                                              local_derivatives, flat_component)])
-                elif tdim == 2:
-                    # Extract the values of the table from ffc table format
-                    new_table = []
-                    for ref in range(2):
-                        new_table.append(get_ffcx_table_values(
-                            permute_quadrature_interval(quadrature_rule.points, ref),
-                            cell, integral_type, element, avg, entitytype, local_derivatives, flat_component))
-
-                    tables[name] = numpy.array(new_table)
-                elif tdim == 3:
-                    cell_type = cell.cellname()
-                    if cell_type == "tetrahedron":
-                        # Extract the values of the table from ffc table format
-                        new_table = []
-                        for rot in range(3):
-                            for ref in range(2):
-                                new_table.append(get_ffcx_table_values(
-                                    permute_quadrature_triangle(quadrature_rule.points, ref, rot),
-                                    cell, integral_type, element, avg, entitytype, local_derivatives, flat_component))
-
-                        tables[name] = numpy.array(new_table)
-                    elif cell_type == "hexahedron":
-                        # Extract the values of the table from ffc table format
-                        new_table = []
-                        for rot in range(4):
-                            for ref in range(2):
-                                new_table.append(get_ffcx_table_values(
-                                    permute_quadrature_quadrilateral(quadrature_rule.points, ref, rot),
-                                    cell, integral_type, element, avg, entitytype, local_derivatives, flat_component))
-
-                        tables[name] = numpy.array(new_table)
+                # Tabulate for each reflection and rotation of the facet
+                permuted_points = permute_quadrature_points(quadrature_rule.points, cell)
             else:
-                # Extract the values of the table from ffc table format
-                tables[name] = numpy.array([get_ffcx_table_values(quadrature_rule.points, cell,
-                                                                  integral_type, element, avg, entitytype,
-                                                                  local_derivatives, flat_component)])
+                permuted_points = [quadrature_rule.points]
+            tables[name] = get_ffcx_permuted_table_values(permuted_points, cell, integral_type, element, avg,
+                                                          entitytype, local_derivatives, flat_component)
 
             # Track table origin for custom integrals:
             table_origins[name] = res
@@ -639,6 +779,107 @@ def analyse_table_types(unique_tables, rtol=default_rtol, atol=default_atol):
     }
 
 
+def tensor_product_grid(points):
+    """Return the shape (n_0, ..., n_{d-1}) of the grid if the points are a tensor product grid, otherwise None.
+
+    The points must be ordered lexicographically, with the last
+    coordinate running fastest, as in the quadrature rules of FIAT on
+    quadrilaterals and hexahedra.
+    """
+    points = numpy.asarray(points)
+    axes = [numpy.unique(points[:, k]) for k in range(points.shape[1])]
+    shape = tuple(len(x) for x in axes)
+    if numpy.product(shape) != points.shape[0]:
+        return None
+    grid = numpy.stack(numpy.meshgrid(*axes, indexing="ij"), axis=-1).reshape(points.shape)
+    if not numpy.array_equal(grid, points):
+        return None
+    return shape
+
+
+def factorize_tensor_product_table(table, grid_shape, rtol=default_rtol, atol=default_atol):
+    """Factorize a table on a tensor product grid of points into one dimensional tables.
+
+    Table is a 2D array with axes (point, column). Returns
+    tensor_factors_t with
+
+    - tables: list of arrays T_k with axes (point, index) along each
+      axis k of the grid
+    - columns: array with the column of the table for each
+      multi-index (i_0, ..., i_{d-1})
+    - scales: array with the scale factor for each multi-index
+
+    such that table[q, columns[i]] = scales[i] * prod_k T_k[q_k, i_k],
+    where (q_0, ..., q_{d-1}) is the multi-index of point q on the
+    grid. Returns None if the table can not be factorized.
+    """
+    num_points, num_columns = table.shape
+    d = len(grid_shape)
+    values = table.reshape(tuple(grid_shape) + (num_columns, ))
+
+    unique_vectors = [[] for k in range(d)]
+    multi_indices = []
+    scales = []
+    for c in range(num_columns):
+        x = values[..., c]
+        imax = numpy.unravel_index(numpy.argmax(abs(x)), x.shape)
+        if abs(x[imax]) <= atol:
+            return None
+
+        # Vectors along each axis through the largest value, scaled to
+        # have 1 as first largest value
+        vectors = []
+        for k in range(d):
+            v = x[imax[:k] + (slice(None), ) + imax[k + 1:]]
+            v = v / v[numpy.argmax(numpy.round(abs(v) / abs(v).max(), 8))]
+            vectors.append(v)
+        outer = functools.reduce(numpy.multiply.outer, vectors)
+        scale = x[imax] / outer[imax]
+        if not numpy.allclose(x, scale * outer, rtol=rtol, atol=atol):
+            return None
+
+        multi_index = []
+        for k, v in enumerate(vectors):
+            for i, u in enumerate(unique_vectors[k]):
+                if numpy.allclose(u, v, rtol=rtol, atol=atol):
+                    break
+            else:
+                i = len(unique_vectors[k])
+                unique_vectors[k].append(v)
+            multi_index.append(i)
+        multi_indices.append(tuple(multi_index))
+        scales.append(scale)
+
+    # Each multi-index must correspond to exactly one column
+    shape = tuple(len(vectors) for vectors in unique_vectors)
+    if len(set(multi_indices)) != num_columns or numpy.product(shape) != num_columns:
+        return None
+    columns = numpy.zeros(shape, dtype=int)
+    scale_values = numpy.zeros(shape)
+    for c, multi_index in enumerate(multi_indices):
+        columns[multi_index] = c
+        scale_values[multi_index] = scales[c]
+
+    tables = [numpy.array(vectors).T for vectors in unique_vectors]
+    return tensor_factors_t(tables, columns, scale_values)
+
+
+def integrate_block(weights, tables, num_entities):
+    """Integrate the product of the argument tables of a block with quadrature weights.
+
+    Each table is a 3D array with axes (entity, point, dof), with a
+    single entity if it is equal on all entities. Returns a table with
+    axes (entity, dof_0, ..., dof_{r-1}).
+    """
+    indices = "ijklmnop"[:len(tables)]
+    subscripts = "q," + ",".join("q" + i for i in indices) + "->" + indices
+    ptable = numpy.zeros((num_entities, ) + tuple(table.shape[-1] for table in tables))
+    for entity in range(num_entities):
+        ptable[entity] = numpy.einsum(subscripts, weights,
+                                      *[table[entity if table.shape[0] > 1 else 0] for table in tables])
+    return ptable
+
+
 def build_optimized_tables(quadrature_rule,
                            cell,
                            integral_type,
@@ -691,16 +932,16 @@ def build_optimized_tables(quadrature_rule,
     # (i.e. tables from other contexts that have been compressed to look the same)
     name_map = {}
     existing_names = sorted(existing_tables)
+    existing_index = TableIndex(rtol=rtol, atol=atol)
+    for ename in existing_names:
+        existing_index.add(existing_tables[ename])
     for uname in sorted(unique_tables):
-        utbl = unique_tables[uname]
-        for i, ename in enumerate(existing_names):
-            etbl = existing_tables[ename]
-            if equal_tables(utbl, etbl, rtol=rtol, atol=atol):
-                # Setup table name mapping
-                name_map[uname] = ename
-                # Don't visit this table again (just to avoid the processing)
-                existing_names.pop(i)
-                break
+        i = existing_index.find(unique_tables[uname], relative_to_added=True)
+        if i != -1:
+            # Setup table name mapping
+            name_map[uname] = existing_names[i]
+            # Don't visit this table again (just to avoid the processing)
+            existing_index.remove(i)
 
     # Replace unique table names
     for uname, ename in name_map.items():
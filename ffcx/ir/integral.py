@@ -12,13 +12,17 @@ import logging
 import numpy
 
 import ufl
+from ffcx import instrumentation
 from ffcx.ir.analysis.factorization import \
     compute_argument_factorization
-from ffcx.ir.analysis.graph import build_scalar_graph
+from ffcx.ir.analysis.graph import (INACTIVE, PIECEWISE, VARYING, build_graph_from_scalar_expressions,
+                                    build_scalar_graph)
 from ffcx.ir.analysis.modified_terminals import (
     analyse_modified_terminal, is_modified_terminal)
 from ffcx.ir.analysis.visualise import visualise_graph
-from ffcx.ir.elementtables import build_optimized_tables
+from ffcx.ir.elementtables import (build_optimized_tables, clamp_table_small_numbers,
+                                   factorize_tensor_product_table, integrate_block,
+                                   tensor_product_grid)
 from ufl.algorithms.balancing import balance_modifiers
 from ufl.checks import is_cellwise_constant
 from ufl.classes import QuadratureWeight
@@ -62,6 +66,23 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
     ir["table_dof_face_tangents"] = {}
     ir["table_dof_reflection_entities"] = {}
 
+    # Reflections and rotations of the dofs of the arguments (by number)
+    # and coefficients, applied to the element tensor and coefficient
+    # dofs instead of the tables
+    ir["argument_dof_transformations"] = {}
+    ir["coefficient_dof_transformations"] = {}
+    post_transformations = (p["dof_transformations"] == "post"
+                            and integral_type in ("cell", "exterior_facet", "vertex"))
+
+    # True if only the upper triangle of the symmetric element tensor
+    # of a bilinear form is accumulated, checked for each integrand
+    # below
+    ir["symmetric"] = (p["symmetric_tensor"] != "none" and integral_type in ("cell", "exterior_facet")
+                       and len(argument_shape) == 2 and argument_shape[0] == argument_shape[1])
+
+    # Number of preintegrated tables, used to name them uniquely
+    num_preintegrated_tables = 0
+
     for quadrature_rule, integrand in integrands.items():
 
         expression = integrand
@@ -81,53 +102,82 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
         # efficiently before argument factorization. We can build
         # terminal_data again after factorization if that's necessary.
 
-        initial_terminals = {i: analyse_modified_terminal(v['expression'])
-                             for i, v in S.nodes.items()
-                             if is_modified_terminal(v['expression'])}
-
-        (unique_tables, unique_table_types, unique_table_num_dofs,
-         mt_unique_table_reference, table_origins) = build_optimized_tables(
-            quadrature_rule,
-            cell,
-            integral_type,
-            entitytype,
-            initial_terminals.values(),
-            ir["unique_tables"],
-            rtol=p["table_rtol"],
-            atol=p["table_atol"])
+        initial_terminals = {i: analyse_modified_terminal(v)
+                             for i, v in enumerate(S.expressions)
+                             if is_modified_terminal(v)}
+
+        with instrumentation.section("build_optimized_tables"):
+            (unique_tables, unique_table_types, unique_table_num_dofs,
+             mt_unique_table_reference, table_origins) = build_optimized_tables(
+                quadrature_rule,
+                cell,
+                integral_type,
+                entitytype,
+                initial_terminals.values(),
+                ir["unique_tables"],
+                rtol=p["table_rtol"],
+                atol=p["table_atol"])
 
         for k, v in table_origins.items():
-            ir["table_dof_face_tangents"][k] = dof_permutations.face_tangents(v[0])
-            ir["table_dof_reflection_entities"][k] = dof_permutations.reflection_entities(v[0])
+            if post_transformations:
+                ir["table_dof_face_tangents"][k] = []
+                ir["table_dof_reflection_entities"][k] = []
+            else:
+                ir["table_dof_face_tangents"][k] = dof_permutations.face_tangents(v[0])
+                ir["table_dof_reflection_entities"][k] = dof_permutations.reflection_entities(v[0])
+
+        if post_transformations:
+            for mt in initial_terminals.values():
+                if isinstance(mt.terminal, ufl.classes.Argument):
+                    transformations = ir["argument_dof_transformations"]
+                    key = mt.terminal.number()
+                elif isinstance(mt.terminal, ufl.classes.Coefficient):
+                    transformations = ir["coefficient_dof_transformations"]
+                    key = mt.terminal
+                else:
+                    continue
+                if key not in transformations:
+                    element = mt.terminal.ufl_element()
+                    reflections = dof_permutations.reflection_entities(element)
+                    rotations = dof_permutations.face_tangents(element)
+                    if rotations or any(e is not None for e in reflections):
+                        transformations[key] = (reflections, rotations)
 
         for td in mt_unique_table_reference.values():
             ir["table_dofmaps"][td.name] = td.dofmap
 
-        S_targets = [i for i, v in S.nodes.items() if v.get('target', False)]
+        S_targets = S.targets()
 
-        if 'zeros' in unique_table_types.values() and len(S_targets) == 1:
+        if 'zeros' in unique_table_types.values():
             # If there are any 'zero' tables, replace symbolically and rebuild graph
-            #
-            # TODO: Implement zero table elimination for non-scalar graphs
             for i, mt in initial_terminals.items():
                 # Set modified terminals with zero tables to zero
                 tr = mt_unique_table_reference.get(mt)
                 if tr is not None and tr.ttype == "zeros":
-                    S.nodes[i]['expression'] = ufl.as_ufl(0.0)
+                    S.expressions[i] = ufl.as_ufl(0.0)
 
             # Propagate expression changes using dependency list
-            for i, v in S.nodes.items():
-                deps = [S.nodes[j]['expression'] for j in S.out_edges[i]]
+            for i, v in enumerate(S.expressions):
+                deps = [S.expressions[j] for j in S.out_edges(i)]
                 if deps:
-                    v['expression'] = v['expression']._ufl_expr_reconstruct_(*deps)
+                    S.expressions[i] = v._ufl_expr_reconstruct_(*deps)
 
             # Rebuild scalar target expressions and graph (this may be
             # overkill and possible to optimize away if it turns out to be
             # costly)
-            expression = S.nodes[S_targets[0]]['expression']
+            if not expression.ufl_shape:
+                expression = S.expressions[S_targets[0]]
 
-            # Rebuild scalar list-based graph representation
-            S = build_scalar_graph(expression)
+                # Rebuild scalar list-based graph representation
+                S = build_scalar_graph(expression)
+            else:
+                # One scalar expression for each component of a tensor
+                # valued expression
+                scalar_expressions = [None] * sum(len(c) for c in S.target_components.values())
+                for i in S_targets:
+                    for comp in S.target_components[i]:
+                        scalar_expressions[comp] = S.expressions[i]
+                S = build_graph_from_scalar_expressions(scalar_expressions)
 
         # Output diagnostic graph as pdf
         if visualise:
@@ -135,21 +185,22 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
 
         # Compute factorization of arguments
         rank = len(argument_shape)
-        F = compute_argument_factorization(S, rank)
+        with instrumentation.section("factorization"):
+            F = compute_argument_factorization(S, rank)
 
         # Get the 'target' nodes that are factors of arguments, and insert in dict
-        FV_targets = [i for i, v in F.nodes.items() if v.get('target', False)]
         argument_factorization = {}
 
-        for fi in FV_targets:
+        for fi in F.targets():
             # Number of blocks using this factor must agree with number of components
             # to which this factor contributes. I.e. there are more blocks iff there are more
             # components
-            assert len(F.nodes[fi]['target']) == len(F.nodes[fi]['component'])
+            fi = int(fi)
+            assert len(F.target_argkeys[fi]) == len(F.target_components[fi])
 
             k = 0
-            for w in F.nodes[fi]['target']:
-                comp = F.nodes[fi]['component'][k]
+            for w in F.target_argkeys[fi]:
+                comp = F.target_components[fi][k]
                 argument_factorization[w] = argument_factorization.get(w, [])
 
                 # Store tuple of (factor index, component index)
@@ -168,24 +219,25 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
 
         # Build set of modified_terminals for each mt factorized vertex in F
         # and attach tables, if appropriate
-        for i, v in F.nodes.items():
-            expr = v['expression']
+        for i, expr in enumerate(F.expressions):
             if is_modified_terminal(expr):
                 mt = analyse_modified_terminal(expr)
-                F.nodes[i]['mt'] = mt
+                F.mts[i] = mt
                 tr = mt_unique_table_reference.get(mt)
                 if tr is not None:
-                    F.nodes[i]['tr'] = tr
+                    F.set_table_reference(i, tr)
 
         # Attach 'status' to each node: 'inactive', 'piecewise' or 'varying'
         analyse_dependencies(F, mt_unique_table_reference)
 
         # Loop over factorization terms
         block_contributions = collections.defaultdict(list)
+        preintegrated_tables = {}
+        preintegrated_names = {}
         for ma_indices, fi_ci in sorted(argument_factorization.items()):
             # Get a bunch of information about this term
             assert rank == len(ma_indices)
-            trs = tuple(F.nodes[ai]['tr'] for ai in ma_indices)
+            trs = tuple(F.table_reference(ai) for ai in ma_indices)
 
             unames = tuple(tr.name for tr in trs)
             ttypes = tuple(tr.ttype for tr in trs)
@@ -201,13 +253,13 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
                 if trs[i].is_uniform:
                     r = None
                 else:
-                    r = F.nodes[ai]['mt'].restriction
+                    r = F.mts[ai].restriction
 
                 block_restrictions.append(r)
             block_restrictions = tuple(block_restrictions)
 
             # Check if each *each* factor corresponding to this argument is piecewise
-            all_factors_piecewise = all(F.nodes[ifi[0]]["status"] == 'piecewise' for ifi in fi_ci)
+            all_factors_piecewise = all(F.status[ifi[0]] == PIECEWISE for ifi in fi_ci)
             block_is_permuted = False
             for n in unames:
                 if unique_tables[n].shape[0] > 1:
@@ -218,26 +270,52 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
 
             block_is_transposed = False  # FIXME: Handle transposes for these block types
 
+            # Blocks with factors constant over the cell are integrated
+            # here, and only scaled by the factors in the generated code
+            # (tables of dofs which are transformed at runtime are not
+            # preintegrated)
+            pname = None
+            if (p["preintegration"] and all_factors_piecewise and rank > 0
+                    and integral_type in ("cell", "exterior_facet") and not block_is_permuted
+                    and "quadrature" not in ttypes
+                    and not any(ir["table_dof_face_tangents"][n] for n in unames)
+                    and not any(e is not None for n in unames for e in ir["table_dof_reflection_entities"][n])):
+                pname = preintegrated_names.get(unames)
+                if pname is None:
+                    tables = [tr.values[0] for tr in trs]
+                    num_entities = max(table.shape[0] for table in tables)
+                    ptable = integrate_block(quadrature_rule.weights, tables, num_entities)
+                    pname = "PI%d" % num_preintegrated_tables
+                    num_preintegrated_tables += 1
+                    preintegrated_names[unames] = pname
+                    preintegrated_tables[pname] = clamp_table_small_numbers(
+                        ptable, rtol=p["table_rtol"], atol=p["table_atol"])
+
             block_unames = unames
             blockdata = block_data_t(ttypes, fi_ci,
                                      all_factors_piecewise, block_unames,
                                      block_restrictions, block_is_transposed,
-                                     block_is_uniform, None, tuple(ma_data), None, block_is_permuted)
+                                     block_is_uniform, pname, tuple(ma_data), None, block_is_permuted)
 
             # Insert in expr_ir for this quadrature loop
             block_contributions[blockmap].append(blockdata)
 
+        if ir["symmetric"]:
+            ir["symmetric"] = is_symmetric_integrand(F, block_contributions, "complex" in p["scalar_type"])
+
         # Figure out which table names are referenced
         active_table_names = set()
-        for i, v in F.nodes.items():
-            tr = v.get('tr')
-            if tr is not None and F.nodes[i]['status'] != 'inactive':
-                active_table_names.add(tr.name)
+        for k in numpy.unique(F.table_index[(F.table_index >= 0) & (F.status != INACTIVE)]):
+            active_table_names.add(F.table_references[k].name)
 
         # Figure out which table names are referenced in blocks
         for blockmap, contributions in itertools.chain(
                 block_contributions.items()):
             for blockdata in contributions:
+                if blockdata.name is not None:
+                    # Argument tables of preintegrated blocks are not
+                    # needed in the generated code
+                    continue
                 for mad in blockdata.ma_data:
                     active_table_names.add(mad.tabledata.name)
 
@@ -265,45 +343,145 @@ def compute_integral_ir(cell, integral_type, entitytype, integrands, argument_sh
 
         # Analyse active terminals to check what we'll need to generate code for
         active_mts = []
-        for i, v in F.nodes.items():
-            mt = v.get('mt', False)
-            if mt and F.nodes[i]['status'] != 'inactive':
+        for i, mt in F.mts.items():
+            if F.status[i] != INACTIVE:
                 active_mts.append(mt)
 
+        # Factorize the tables on tensor product cells for sum
+        # factorized code generation
+        point_grid = None
+        tensor_factors = {}
+        if p["sum_factorization"] and integral_type == "cell" and cell.cellname() in ("quadrilateral",
+                                                                                      "hexahedron"):
+            point_grid = tensor_product_grid(quadrature_rule.points)
+        if point_grid is not None:
+            for tr in mt_unique_table_reference.values():
+                # Tables of dofs which are transformed at runtime are
+                # not factorized
+                transformed = (ir["table_dof_face_tangents"][tr.name]
+                               or any(e is not None for e in ir["table_dof_reflection_entities"][tr.name]))
+                if tr.ttype in ("uniform", "varying") and not transformed and tr.name not in tensor_factors:
+                    factors = factorize_tensor_product_table(tr.values[0, 0], point_grid,
+                                                             rtol=p["table_rtol"], atol=p["table_atol"])
+                    if factors is not None:
+                        tensor_factors[tr.name] = factors
+
         # Build IR dict for the given expressions
         # Store final ir for this num_points
         ir["integrand"][quadrature_rule] = {"factorization": F,
-                                            "modified_arguments": [F.nodes[i]['mt'] for i in argkeys],
-                                            "block_contributions": block_contributions}
+                                            "modified_arguments": [F.mts[i] for i in argkeys],
+                                            "block_contributions": block_contributions,
+                                            "point_grid": point_grid,
+                                            "tensor_factors": tensor_factors,
+                                            "preintegrated_tables": preintegrated_tables}
     return ir
 
 
+def is_symmetric_integrand(F, block_contributions, complex_mode):
+    """Check if the element tensor of a bilinear integrand is symmetric.
+
+    The test and trial functions must have the same element, and the
+    factors of the blocks of each pair of argument tables must sum to
+    the factors of the blocks with the tables swapped. The factors are
+    compared by their values for random values of the modified
+    terminals, see evaluate_factor.
+    """
+    values = {}
+    rng = numpy.random.RandomState(0)
+    sums = collections.defaultdict(complex)
+    for blockmap, contributions in block_contributions.items():
+        for blockdata in contributions:
+            elements = [F.mts[mad.ma_index].terminal.ufl_element() for mad in blockdata.ma_data]
+            if elements[0] != elements[1] or any(r is not None for r in blockdata.restrictions):
+                return False
+            for fi, ci in blockdata.factor_indices_comp_indices:
+                value = evaluate_factor(F.expressions[fi], values, rng, complex_mode)
+                if value is None:
+                    return False
+                sums[tuple(zip(blockdata.unames, blockmap))] += value
+
+    for arguments, value in sums.items():
+        transposed = sums.get(arguments[::-1], 0.0)
+        if not numpy.isclose(value, transposed, rtol=1e-10, atol=1e-12 * (abs(value) + abs(transposed))):
+            return False
+    return True
+
+
+def evaluate_factor(expr, values, rng, complex_mode):
+    """Evaluate a scalar factor for random values of its modified terminals.
+
+    Coefficients and constants take complex values in complex mode, the
+    geometry takes real values. Sums, products, quotients, powers,
+    complex conjugates, real and imaginary parts and math functions of
+    their operands are evaluated, all other subexpressions (e.g.
+    absolute values, conditionals) take a random value as well, shared
+    by equal subexpressions. Returns None if the value is undefined.
+    """
+    if expr in values:
+        return values[expr]
+
+    if isinstance(expr, ufl.classes.RealValue):
+        value = float(expr)
+    elif is_modified_terminal(expr) or not isinstance(expr, _evaluated_types):
+        value = rng.uniform(1.0, 2.0)
+        if complex_mode and is_modified_terminal(expr) and isinstance(
+                analyse_modified_terminal(expr).terminal, (ufl.classes.Coefficient, ufl.classes.Constant)):
+            value += 1j * rng.uniform(1.0, 2.0)
+    else:
+        operands = [evaluate_factor(o, values, rng, complex_mode) for o in expr.ufl_operands]
+        if any(o is None for o in operands):
+            value = None
+        else:
+            with numpy.errstate(all="ignore"):
+                if isinstance(expr, ufl.classes.Sum):
+                    value = operands[0] + operands[1]
+                elif isinstance(expr, ufl.classes.Product):
+                    value = operands[0] * operands[1]
+                elif isinstance(expr, ufl.classes.Division):
+                    value = numpy.divide(operands[0], operands[1])
+                elif isinstance(expr, ufl.classes.Power):
+                    value = numpy.power(complex(operands[0]), operands[1])
+                elif isinstance(expr, ufl.classes.Conj):
+                    value = numpy.conj(operands[0])
+                elif isinstance(expr, ufl.classes.Real):
+                    value = numpy.real(operands[0])
+                elif isinstance(expr, ufl.classes.Imag):
+                    value = numpy.imag(operands[0])
+                else:
+                    value = _math_functions[expr._name](complex(operands[0]))
+            if not numpy.isfinite(value):
+                value = None
+
+    values[expr] = value
+    return value
+
+
+# Operators evaluated by evaluate_factor
+_evaluated_types = (ufl.classes.Sum, ufl.classes.Product, ufl.classes.Division, ufl.classes.Power,
+                    ufl.classes.Conj, ufl.classes.Real, ufl.classes.Imag, ufl.classes.Sqrt, ufl.classes.Exp,
+                    ufl.classes.Ln, ufl.classes.Cos, ufl.classes.Sin, ufl.classes.Tan, ufl.classes.Cosh,
+                    ufl.classes.Sinh, ufl.classes.Tanh, ufl.classes.Acos, ufl.classes.Asin, ufl.classes.Atan)
+
+_math_functions = {"sqrt": numpy.sqrt, "exp": numpy.exp, "ln": numpy.log, "cos": numpy.cos, "sin": numpy.sin,
+                   "tan": numpy.tan, "cosh": numpy.cosh, "sinh": numpy.sinh, "tanh": numpy.tanh,
+                   "acos": numpy.arccos, "asin": numpy.arcsin, "atan": numpy.arctan}
+
+
 def analyse_dependencies(F, mt_unique_table_reference):
-    # Sets 'status' of all nodes to either: 'inactive', 'piecewise' or 'varying'
-    # Children of 'target' nodes are either 'piecewise' or 'varying'.
-    # All other nodes are 'inactive'.
-    # Varying nodes are identified by their tables ('tr'). All their parent
-    # nodes are also set to 'varying' - any remaining active nodes are 'piecewise'.
-
-    # Set targets, and dependencies to 'active'
-    targets = [i for i, v in F.nodes.items() if v.get('target')]
-    for i, v in F.nodes.items():
-        v['status'] = 'inactive'
-
-    while targets:
-        s = targets.pop()
-        F.nodes[s]['status'] = 'active'
-        for j in F.out_edges[s]:
-            if F.nodes[j]['status'] == 'inactive':
-                targets.append(j)
+    # Sets status of all nodes to either: INACTIVE, PIECEWISE or VARYING
+    # Children of 'target' nodes are either PIECEWISE or VARYING.
+    # All other nodes are INACTIVE.
+    # Varying nodes are identified by their tables. All their parent
+    # nodes are also VARYING - any remaining active nodes are PIECEWISE.
+
+    # Targets and their dependencies are active
+    active = F.reachable(F.targets())
 
     # Build piecewise/varying markers for factorized_vertices
     varying_ttypes = ("varying", "quadrature", "uniform")
     varying_indices = []
-    for i, v in F.nodes.items():
-        if v.get('mt') is None:
-            continue
-        tr = v.get('tr')
+    for i, mt in F.mts.items():
+        tr = F.table_reference(i)
         if tr is not None:
             ttype = tr.ttype
             # Check if table computations have revealed values varying over points
@@ -313,24 +491,19 @@ def analyse_dependencies(F, mt_unique_table_reference):
                 if ttype not in ("fixed", "piecewise", "ones", "zeros"):
                     raise RuntimeError("Invalid ttype %s" % (ttype, ))
 
-        elif not is_cellwise_constant(v['expression']):
+        elif not is_cellwise_constant(F.expressions[i]):
             raise RuntimeError("Error")
             # Keeping this check to be on the safe side,
             # not sure which cases this will cover (if any)
             # varying_indices.append(i)
 
-    # Set all parents of active varying nodes to 'varying'
-    while varying_indices:
-        s = varying_indices.pop()
-        if F.nodes[s]['status'] == 'active':
-            F.nodes[s]['status'] = 'varying'
-            for j in F.in_edges[s]:
-                varying_indices.append(j)
-
-    # Any remaining active nodes must be 'piecewise'
-    for i, v in F.nodes.items():
-        if v['status'] == 'active':
-            v['status'] = 'piecewise'
+    # All active parents of active varying nodes are varying
+    varying = F.reachable(varying_indices, reverse=True, mask=active)
+
+    # Any remaining active nodes must be piecewise
+    F.status[:] = INACTIVE
+    F.status[active] = PIECEWISE
+    F.status[varying] = VARYING
 
 
 def replace_quadratureweight(expression):
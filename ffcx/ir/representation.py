@@ -16,22 +16,28 @@ should only need to use the data stored in the intermediate
 representation under the key "foo".
 """
 
-import itertools
+import concurrent.futures
+import hashlib
 import logging
+import multiprocessing
+import os
+import threading
 from collections import namedtuple
 import warnings
 
 import numpy
 
+import ffcx
 import ufl
-from ffcx import naming
+from ffcx import instrumentation, naming
 from ffcx.fiatinterface import (EnrichedElement, FlattenedDimensions,
                                 MixedElement, QuadratureElement, SpaceOfReals,
                                 create_element)
 from ffcx.ir import dof_permutations
 from ffcx.ir.integral import compute_integral_ir
-from ffcx.ir.representationutils import (QuadratureRule,
-                                         create_quadrature_points_and_weights)
+from ffcx.ir.representationutils import (QuadratureRule, SignatureCache,
+                                         create_quadrature_rule)
+from ffcx.parameters import code_parameters
 from FIAT.hdiv_trace import HDivTrace
 from ufl.classes import Integral
 from ufl.sorting import sorted_expr_sum
@@ -59,11 +65,13 @@ ir_element = namedtuple('ir_element', ['id', 'name', 'signature', 'cell_shape',
                                        'reference_value_shape', 'degree', 'family', 'evaluate_basis',
                                        'evaluate_dof', 'tabulate_dof_coordinates', 'num_sub_elements',
                                        'base_permutations', 'dof_reflection_entities',
-                                       'create_sub_element', 'dof_types', 'entity_dofs'])
-ir_dofmap = namedtuple('ir_dofmap', ['id', 'name', 'signature', 'num_global_support_dofs',
+                                       'dof_face_tangents', 'create_sub_element', 'dof_types',
+                                       'entity_dofs'])
+ir_dofmap = namedtuple('ir_dofmap', ['id', 'name', 'signature', 'cell_shape', 'num_global_support_dofs',
                                      'num_element_support_dofs', 'num_entity_dofs',
                                      'tabulate_entity_dofs', 'base_permutations', 'dof_reflection_entities',
-                                     'num_sub_dofmaps', 'create_sub_dofmap', 'dof_types'])
+                                     'dof_face_tangents', 'num_sub_dofmaps', 'create_sub_dofmap',
+                                     'dof_types'])
 ir_coordinate_map = namedtuple('ir_coordinate_map', ['id', 'prefix', 'name', 'signature', 'cell_shape',
                                                      'topological_dimension',
                                                      'geometric_dimension',
@@ -83,7 +91,8 @@ ir_integral = namedtuple('ir_integral', ['integral_type', 'subdomain_id',
                                          'coefficient_offsets', 'original_constant_offsets', 'params', 'cell_shape',
                                          'unique_tables', 'unique_table_types', 'table_dofmaps',
                                          'table_dof_face_tangents', 'table_dof_reflection_entities',
-                                         'integrand', 'name', 'precision'])
+                                         'argument_dof_transformations', 'coefficient_dof_transformations',
+                                         'symmetric', 'integrand', 'name', 'signature', 'precision'])
 ir_tabulate_dof_coordinates = namedtuple('ir_tabulate_dof_coordinates', ['tdim', 'gdim', 'points', 'cell_shape'])
 ir_evaluate_dof = namedtuple('ir_evaluate_dof', ['mappings', 'reference_value_size', 'physical_value_size',
                                                  'geometric_dimension', 'topological_dimension', 'dofs',
@@ -91,7 +100,8 @@ ir_evaluate_dof = namedtuple('ir_evaluate_dof', ['mappings', 'reference_value_si
 ir_expression = namedtuple('ir_expression', ['name', 'element_dimensions', 'params', 'unique_tables',
                                              'unique_table_types', 'integrand', 'table_dofmaps',
                                              'table_dof_face_tangents', 'table_dof_reflection_entities',
-                                             'coefficient_numbering', 'coefficient_offsets',
+                                             'argument_dof_transformations', 'coefficient_dof_transformations',
+                                             'symmetric', 'coefficient_numbering', 'coefficient_offsets',
                                              'integral_type', 'entitytype', 'tensor_shape', 'expression_shape',
                                              'original_constant_offsets', 'original_coefficient_positions', 'points'])
 
@@ -114,41 +124,75 @@ def compute_ir(analysis: namedtuple, object_names, prefix, parameters, visualise
     dofmap_names = {e: naming.dofmap_name(e, prefix) for e in analysis.unique_elements}
     coordinate_mapping_names = {cmap: naming.coordinate_map_name(
         cmap, prefix) for cmap in analysis.unique_coordinate_elements}
+    integral_signatures = {}
     integral_names = {}
     for fd_index, fd in enumerate(analysis.form_data):
         for itg_index, itg_data in enumerate(fd.integral_data):
-            integral_names[(fd_index, itg_index)] = naming.integral_name(itg_data.integral_type, fd.original_form,
-                                                                         fd_index, itg_data.subdomain_id)
+            signature = compute_integral_signature(fd, fd_index, itg_index, parameters)
+            integral_signatures[(fd_index, itg_index)] = signature
+            integral_names[(fd_index, itg_index)] = naming.integral_name(itg_data.integral_type,
+                                                                         itg_data.subdomain_id, signature)
+
+    # Reuse the IR of integrals which are unchanged since they were last
+    # compiled by this process
+    ir_integrals = {}
+    if not visualise:
+        for key, signature in integral_signatures.items():
+            ir = integral_ir_cache.get(signature)
+            if ir is not None:
+                ir_integrals[key] = ir
+    if ir_integrals:
+        logger.info("Reusing IR of {} unchanged integral(s)".format(len(ir_integrals)))
+
+    # The IR of elements and integrals is independent, and computed in
+    # parallel if requested
+    element_tasks = [(_compute_element_ir, (e, analysis.element_numbers, finite_element_names, parameters["epsilon"]))
+                     for e in analysis.unique_elements]
+    integral_keys = [key for key in integral_signatures if key not in ir_integrals]
+    integral_tasks = [(_compute_integral_ir, (analysis.form_data[i], i, j, prefix, analysis.element_numbers,
+                                              integral_names, integral_signatures, parameters, visualise))
+                      for (i, j) in integral_keys]
+    jobs = parameters["ir_jobs"]
+    if jobs != 1:
+        with instrumentation.section("elements and integrals"):
+            results = _run_tasks(element_tasks + integral_tasks, jobs)
+        ir_elements = results[:len(element_tasks)]
+        new_ir_integrals = results[len(element_tasks):]
+    else:
+        with instrumentation.section("elements"):
+            ir_elements = _run_tasks(element_tasks, jobs)
 
-    ir_elements = [
-        _compute_element_ir(e, analysis.element_numbers, finite_element_names, parameters["epsilon"])
-        for e in analysis.unique_elements
-    ]
+    with instrumentation.section("dofmaps"):
+        ir_dofmaps = [
+            _compute_dofmap_ir(e, analysis.element_numbers, dofmap_names) for e in analysis.unique_elements
+        ]
 
-    ir_dofmaps = [
-        _compute_dofmap_ir(e, analysis.element_numbers, dofmap_names) for e in analysis.unique_elements
-    ]
+    with instrumentation.section("coordinate mappings"):
+        ir_coordinate_mappings = [
+            _compute_coordinate_mapping_ir(e, prefix, analysis.element_numbers,
+                                           coordinate_mapping_names, dofmap_names, finite_element_names)
+            for e in analysis.unique_coordinate_elements
+        ]
 
-    ir_coordinate_mappings = [
-        _compute_coordinate_mapping_ir(e, prefix, analysis.element_numbers,
-                                       coordinate_mapping_names, dofmap_names, finite_element_names)
-        for e in analysis.unique_coordinate_elements
-    ]
+    if jobs == 1:
+        with instrumentation.section("integrals"):
+            new_ir_integrals = _run_tasks(integral_tasks, jobs)
 
-    irs = [
-        _compute_integral_ir(fd, i, prefix, analysis.element_numbers, integral_names, parameters, visualise)
-        for (i, fd) in enumerate(analysis.form_data)
-    ]
-    ir_integrals = list(itertools.chain(*irs))
+    for key, ir in zip(integral_keys, new_ir_integrals):
+        integral_ir_cache.put(ir.signature, ir)
+        ir_integrals[key] = ir
+    ir_integrals = [ir_integrals[key] for key in integral_signatures]
 
-    ir_forms = [
-        _compute_form_ir(fd, i, prefix, analysis.element_numbers, finite_element_names,
-                         dofmap_names, coordinate_mapping_names, object_names)
-        for (i, fd) in enumerate(analysis.form_data)
-    ]
+    with instrumentation.section("forms"):
+        ir_forms = [
+            _compute_form_ir(fd, i, prefix, analysis.element_numbers, finite_element_names,
+                             dofmap_names, coordinate_mapping_names, integral_names, object_names)
+            for (i, fd) in enumerate(analysis.form_data)
+        ]
 
-    ir_expressions = [_compute_expression_ir(expr, i, prefix, analysis, parameters, visualise)
-                      for i, expr in enumerate(analysis.expressions)]
+    with instrumentation.section("expressions"):
+        ir_expressions = [_compute_expression_ir(expr, i, prefix, analysis, parameters, visualise)
+                          for i, expr in enumerate(analysis.expressions)]
 
     return ir_data(elements=ir_elements, dofmaps=ir_dofmaps,
                    coordinate_mappings=ir_coordinate_mappings,
@@ -156,6 +200,85 @@ def compute_ir(analysis: namedtuple, object_names, prefix, parameters, visualise
                    expressions=ir_expressions)
 
 
+# IR of the integrals compiled by this process, keyed by integral signature
+integral_ir_cache = SignatureCache()
+
+
+def compute_integral_signature(form_data, form_index, itg_data_index, parameters):
+    """Compute the signature of the code generated for a group of integrals of a form.
+
+    The signature covers the integrands, quadrature rules, elements
+    and code generation parameters of the integrals, but not the other
+    integrals of the form. It is used in the name of the integral and as
+    key for the IR and generated code of the integral, so that integrals
+    which are unchanged are reused when a form is recompiled.
+    """
+    itg_data = form_data.integral_data[itg_data_index]
+    original_form = form_data.original_form
+
+    # Number form arguments by their position in the form, as the
+    # signature of the form does
+    renumbering = {}
+    renumbering.update((f, i) for i, f in enumerate(form_data.reduced_coefficients))
+    renumbering.update((c, i) for i, c in enumerate(original_form.constants()))
+    renumbering.update((d, i) for i, d in enumerate(original_form.ufl_domains()))
+
+    integrals = []
+    for integral in itg_data.integrals:
+        md = integral.metadata() or {}
+        rule = [md["quadrature_rule"], md["quadrature_degree"]]
+        if md["quadrature_rule"] == "custom":
+            for values in (md["quadrature_points"], md["quadrature_weights"]):
+                values = numpy.ascontiguousarray(values, dtype=numpy.float64)
+                rule.append(hashlib.sha1(values.tobytes()).hexdigest())
+        integrals.append((ufl.algorithms.signature.compute_expression_signature(integral.integrand(), renumbering),
+                          rule))
+
+    data = [form_index, itg_data.integral_type, itg_data.subdomain_id, itg_data.metadata["precision"],
+            sorted(integrals), form_data.rank, form_data.geometric_dimension,
+            form_needs_oriented_jacobian(form_data), itg_data.enabled_coefficients,
+            [repr(e) for e in form_data.argument_elements], [repr(e) for e in form_data.coefficient_elements],
+            [c.ufl_shape for c in original_form.constants()],
+            sorted(code_parameters(parameters).items()), ffcx.__version__, ffcx.codegeneration.get_signature()]
+    return hashlib.sha1(str(data).encode("utf-8")).hexdigest()
+
+
+# Tasks of _run_tasks in a worker process, set by _init_worker
+_tasks = None
+
+
+def _init_worker(tasks):
+    global _tasks
+    _tasks = tasks
+
+
+def _run_task(i):
+    function, args = _tasks[i]
+    return function(*args)
+
+
+def _run_tasks(tasks, jobs):
+    """Return the results of the tasks, a list of (function, args), computed by jobs processes.
+
+    jobs = 0 uses one process per CPU. The worker processes are forked
+    and receive the tasks when they start, so that the arguments of the
+    tasks don't need to be pickled. The tasks are run in the calling
+    process on platforms without fork, and when other threads are
+    running, since these may hold locks which are never released in the
+    forked processes.
+    """
+    jobs = jobs or os.cpu_count()
+    if jobs == 1 or len(tasks) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return [function(*args) for function, args in tasks]
+    if threading.active_count() > 1:
+        logger.debug("Computing IR serially, as forking a process with several threads is unsafe")
+        return [function(*args) for function, args in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(min(jobs, len(tasks)), mp_context=multiprocessing.get_context("fork"),
+                                                initializer=_init_worker, initargs=(tasks, )) as pool:
+        return list(pool.map(_run_task, range(len(tasks))))
+
+
 def _compute_element_ir(ufl_element, element_numbers, finite_element_names, epsilon):
     """Compute intermediate representation of element."""
 
@@ -190,6 +313,7 @@ def _compute_element_ir(ufl_element, element_numbers, finite_element_names, epsi
 
     ir["base_permutations"] = dof_permutations.base_permutations(ufl_element)
     ir["dof_reflection_entities"] = dof_permutations.reflection_entities(ufl_element)
+    ir["dof_face_tangents"] = dof_permutations.face_tangents(ufl_element)
 
     ir["dof_types"] = [i.functional_type for i in fiat_element.dual_basis()]
     ir["entity_dofs"] = fiat_element.entity_dofs()
@@ -215,6 +339,7 @@ def _compute_dofmap_ir(ufl_element, element_numbers, dofmap_names):
 
     # Compute data for each function
     ir["signature"] = "FFCX dofmap for " + repr(ufl_element)
+    ir["cell_shape"] = ufl_element.cell().cellname()
     ir["num_global_support_dofs"] = _num_global_support_dofs(fiat_element)
     ir["num_element_support_dofs"] = fiat_element.space_dimension() - ir["num_global_support_dofs"]
     ir["num_entity_dofs"] = num_dofs_per_entity
@@ -224,6 +349,7 @@ def _compute_dofmap_ir(ufl_element, element_numbers, dofmap_names):
     ir["dof_types"] = [i.functional_type for i in fiat_element.dual_basis()]
     ir["base_permutations"] = dof_permutations.base_permutations(ufl_element)
     ir["dof_reflection_entities"] = dof_permutations.reflection_entities(ufl_element)
+    ir["dof_face_tangents"] = dof_permutations.face_tangents(ufl_element)
 
     return ir_dofmap(**ir)
 
@@ -350,180 +476,174 @@ def _num_global_support_dofs(fiat_element):
     return num_reals
 
 
-def _compute_integral_ir(form_data, form_index, prefix, element_numbers, integral_names,
-                         parameters, visualise):
-    """Compute intermediate represention for form integrals."""
+_entity_types = {
+    "cell": "cell",
+    "exterior_facet": "facet",
+    "interior_facet": "facet",
+    "vertex": "vertex",
+    "custom": "cell"
+}
 
-    _entity_types = {
-        "cell": "cell",
-        "exterior_facet": "facet",
-        "interior_facet": "facet",
-        "vertex": "vertex",
-        "custom": "cell"
-    }
 
-    # Iterate over groups of integrals
-    irs = []
-    for itg_data_index, itg_data in enumerate(form_data.integral_data):
-
-        logger.info("Computing IR for integral in integral group {}".format(itg_data_index))
-
-        # Compute representation
-        entitytype = _entity_types[itg_data.integral_type]
-        cell = itg_data.domain.ufl_cell()
-        cellname = cell.cellname()
-        tdim = cell.topological_dimension()
-        assert all(tdim == itg.ufl_domain().topological_dimension() for itg in itg_data.integrals)
-
-        ir = {
-            "integral_type": itg_data.integral_type,
-            "subdomain_id": itg_data.subdomain_id,
-            "rank": form_data.rank,
-            "geometric_dimension": form_data.geometric_dimension,
-            "topological_dimension": tdim,
-            "entitytype": entitytype,
-            "num_facets": cell.num_facets(),
-            "num_vertices": cell.num_vertices(),
-            "needs_oriented": form_needs_oriented_jacobian(form_data),
-            "enabled_coefficients": itg_data.enabled_coefficients,
-            "cell_shape": cellname
-        }
+def _compute_integral_ir(form_data, form_index, itg_data_index, prefix, element_numbers, integral_names,
+                         integral_signatures, parameters, visualise):
+    """Compute intermediate represention for a group of integrals of a form."""
 
-        # Get element space dimensions
-        unique_elements = element_numbers.keys()
-        ir["element_dimensions"] = {
-            ufl_element: create_element(ufl_element).space_dimension()
-            for ufl_element in unique_elements
-        }
+    itg_data = form_data.integral_data[itg_data_index]
+    logger.info("Computing IR for integral in integral group {}".format(itg_data_index))
 
-        ir["element_ids"] = {
-            ufl_element: i
-            for i, ufl_element in enumerate(unique_elements)
-        }
+    # Compute representation
+    entitytype = _entity_types[itg_data.integral_type]
+    cell = itg_data.domain.ufl_cell()
+    cellname = cell.cellname()
+    tdim = cell.topological_dimension()
+    assert all(tdim == itg.ufl_domain().topological_dimension() for itg in itg_data.integrals)
+
+    ir = {
+        "integral_type": itg_data.integral_type,
+        "subdomain_id": itg_data.subdomain_id,
+        "rank": form_data.rank,
+        "geometric_dimension": form_data.geometric_dimension,
+        "topological_dimension": tdim,
+        "entitytype": entitytype,
+        "num_facets": cell.num_facets(),
+        "num_vertices": cell.num_vertices(),
+        "needs_oriented": form_needs_oriented_jacobian(form_data),
+        "enabled_coefficients": itg_data.enabled_coefficients,
+        "cell_shape": cellname
+    }
 
-        # Create dimensions of primary indices, needed to reset the argument
-        # 'A' given to tabulate_tensor() by the assembler.
-        argument_dimensions = [
-            ir["element_dimensions"][ufl_element] for ufl_element in form_data.argument_elements
-        ]
+    # Get element space dimensions
+    unique_elements = element_numbers.keys()
+    ir["element_dimensions"] = {
+        ufl_element: create_element(ufl_element).space_dimension()
+        for ufl_element in unique_elements
+    }
 
-        # Compute shape of element tensor
-        if ir["integral_type"] == "interior_facet":
-            ir["tensor_shape"] = [2 * dim for dim in argument_dimensions]
-        else:
-            ir["tensor_shape"] = argument_dimensions
-
-        integral_type = itg_data.integral_type
-        cell = itg_data.domain.ufl_cell()
-
-        # Group integrands with the same quadrature rule
-        grouped_integrands = {}
-        for integral in itg_data.integrals:
-            md = integral.metadata() or {}
-            scheme = md["quadrature_rule"]
-            degree = md["quadrature_degree"]
-
-            if scheme == "custom":
-                points = md["quadrature_points"]
-                weights = md["quadrature_weights"]
-            elif scheme == "vertex":
-                # FIXME: Could this come from FIAT?
-                #
-                # The vertex scheme, i.e., averaging the function value in the
-                # vertices and multiplying with the simplex volume, is only of
-                # order 1 and inferior to other generic schemes in terms of
-                # error reduction. Equation systems generated with the vertex
-                # scheme have some properties that other schemes lack, e.g., the
-                # mass matrix is a simple diagonal matrix. This may be
-                # prescribed in certain cases.
-                if degree > 1:
-                    warnings.warn(
-                        "Explicitly selected vertex quadrature (degree 1), but requested degree is {}.".
-                        format(degree))
-                if cellname == "tetrahedron":
-                    points, weights = (numpy.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0],
-                                                    [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]),
-                                       numpy.array([1.0 / 24.0, 1.0 / 24.0, 1.0 / 24.0, 1.0 / 24.0]))
-                elif cellname == "triangle":
-                    points, weights = (numpy.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]]),
-                                       numpy.array([1.0 / 6.0, 1.0 / 6.0, 1.0 / 6.0]))
-                elif cellname == "interval":
-                    # Trapezoidal rule
-                    return (numpy.array([[0.0], [1.0]]), numpy.array([1.0 / 2.0, 1.0 / 2.0]))
-            else:
-                (points, weights) = create_quadrature_points_and_weights(integral_type, cell, degree,
-                                                                         scheme)
+    ir["element_ids"] = {
+        ufl_element: i
+        for i, ufl_element in enumerate(unique_elements)
+    }
 
-            points = numpy.asarray(points)
-            weights = numpy.asarray(weights)
+    # Create dimensions of primary indices, needed to reset the argument
+    # 'A' given to tabulate_tensor() by the assembler.
+    argument_dimensions = [
+        ir["element_dimensions"][ufl_element] for ufl_element in form_data.argument_elements
+    ]
 
+    # Compute shape of element tensor
+    if ir["integral_type"] == "interior_facet":
+        ir["tensor_shape"] = [2 * dim for dim in argument_dimensions]
+    else:
+        ir["tensor_shape"] = argument_dimensions
+
+    integral_type = itg_data.integral_type
+    cell = itg_data.domain.ufl_cell()
+
+    # Group integrands with the same quadrature rule
+    grouped_integrands = {}
+    for integral in itg_data.integrals:
+        md = integral.metadata() or {}
+        scheme = md["quadrature_rule"]
+        degree = md["quadrature_degree"]
+
+        if scheme == "custom":
+            points = md["quadrature_points"]
+            weights = md["quadrature_weights"]
+        elif scheme == "vertex":
+            # FIXME: Could this come from FIAT?
+            #
+            # The vertex scheme, i.e., averaging the function value in the
+            # vertices and multiplying with the simplex volume, is only of
+            # order 1 and inferior to other generic schemes in terms of
+            # error reduction. Equation systems generated with the vertex
+            # scheme have some properties that other schemes lack, e.g., the
+            # mass matrix is a simple diagonal matrix. This may be
+            # prescribed in certain cases.
+            if degree > 1:
+                warnings.warn(
+                    "Explicitly selected vertex quadrature (degree 1), but requested degree is {}.".
+                    format(degree))
+            if cellname == "tetrahedron":
+                points, weights = (numpy.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0],
+                                                [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]),
+                                   numpy.array([1.0 / 24.0, 1.0 / 24.0, 1.0 / 24.0, 1.0 / 24.0]))
+            elif cellname == "triangle":
+                points, weights = (numpy.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]]),
+                                   numpy.array([1.0 / 6.0, 1.0 / 6.0, 1.0 / 6.0]))
+            elif cellname == "interval":
+                # Trapezoidal rule
+                return (numpy.array([[0.0], [1.0]]), numpy.array([1.0 / 2.0, 1.0 / 2.0]))
+        if scheme in ("custom", "vertex"):
             rule = QuadratureRule(points, weights)
+        else:
+            rule = create_quadrature_rule(integral_type, cell, degree, scheme)
 
-            if rule not in grouped_integrands:
-                grouped_integrands[rule] = []
+        if rule not in grouped_integrands:
+            grouped_integrands[rule] = []
 
-            grouped_integrands[rule].append(integral.integrand())
+        grouped_integrands[rule].append(integral.integrand())
 
-        sorted_integrals = {}
-        for rule, integrands in grouped_integrands.items():
-            integrands_summed = sorted_expr_sum(integrands)
+    sorted_integrals = {}
+    for rule, integrands in grouped_integrands.items():
+        integrands_summed = sorted_expr_sum(integrands)
 
-            integral_new = Integral(integrands_summed, itg_data.integral_type, itg_data.domain,
-                                    itg_data.subdomain_id, {}, None)
-            sorted_integrals[rule] = integral_new
+        integral_new = Integral(integrands_summed, itg_data.integral_type, itg_data.domain,
+                                itg_data.subdomain_id, {}, None)
+        sorted_integrals[rule] = integral_new
 
-        # TODO: See if coefficient_numbering can be removed
-        # Build coefficient numbering for UFC interface here, to avoid
-        # renumbering in UFL and application of replace mapping
-        coefficient_numbering = {}
-        for i, f in enumerate(form_data.reduced_coefficients):
-            coefficient_numbering[f] = i
+    # TODO: See if coefficient_numbering can be removed
+    # Build coefficient numbering for UFC interface here, to avoid
+    # renumbering in UFL and application of replace mapping
+    coefficient_numbering = {}
+    for i, f in enumerate(form_data.reduced_coefficients):
+        coefficient_numbering[f] = i
+
+    # Add coefficient numbering to IR
+    ir["coefficient_numbering"] = coefficient_numbering
 
-        # Add coefficient numbering to IR
-        ir["coefficient_numbering"] = coefficient_numbering
+    index_to_coeff = sorted([(v, k) for k, v in coefficient_numbering.items()])
+    offsets = {}
+    width = 2 if integral_type in ("interior_facet") else 1
+    _offset = 0
+    for k, el in zip(index_to_coeff, form_data.coefficient_elements):
+        offsets[k[1]] = _offset
+        _offset += width * ir["element_dimensions"][el]
 
-        index_to_coeff = sorted([(v, k) for k, v in coefficient_numbering.items()])
-        offsets = {}
-        width = 2 if integral_type in ("interior_facet") else 1
-        _offset = 0
-        for k, el in zip(index_to_coeff, form_data.coefficient_elements):
-            offsets[k[1]] = _offset
-            _offset += width * ir["element_dimensions"][el]
+    # Copy offsets also into IR
+    ir["coefficient_offsets"] = offsets
 
-        # Copy offsets also into IR
-        ir["coefficient_offsets"] = offsets
+    # Build offsets for Constants
+    original_constant_offsets = {}
+    _offset = 0
+    for constant in form_data.original_form.constants():
+        original_constant_offsets[constant] = _offset
+        _offset += numpy.product(constant.ufl_shape, dtype=numpy.int)
 
-        # Build offsets for Constants
-        original_constant_offsets = {}
-        _offset = 0
-        for constant in form_data.original_form.constants():
-            original_constant_offsets[constant] = _offset
-            _offset += numpy.product(constant.ufl_shape, dtype=numpy.int)
+    ir["original_constant_offsets"] = original_constant_offsets
 
-        ir["original_constant_offsets"] = original_constant_offsets
+    ir["precision"] = itg_data.metadata["precision"]
 
-        ir["precision"] = itg_data.metadata["precision"]
+    # Create map from number of quadrature points -> integrand
+    integrands = {rule: integral.integrand() for rule, integral in sorted_integrals.items()}
 
-        # Create map from number of quadrature points -> integrand
-        integrands = {rule: integral.integrand() for rule, integral in sorted_integrals.items()}
+    # Fetch name and signature
+    ir["name"] = integral_names[(form_index, itg_data_index)]
+    ir["signature"] = integral_signatures[(form_index, itg_data_index)]
 
-        # Build more specific intermediate representation
+    # Build more specific intermediate representation
+    with instrumentation.section(ir["name"]):
         integral_ir = compute_integral_ir(itg_data.domain.ufl_cell(), itg_data.integral_type,
                                           ir["entitytype"], integrands, ir["tensor_shape"],
                                           parameters, visualise)
 
-        ir.update(integral_ir)
-
-        # Fetch name
-        ir["name"] = integral_names[(form_index, itg_data_index)]
-
-        irs.append(ir_integral(**ir))
+    ir.update(integral_ir)
 
-    return irs
+    return ir_integral(**ir)
 
 
 def _compute_form_ir(form_data, form_id, prefix, element_numbers, finite_element_names,
-                     dofmap_names, coordinate_mapping_names, object_names):
+                     dofmap_names, coordinate_mapping_names, integral_names, object_names):
     """Compute intermediate representation of form."""
 
     logger.info("Computing IR for form {}".format(form_id))
@@ -578,7 +698,7 @@ def _compute_form_ir(form_data, form_id, prefix, element_numbers, finite_element
     # Create integral ids and names using form prefix (integrals are
     # always generated as part of form so don't get their own prefix)
     for integral_type in ufc_integral_types:
-        irdata = _create_foo_integral(prefix, form_id, integral_type, form_data)
+        irdata = _create_foo_integral(prefix, form_id, integral_type, form_data, integral_names)
         ir["create_{}_integral".format(integral_type)] = irdata
         ir["get_{}_integral_ids".format(integral_type)] = irdata
 
@@ -593,7 +713,7 @@ def _compute_expression_ir(expression, index, prefix, analysis, parameters, visu
     ir = {}
 
     original_expression = (expression[2], expression[1])
-    sig = naming.compute_signature([original_expression], "", parameters)
+    sig = naming.compute_signature([original_expression], "")
     ir["name"] = "expression_{!s}".format(sig)
 
     original_expression = expression[2]
@@ -956,28 +1076,26 @@ def _tabulate_dof_coordinates(ufl_element, element):
         cell_shape=cell.cellname())
 
 
-def _create_foo_integral(prefix, form_id, integral_type, form_data):
+def _create_foo_integral(prefix, form_id, integral_type, form_data, integral_names):
     """Compute intermediate representation of create_foo_integral."""
     subdomain_ids = []
     classnames = []
-    itg_data = [itg_data for itg_data in form_data.integral_data
-                if (itg_data.integral_type == integral_type and itg_data.subdomain_id == "otherwise")]
+    itg_indices = [i for i, itg_data in enumerate(form_data.integral_data)
+                   if (itg_data.integral_type == integral_type and itg_data.subdomain_id == "otherwise")]
 
-    if len(itg_data) > 1:
+    if len(itg_indices) > 1:
         raise RuntimeError("Expecting at most one default integral of each type.")
-    elif len(itg_data) == 1:
+    elif len(itg_indices) == 1:
         subdomain_ids += [-1]
-        classnames += [naming.integral_name(integral_type, form_data.original_form,
-                                            form_id, "otherwise")]
+        classnames += [integral_names[(form_id, itg_indices[0])]]
 
-    for itg_data in form_data.integral_data:
+    for i, itg_data in enumerate(form_data.integral_data):
         if isinstance(itg_data.subdomain_id, int):
             if itg_data.subdomain_id < 0:
                 raise ValueError("Integral subdomain ID must be non-negative, not {}".format(itg_data.subdomain_id))
             if (itg_data.integral_type == integral_type):
                 subdomain_ids += [itg_data.subdomain_id]
-                classnames += [naming.integral_name(integral_type, form_data.original_form,
-                                                    form_id, itg_data.subdomain_id)]
+                classnames += [integral_names[(form_id, i)]]
 
     return subdomain_ids, classnames
 
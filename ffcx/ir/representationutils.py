@@ -5,8 +5,12 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 """Utility functions for some code shared between representations."""
 
+import collections
+import functools
 import hashlib
 import logging
+import threading
+import weakref
 
 import numpy
 
@@ -18,19 +22,47 @@ logger = logging.getLogger("ffcx")
 
 
 class QuadratureRule:
-    def __init__(self, points, weights):
-        self.points = points
-        self.weights = weights
-        self._hash = None
+    """Quadrature rule with points and weights (read-only arrays).
+
+    Quadrature rules are interned: constructing a rule with the same
+    points and weights as an existing rule returns the existing object,
+    so that rules compare by identity and hash in constant time.
+    """
+
+    __slots__ = ("points", "weights", "_digest", "_hash", "__weakref__")
+
+    # Existing rules, keyed by a hash of the points and weights
+    _rules = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __new__(cls, points, weights):
+        points = _frozen_array(points)
+        weights = _frozen_array(weights)
+        digest = hashlib.sha1(points).hexdigest()
+        key = (points.shape, digest, weights.shape, hashlib.sha1(weights).hexdigest())
+        with cls._lock:
+            rule = cls._rules.get(key)
+            if rule is None:
+                rule = object.__new__(cls)
+                object.__setattr__(rule, "points", points)
+                object.__setattr__(rule, "weights", weights)
+                object.__setattr__(rule, "_digest", digest)
+                object.__setattr__(rule, "_hash", int(digest[:16], 16))
+                cls._rules[key] = rule
+        return rule
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuadratureRule is immutable")
 
     def __hash__(self):
-        if self._hash is None:
-            self.hash_obj = hashlib.sha1(self.points)
-            self._hash = int(self.hash_obj.hexdigest(), 32)
         return self._hash
 
     def __eq__(self, other):
-        return numpy.allclose(self.points, other.points) and numpy.allclose(self.weights, other.weights)
+        return self is other
+
+    def __reduce__(self):
+        # Intern rules when unpickled, e.g. in IR computed by another process
+        return (QuadratureRule, (self.points, self.weights))
 
     def id(self):
         """Returns unique deterministic identifier.
@@ -41,24 +73,72 @@ class QuadratureRule:
         in generated code.
 
         """
-        return self.hash_obj.hexdigest()[-3:]
+        return self._digest[-3:]
+
+
+def _frozen_array(values):
+    values = numpy.array(values, dtype=numpy.float64)
+    values.setflags(write=False)
+    return values
+
+
+class SignatureCache(object):
+    """Least recently used cache of objects keyed by a signature.
+
+    Used to reuse the IR and generated code of integrals which are
+    unchanged when a form is recompiled. At most ``max_entries``
+    objects are kept.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._objects = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, signature):
+        """Return the object cached under signature, or None."""
+        with self._lock:
+            obj = self._objects.get(signature)
+            if obj is not None:
+                self._objects.move_to_end(signature)
+            return obj
+
+    def put(self, signature, obj):
+        with self._lock:
+            self._objects[signature] = obj
+            self._objects.move_to_end(signature)
+            while len(self._objects) > self.max_entries:
+                self._objects.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
 
 
 def create_quadrature_points_and_weights(integral_type, cell, degree, rule):
     """Create quadrature rule and return points and weights."""
+    if integral_type == "expression":
+        return (None, None)
+    quadrature_rule = create_quadrature_rule(integral_type, cell, degree, rule)
+    return (quadrature_rule.points, quadrature_rule.weights)
+
 
+def create_quadrature_rule(integral_type, cell, degree, rule):
+    """Create quadrature rule (QuadratureRule) on the entity integrated over by integral_type."""
     if integral_type == "cell":
-        (points, weights) = create_quadrature(cell.cellname(), degree, rule)
+        entity = cell.cellname()
     elif integral_type in ufl.measure.facet_integral_types:
-        (points, weights) = create_quadrature(ufl.cell.cellname2facetname[cell.cellname()], degree,
-                                              rule)
+        entity = ufl.cell.cellname2facetname[cell.cellname()]
     elif integral_type in ufl.measure.point_integral_types:
-        (points, weights) = create_quadrature("vertex", degree, rule)
-    elif integral_type == "expression":
-        (points, weights) = (None, None)
+        entity = "vertex"
     else:
-        logging.exception("Unknown integral type: {}".format(integral_type))
-    return (points, weights)
+        raise RuntimeError("Unknown integral type: {}".format(integral_type))
+    return _create_quadrature_rule(entity, degree, rule)
+
+
+@functools.lru_cache(maxsize=None)
+def _create_quadrature_rule(entity, degree, rule):
+    return QuadratureRule(*create_quadrature(entity, degree, rule))
 
 
 def integral_type_to_entity_dim(integral_type, tdim):
@@ -14,10 +14,11 @@ import logging
 import pathlib
 import re
 import string
+import sys
 
 import ufl
 from ffcx import __version__ as FFCX_VERSION
-from ffcx import compiler, formatting
+from ffcx import compiler, formatting, instrumentation
 from ffcx.parameters import default_parameters
 
 logger = logging.getLogger("ffcx")
@@ -30,6 +31,11 @@ parser.add_argument("-v", "--verbosity", action="count", help="verbose output (-
 parser.add_argument("-o", "--output-directory", type=str, default=".", help="output directory")
 parser.add_argument("--visualise", action="store_true", help="visualise the IR graph")
 parser.add_argument("-p", "--profile", action='store_true', help="enable profiling")
+parser.add_argument("--timings-json", type=str, default=None, metavar="FILE",
+                    help="write wall time and peak memory of compiler stages and objects to FILE")
+parser.add_argument("--bundle", type=str, default=None, metavar="DIR",
+                    help="compile all files into a bundle (shared library and manifest) in DIR")
+parser.add_argument("-j", "--jobs", type=int, default=1, help="number of parallel C compiler jobs for --bundle")
 
 # Add all parameters from FFC parameter system
 parameters = default_parameters()
@@ -41,6 +47,14 @@ parser.add_argument("ufl_file", nargs='+', help="UFL file(s) to be compiled")
 
 
 def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    # Management of the JIT cache, 'ffcx cache {stats,prune,clear,limit} <cache_dir>'
+    if args and args[0] == "cache":
+        from ffcx.codegeneration import cache
+        return cache.main(args[1:])
+
     xargs = parser.parse_args(args)
 
     ffcx_logger = logging.getLogger("ffcx")
@@ -54,6 +68,23 @@ def main(args=None):
     for param_name, param_val in parameters.items():
         parameters[param_name] = xargs.__dict__.get(param_name)
 
+    if xargs.timings_json is not None:
+        with instrumentation.collect() as report:
+            retcode = _compile_files(xargs, parameters)
+        report.dump(xargs.timings_json)
+        return retcode
+
+    return _compile_files(xargs, parameters)
+
+
+def _compile_files(xargs, parameters):
+    # Compile all files into one library, which can be registered with
+    # the JIT
+    if xargs.bundle is not None:
+        from ffcx.codegeneration import bundle
+        bundle.build_bundle(xargs.ufl_file, xargs.bundle, parameters, cffi_jobs=xargs.jobs)
+        return 0
+
     # Call parser and compiler for each file
     for filename in xargs.ufl_file:
         file = pathlib.Path(filename)
@@ -72,16 +103,17 @@ def main(args=None):
             pr = cProfile.Profile()
             pr.enable()
 
-        # Load UFL file
-        ufd = ufl.algorithms.load_ufl_file(filename)
-
-        # Generate code
-        if len(ufd.forms) > 0:
-            code_h, code_c = compiler.compile_ufl_objects(
-                ufd.forms, ufd.object_names, prefix=prefix, parameters=parameters, visualise=xargs.visualise)
-        else:
-            code_h, code_c = compiler.compile_ufl_objects(
-                ufd.elements, ufd.object_names, prefix=prefix, parameters=parameters, visualise=xargs.visualise)
+        with instrumentation.section(filename):
+            # Load UFL file
+            ufd = ufl.algorithms.load_ufl_file(filename)
+
+            # Generate code
+            if len(ufd.forms) > 0:
+                code_h, code_c = compiler.compile_ufl_objects(
+                    ufd.forms, ufd.object_names, prefix=prefix, parameters=parameters, visualise=xargs.visualise)
+            else:
+                code_h, code_c = compiler.compile_ufl_objects(
+                    ufd.elements, ufd.object_names, prefix=prefix, parameters=parameters, visualise=xargs.visualise)
 
         # Write to file
         formatting.write_code(code_h, code_c, prefix, xargs.output_directory)
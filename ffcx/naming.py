@@ -5,6 +5,7 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
 import hashlib
+import weakref
 
 import ffcx
 import ufl
@@ -26,50 +27,8 @@ def compute_signature(ufl_objects, tag, coordinate_mapping=False):
 
     object_signature = ""
     for ufl_object in ufl_objects:
-        # Get signature from ufl object
-        if isinstance(ufl_object, ufl.Form):
-            kind = "form"
-            object_signature += ufl_object.signature()
-        elif isinstance(ufl_object, ufl.Mesh):
-            # When coordinate mapping is represented by a Mesh, just getting
-            # its coordinate element
-            object_signature += repr(ufl_object.ufl_coordinate_element())
-            kind = "coordinate_mapping"
-        elif coordinate_mapping and isinstance(ufl_object, ufl.FiniteElementBase):
-            object_signature += repr(ufl_object)
-            kind = "coordinate_mapping"
-        elif isinstance(ufl_object, ufl.FiniteElementBase):
-            object_signature += repr(ufl_object)
-            kind = "element"
-        elif isinstance(ufl_object, tuple) and isinstance(ufl_object[0], ufl.core.expr.Expr):
-            expr = ufl_object[0]
-
-            # FIXME Move this to UFL, cache the computation
-            coeffs = ufl.algorithms.extract_coefficients(expr)
-            consts = ufl.algorithms.analysis.extract_constants(expr)
-            args = ufl.algorithms.analysis.extract_arguments(expr)
-
-            rn = dict()
-            rn.update(dict((c, i) for i, c in enumerate(coeffs)))
-            rn.update(dict((c, i) for i, c in enumerate(consts)))
-            rn.update(dict((c, i) for i, c in enumerate(args)))
-
-            domains = []
-            for coeff in coeffs:
-                domains.append(*coeff.ufl_domains())
-            for arg in args:
-                domains.append(*arg.ufl_domains())
-            for gc in ufl.algorithms.analysis.extract_type(expr, ufl.classes.GeometricQuantity):
-                domains.append(*gc.ufl_domains())
-
-            domains = ufl.algorithms.analysis.unique_tuple(domains)
-            rn.update(dict((d, i) for i, d in enumerate(domains)))
-
-            signature = ufl.algorithms.signature.compute_expression_signature(expr, rn)
-            object_signature += signature
-            kind = "expression"
-        else:
-            raise RuntimeError("Unknown ufl object type {}".format(ufl_object.__class__.__name__))
+        signature, kind = _object_signature(ufl_object, coordinate_mapping)
+        object_signature += signature
 
     # Build combined signature
     signatures = [object_signature, str(ffcx.__version__), ffcx.codegeneration.get_signature(), kind, tag]
@@ -77,9 +36,85 @@ def compute_signature(ufl_objects, tag, coordinate_mapping=False):
     return hashlib.sha1(string.encode('utf-8')).hexdigest()
 
 
-def integral_name(integral_type, original_form, form_id, subdomain_id):
-    sig = compute_signature([original_form], str(form_id))
-    return "integral_{}_{}_{!s}".format(integral_type, subdomain_id, sig)
+# Signatures of UFL objects, keyed by object id. Entries are removed
+# when the object is garbage collected.
+_signature_cache = {}
+
+
+def _object_signature(ufl_object, coordinate_mapping):
+    """Return (signature, kind) of a UFL object, memoized per object.
+
+    Entries are removed when the object is garbage collected. Elements
+    which have been compiled are kept alive by the FIAT element cache in
+    ffcx.fiatinterface though, so their entries are not freed in
+    practice.
+    """
+    # Expressions are passed as (expression, points) tuples
+    key_object = ufl_object[0] if isinstance(ufl_object, tuple) else ufl_object
+    key = (id(key_object), coordinate_mapping)
+    try:
+        return _signature_cache[key]
+    except KeyError:
+        pass
+
+    # Get signature from ufl object
+    if isinstance(ufl_object, ufl.Form):
+        kind = "form"
+        signature = ufl_object.signature()
+    elif isinstance(ufl_object, ufl.Mesh):
+        # When coordinate mapping is represented by a Mesh, just getting
+        # its coordinate element
+        signature = repr(ufl_object.ufl_coordinate_element())
+        kind = "coordinate_mapping"
+    elif coordinate_mapping and isinstance(ufl_object, ufl.FiniteElementBase):
+        signature = repr(ufl_object)
+        kind = "coordinate_mapping"
+    elif isinstance(ufl_object, ufl.FiniteElementBase):
+        signature = repr(ufl_object)
+        kind = "element"
+    elif isinstance(ufl_object, tuple) and isinstance(ufl_object[0], ufl.core.expr.Expr):
+        expr = ufl_object[0]
+
+        # FIXME Move this to UFL
+        coeffs = ufl.algorithms.extract_coefficients(expr)
+        consts = ufl.algorithms.analysis.extract_constants(expr)
+        args = ufl.algorithms.analysis.extract_arguments(expr)
+
+        rn = dict()
+        rn.update(dict((c, i) for i, c in enumerate(coeffs)))
+        rn.update(dict((c, i) for i, c in enumerate(consts)))
+        rn.update(dict((c, i) for i, c in enumerate(args)))
+
+        domains = []
+        for coeff in coeffs:
+            domains.append(*coeff.ufl_domains())
+        for arg in args:
+            domains.append(*arg.ufl_domains())
+        for gc in ufl.algorithms.analysis.extract_type(expr, ufl.classes.GeometricQuantity):
+            domains.append(*gc.ufl_domains())
+
+        domains = ufl.algorithms.analysis.unique_tuple(domains)
+        rn.update(dict((d, i) for i, d in enumerate(domains)))
+
+        signature = ufl.algorithms.signature.compute_expression_signature(expr, rn)
+        kind = "expression"
+    else:
+        raise RuntimeError("Unknown ufl object type {}".format(ufl_object.__class__.__name__))
+
+    try:
+        weakref.finalize(key_object, _signature_cache.pop, key, None)
+        _signature_cache[key] = (signature, kind)
+    except TypeError:
+        # Object can not be weakly referenced (e.g. ufl.Form, which
+        # caches its signature itself)
+        pass
+
+    return signature, kind
+
+
+def integral_name(integral_type, subdomain_id, signature):
+    """Return name of an integral, see ffcx.ir.representation.compute_integral_signature."""
+    return "integral_{}_{}_{!s}".format(integral_type, subdomain_id, signature)
 
 
 def form_name(original_form, form_id):
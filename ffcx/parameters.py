@@ -20,6 +20,11 @@ FFCX_PARAMETERS = {
     "external_includes": "",  # ':' separated list of include filenames to add to generated code
     "tabulate_tensor_void": False,  # generate empty tabulation kernels, for benchmarking
 
+    # Number of processes computing the intermediate representation of
+    # elements and integrals in parallel (0 for one per CPU). Doesn't
+    # change the generated code.
+    "ir_jobs": 1,
+
     # Relative precision to use when comparing finite element table
     # values for table reuse
     "table_rtol": 1e-6,
@@ -28,6 +33,61 @@ FFCX_PARAMETERS = {
     # values for table reuse and dropping of table zeros
     "table_atol": 1e-9,
 
+    # Generate sum factorized kernels for cell integrals on
+    # quadrilaterals and hexahedra, contracting one dimensional tables
+    # along each direction of the cell
+    "sum_factorization": False,
+
+    # Integrate products of argument tables at compile time for blocks
+    # with factors which are constant over the cell, contracting the
+    # preintegrated tables with the factors at runtime
+    "preintegration": False,
+
+    # Number of cells tabulated by the additional batch kernel of each
+    # integral, or 0 to not generate it
+    "batch_size": 0,
+
+    # Number of scalars in the vectors of the innermost loops over dofs,
+    # using GCC/Clang vector extensions for the scalar type "double", or
+    # 0 for scalar loops. Should match the vector registers of the target
+    # (2 for SSE2, 4 for AVX2, 8 for AVX-512), wider vectors are emulated
+    # by the compiler.
+    "vector_width": 0,
+
+    # Strategy for the reflections and rotations of the dofs of vector
+    # valued elements (H(div), H(curl)) depending on the cell
+    # permutation: "conditional" builds the element tables with a
+    # conditional per transformed value, "tables" selects static
+    # variants of the tables for each reachable transformation (for at
+    # most 64 variants per table, otherwise falling back to
+    # "conditional"), "post" integrates with the untransformed tables
+    # and transforms the coefficient dofs before and the element tensor
+    # after the quadrature loops (not for interior facet integrals,
+    # which fall back to "conditional")
+    "dof_transformations": "conditional",
+
+    # Fuse loops accumulating the same values, eliminate common
+    # subexpressions of the accumulations and hoist loop invariant
+    # products out of the loops of the generated kernels
+    "optimize_loops": True,
+
+    # Accumulate only the entries on and above the diagonal of the
+    # element tensors of bilinear cell and exterior facet integrals which
+    # are symmetric, i.e. with the same test and trial element and
+    # symmetric factors: "none" accumulates the full tensor, "mirror"
+    # adds the entries below the diagonal after the quadrature loops,
+    # "upper" leaves them undefined for assemblers of symmetric matrices
+    # (see ufc_integral.upper_triangle)
+    "symmetric_tensor": "none",
+
+    # Evaluation of the coefficients in the quadrature points of cell
+    # and exterior facet integrals: "pointwise" sums over the dofs of
+    # each derivative of a coefficient in each point, "matvec" stacks
+    # the tables of all derivatives of a coefficient into one matrix
+    # and evaluates them in all points before the quadrature loop by a
+    # single matrix-vector product with the dofs
+    "coefficient_evaluation": "pointwise",
+
     # Number of points to evaluate
     "chunk_size": 8,
 
@@ -38,6 +98,15 @@ FFCX_PARAMETERS = {
 }
 
 
+# Parameters which don't change the generated code
+_code_independent_parameters = ("ir_jobs", )
+
+
+def code_parameters(parameters):
+    """Return the parameters which may change the generated code."""
+    return {k: v for k, v in parameters.items() if k not in _code_independent_parameters}
+
+
 def default_parameters():
     """Return (a copy of) the default parameter values for FFCX."""
     parameters = copy.deepcopy(FFCX_PARAMETERS)
@@ -4,13 +4,19 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import gc
 import sys
+import threading
 
+import pytest
+
+import ffcx.codegeneration.cache
 import ffcx.codegeneration.jit
+import ffcx.naming
 import ufl
 
 
-def test_cache_modes(compile_args):
+def test_cache_modes(compile_args, tmp_path):
     cell = ufl.triangle
     element = ufl.FiniteElement("Lagrange", cell, 1)
     u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
@@ -26,10 +32,211 @@ def test_cache_modes(compile_args):
 
     # Load form from cache
     compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
-        forms, cache_dir="./compile-cache", cffi_extra_compile_args=compile_args)
+        forms, cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
     newname = module.__name__
     newfile = module.__file__
     print(newname, newfile)
 
     assert(newname == tmpname)
     assert(newfile != tmpfile)
+
+
+def test_cache_eviction(compile_args, tmp_path):
+    cell = ufl.triangle
+    cache = ffcx.codegeneration.cache.JITCache(tmp_path, max_entries=1)
+    cache.set_limits(max_entries=1)
+
+    names = []
+    for degree in (1, 2):
+        element = ufl.FiniteElement("Lagrange", cell, degree)
+        u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+        a = ufl.inner(u, v) * ufl.dx
+        compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+            [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
+        names.append(module.__name__)
+
+    # Only the most recently used module is kept
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup(names[0]) is None
+    assert cache.lookup(names[1]) is not None
+    # Lock files are kept, they may be in use by another process
+    assert [f.suffix for f in tmp_path.glob(names[0] + "*")] == [".lock"]
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert {f.suffix for f in tmp_path.glob("libffcx_*")} == {".lock"}
+
+
+def test_cache_limits(tmp_path):
+    cache = ffcx.codegeneration.cache.JITCache(tmp_path)
+    main = ffcx.codegeneration.cache.main
+    assert main(["limit", str(tmp_path), "--max-size", "1K"]) == 0
+    assert main(["limit", str(tmp_path), "--max-entries", "5"]) == 0
+    assert cache.limits() == (1024, 5)
+
+    # Limits are only removed explicitly
+    assert main(["limit", str(tmp_path), "--max-size", "none"]) == 0
+    assert cache.limits() == (None, 5)
+    cache.set_limits(max_entries=None)
+    assert cache.limits() == (None, None)
+
+    # Reading a missing cache doesn't create it
+    missing = tmp_path / "missing"
+    with pytest.raises(SystemExit):
+        main(["stats", str(missing)])
+    with pytest.raises(FileNotFoundError):
+        ffcx.codegeneration.cache.JITCache(missing).stats()
+    assert not missing.exists()
+
+
+def test_cache_lock(compile_args, tmp_path):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(u, v) * ufl.dx
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms([a], cffi_extra_compile_args=compile_args)
+    module_name = module.__name__
+
+    # Another process is compiling the same module
+    with ffcx.codegeneration.jit._module_lock(tmp_path, module_name):
+        with pytest.raises(TimeoutError):
+            ffcx.codegeneration.jit.compile_forms(
+                [a], cache_dir=tmp_path, timeout=0.1, cffi_extra_compile_args=compile_args)
+
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, timeout=0.1, cffi_extra_compile_args=compile_args)
+    assert module.__name__ == module_name
+
+
+def test_source_cache(compile_args, tmp_path, monkeypatch):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(u, v) * ufl.dx
+    compiled_forms, module0 = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
+
+    def generate_source(ufl_objects, parameters):
+        raise RuntimeError("Generated C code should be loaded from the cache")
+
+    # Changing only the compiler flags reuses the generated C code
+    monkeypatch.setattr(ffcx.codegeneration.jit, "_generate_source", generate_source)
+    compiled_forms, module1 = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args + ["-O1"])
+    assert module0.__name__ != module1.__name__
+    assert len(list(tmp_path.glob("libffcx_forms_source_*.json"))) == 1
+
+
+def test_source_cache_concurrent(compile_args, tmp_path, monkeypatch):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+
+    # The same forms compiled with different flags by threads of one
+    # process generate the same source, and write it at the same time
+    barrier = threading.Barrier(2, timeout=60)
+    generate_source = ffcx.codegeneration.jit._generate_source
+
+    def generate_source_together(ufl_objects, parameters):
+        source = generate_source(ufl_objects, parameters)
+        barrier.wait()
+        return source
+
+    monkeypatch.setattr(ffcx.codegeneration.jit, "_generate_source", generate_source_together)
+    for k in range(1, 4):
+        a = k * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        futures = [ffcx.codegeneration.jit.compile_forms_async(
+            [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args + [flag]) for flag in ("-O1", "-O2")]
+        modules = [future.result()[1] for future in futures]
+        assert modules[0].__name__ != modules[1].__name__
+
+    assert len(list(tmp_path.glob("libffcx_forms_source_*.json"))) == 3
+    assert not list(tmp_path.glob("libffcx_forms_source_*.tmp"))
+
+
+def test_source_eviction(compile_args, tmp_path):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = 2 * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
+
+    # The generated source is an entry of the cache, and counts in its size
+    cache = ffcx.codegeneration.cache.JITCache(tmp_path)
+    sources = list(tmp_path.glob("libffcx_forms_source_*.json"))
+    assert len(sources) == 1
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["size"] >= sources[0].stat().st_size + cache.lookup(module.__name__).stat().st_size
+
+    assert ffcx.codegeneration.cache.main(["limit", str(tmp_path), "--max-size", "1K"]) == 0
+    assert ffcx.codegeneration.cache.main(["prune", str(tmp_path)]) == 0
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["size"] == 0
+    assert not list(tmp_path.glob("libffcx_forms_source_*"))
+
+
+def test_loaded_modules(compile_args):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    compiled_forms0, module0 = ffcx.codegeneration.jit.compile_forms([a], cffi_extra_compile_args=compile_args)
+
+    # Compiling again in the same process returns the loaded module
+    compiled_forms1, module1 = ffcx.codegeneration.jit.compile_forms([a], cffi_extra_compile_args=compile_args)
+    assert module1 is module0
+    assert compiled_forms1[0] is compiled_forms0[0]
+
+    # Signatures of objects which can be weakly referenced are memoized
+    # until the object is garbage collected
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 5)
+    ffcx.naming.compute_signature([element], "")
+    key = (id(element), False)
+    assert key in ffcx.naming._signature_cache
+    del element
+    assert key not in ffcx.naming._signature_cache
+
+
+def test_loaded_modules_release(compile_args, monkeypatch):
+    # Loaded modules are forgotten when one of their objects is
+    # garbage collected
+    mesh = ufl.Mesh(ufl.VectorElement("Lagrange", ufl.triangle, 3))
+    keys = set(ffcx.codegeneration.jit._loaded_modules)
+    ffcx.codegeneration.jit.compile_coordinate_maps([mesh], cffi_extra_compile_args=compile_args)
+    keys = set(ffcx.codegeneration.jit._loaded_modules) - keys
+    assert len(keys) == 1
+    del mesh
+    gc.collect()
+    assert not keys & set(ffcx.codegeneration.jit._loaded_modules)
+
+    # Forms can not be weakly referenced, the number of loaded modules
+    # is bounded instead
+    monkeypatch.setattr(ffcx.codegeneration.jit, "_loaded_modules_max_entries", 1)
+    element = ufl.FiniteElement("Discontinuous Lagrange", ufl.triangle, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    forms = [2 * ufl.inner(u, v) * ufl.dx, 3 * ufl.inner(u, v) * ufl.dx]
+    modules = [ffcx.codegeneration.jit.compile_forms([a], cffi_extra_compile_args=compile_args)[1] for a in forms]
+    assert len(ffcx.codegeneration.jit._loaded_modules) == 1
+    assert ffcx.codegeneration.jit.compile_forms([forms[1]], cffi_extra_compile_args=compile_args)[1] is modules[1]
+
+
+def test_loaded_modules_concurrent(compile_args, monkeypatch):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 4)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(u, v) * ufl.dx
+
+    # Concurrent compilations of the same forms compile them once
+    compile_or_load_cached = ffcx.codegeneration.jit._compile_or_load_cached
+    calls = []
+
+    def count_calls(*args):
+        calls.append(args)
+        return compile_or_load_cached(*args)
+
+    monkeypatch.setattr(ffcx.codegeneration.jit, "_compile_or_load_cached", count_calls)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        ffcx.codegeneration.jit.compile_forms([a], cffi_extra_compile_args=compile_args)[1])) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 4 and all(module is results[0] for module in results)
@@ -8,6 +8,14 @@ import os
 import os.path
 import subprocess
 
+import numpy as np
+
+import cffi
+import ffcx.codegeneration.jit
+import ffcx.main
+import pytest
+import ufl
+
 
 def test_cmdline_simple():
     os.chdir(os.path.dirname(__file__))
@@ -20,3 +28,55 @@ def test_visualise():
     subprocess.run(["ffcx", "--visualise", "Poisson.ufl"])
     assert os.path.isfile("S.pdf")
     assert os.path.isfile("F.pdf")
+
+
+@pytest.fixture
+def bundle_dir(tmp_path):
+    """Directory for a bundle, which is unregistered after the test."""
+    path = tmp_path / "bundle"
+    yield path
+    ffcx.codegeneration.jit.unregister_bundle(path)
+
+
+def test_bundle(bundle_dir, tmp_path):
+    ufl_file = tmp_path / "Source.ufl"
+    ufl_file.write_text("""from ufl import Coefficient, FiniteElement, TestFunction, dx, triangle
+element = FiniteElement("Lagrange", triangle, 1)
+v = TestFunction(element)
+f = Coefficient(element)
+L = f * v * dx
+""")
+    assert ffcx.main.main(["--bundle", str(bundle_dir), "-j", "2", str(ufl_file)]) == 0
+    assert os.path.isfile(bundle_dir / "ffcx-bundle.json")
+
+    # Forms of the bundle are loaded instead of compiled
+    ffcx.codegeneration.jit.register_bundle(bundle_dir)
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 1)
+    v = ufl.TestFunction(element)
+    f = ufl.Coefficient(element)
+    L = f * v * ufl.dx
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms([L])
+    assert module.__name__.startswith("libffcx_bundle_")
+    assert compiled_forms[0].rank == 1
+    assert compiled_forms[0].num_coefficients == 1
+
+    ffi = cffi.FFI()
+    form0 = compiled_forms[0][0]
+    assert form0.num_cell_integrals == 1
+    integral = form0.create_cell_integral(-1)
+
+    b = np.zeros(3, dtype=np.float64)
+    w = np.array([1.0, 2.0, 3.0], dtype=np.float64)
+    c = np.array([], dtype=np.float64)
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0], dtype=np.float64)
+    integral.tabulate_tensor(
+        ffi.cast('double *', b.ctypes.data), ffi.cast('double *', w.ctypes.data),
+        ffi.cast('double *', c.ctypes.data), ffi.cast('double *', coords.ctypes.data), ffi.NULL, ffi.NULL, 0)
+
+    M = np.array([[2.0, 1.0, 1.0], [1.0, 2.0, 1.0], [1.0, 1.0, 2.0]]) / 24.0
+    assert np.allclose(b, M @ w)
+
+    # Unregistered bundles are no longer used
+    ffcx.codegeneration.jit.unregister_bundle(bundle_dir)
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms([L], cache_dir=tmp_path)
+    assert not module.__name__.startswith("libffcx_bundle_")
@@ -0,0 +1,108 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import pickle
+
+import numpy as np
+import pytest
+
+import ufl
+from ffcx.ir.elementtables import (TabulationCache, build_unique_tables, equal_tables, get_ffcx_permuted_table_values,
+                                   get_ffcx_table_values, permute_quadrature_points)
+from ffcx.ir.representationutils import QuadratureRule, create_quadrature_rule
+
+
+def test_build_unique_tables():
+    rng = np.random.RandomState(42)
+    rtol, atol = 1e-6, 1e-9
+    base = [rng.uniform(-1.0, 1.0, size=(1, 2, 3, 4)) for i in range(20)]
+    base += [np.zeros((1, 2, 3, 4)), np.ones((1, 1, 3, 4))]
+
+    # Perturbations around the tolerance, some within and some outside
+    tables = []
+    for i in range(500):
+        t = base[rng.randint(len(base))]
+        scale = rng.choice([0.0, 0.5, 0.99, 1.01, 2.0])
+        tables.append(t + scale * (atol + rtol * abs(t)) * rng.choice([-1.0, 1.0], size=t.shape))
+
+    unique, mapping = build_unique_tables(tables, rtol=rtol, atol=atol)
+
+    # Reference: compare with all previously found unique tables
+    ref_unique = []
+    ref_mapping = {}
+    for k, t in enumerate(tables):
+        found = [i for i, u in enumerate(ref_unique) if equal_tables(u, t, rtol=rtol, atol=atol)]
+        if found:
+            ref_mapping[k] = found[0]
+        else:
+            ref_mapping[k] = len(ref_unique)
+            ref_unique.append(t)
+
+    assert mapping == ref_mapping
+    assert len(unique) == len(ref_unique)
+    assert len(unique) > len(base)
+
+
+def test_tabulation_cache(tmp_path):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    points = np.array([[0.2, 0.3], [0.5, 0.1]])
+    cache = TabulationCache()
+    t0 = cache.tabulate(element, None, 1, points)
+    assert cache.tabulate(element, None, 1, points.copy()) is t0
+    assert cache.tabulate(element, None, 0, points) is not t0
+    assert t0[(0, 0)].shape == (6, 2)
+    assert not t0[(0, 0)].flags.writeable
+
+    # Bounded memory, least recently used tabulations are evicted
+    cache.max_size = sum(t.nbytes for t in t0.values()) + 1
+    cache.tabulate(element, None, 1, points + 0.1)
+    assert cache.size <= cache.max_size
+    assert cache.tabulate(element, None, 1, points) is not t0
+
+    # Persistence
+    cache.save(tmp_path / "tabulations.pickle")
+    other = TabulationCache()
+    other.load(tmp_path / "tabulations.pickle")
+    assert other.size == cache.size
+    assert np.allclose(other.tabulate(element, None, 1, points)[(1, 0)], t0[(1, 0)])
+    assert other.size == cache.size
+
+
+@pytest.mark.parametrize("cellname,family", [("triangle", "P"), ("tetrahedron", "P"), ("hexahedron", "Q")])
+def test_permuted_table_values(cellname, family):
+    cell = ufl.Cell(cellname)
+    tdim = cell.topological_dimension()
+    element = ufl.MixedElement([ufl.VectorElement(family, cellname, 2), ufl.FiniteElement(family, cellname, 1)])
+    points = np.array([[0.1, 0.2, 0.3][:tdim - 1], [0.6, 0.3, 0.1][:tdim - 1]])
+    permuted_points = permute_quadrature_points(points, cell)
+    assert len(permuted_points) == {"triangle": 2, "tetrahedron": 6, "hexahedron": 8}[cellname]
+
+    # All permutations tabulated at once are the same as each one
+    # tabulated on its own
+    derivatives = (1, ) + (0, ) * (tdim - 1)
+    for component in (0, tdim):
+        tables = get_ffcx_permuted_table_values(permuted_points, cell, "interior_facet", element, None, "facet",
+                                                derivatives, component)
+        assert tables.shape[:3] == (len(permuted_points), cell.num_facets(), 2)
+        for perm, p in enumerate(permuted_points):
+            table = get_ffcx_table_values(p, cell, "interior_facet", element, None, "facet", derivatives, component)
+            assert np.allclose(tables[perm], table, rtol=0.0, atol=1e-14)
+
+
+def test_quadrature_rule_interning():
+    rule = create_quadrature_rule("cell", ufl.triangle, 2, "default")
+    assert create_quadrature_rule("cell", ufl.triangle, 2, "default") is rule
+    assert create_quadrature_rule("cell", ufl.triangle, 4, "default") is not rule
+
+    # Rules with the same points and weights are the same object
+    same = QuadratureRule(rule.points.copy(), list(rule.weights))
+    assert same is rule and same == rule and hash(same) == hash(rule)
+    assert pickle.loads(pickle.dumps(rule)) is rule
+
+    with pytest.raises(AttributeError):
+        rule.points = rule.points[:1]
+    with pytest.raises(ValueError):
+        rule.points[0, 0] = 0.5
@@ -0,0 +1,47 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import numpy as np
+
+import ufl
+from ffcx.ir.analysis.graph import ExpressionGraph, build_scalar_graph
+
+
+def test_expression_graph_edges():
+    G = ExpressionGraph("abcde")
+    G.set_edges([3, 1, 3, 4, 3], [1, 0, 0, 3, 1])
+    assert G.number_of_nodes() == 5
+
+    # Edges of each node are kept in insertion order, and multiple edges
+    # between the same nodes are allowed
+    assert list(G.out_edges(3)) == [1, 0, 1]
+    assert list(G.out_edges(2)) == []
+    assert list(G.in_edges(0)) == [1, 3]
+    assert list(G.in_edges(1)) == [3, 3]
+
+    assert list(np.flatnonzero(G.reachable([4]))) == [0, 1, 3, 4]
+    assert list(np.flatnonzero(G.reachable([0], reverse=True))) == [0, 1, 3, 4]
+    mask = np.array([True, True, True, False, True])
+    assert list(np.flatnonzero(G.reachable([0], reverse=True, mask=mask))) == [0, 1]
+
+
+def test_build_scalar_graph():
+    element = ufl.VectorElement("Lagrange", ufl.triangle, 1)
+    f = ufl.Coefficient(element)
+    i = ufl.Index()
+    expression = f[i] * f[i] + f[0]
+    G = build_scalar_graph(expression)
+
+    targets = G.targets()
+    assert len(targets) == 1
+    assert G.target_components[targets[0]] == [0]
+
+    # Edges point from each expression to its operands
+    for i, v in enumerate(G.expressions):
+        operands = [o for o in v.ufl_operands if G.e2i.get(o, i) != i]
+        assert [G.expressions[j] for j in G.out_edges(i)] == operands
+        for j in G.in_edges(i):
+            assert i in G.out_edges(j)
@@ -0,0 +1,42 @@
+# Copyright (C) 2020 FEniCS Project
+#
+# This file is part of FFCX.(https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import json
+
+import ffcx.codegeneration.jit
+import ffcx.instrumentation
+import ffcx.ir.representation
+import ufl
+
+
+def test_collect(compile_args, tmp_path):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    # The IR of integrals compiled before by other tests is reused
+    ffcx.ir.representation.integral_ir_cache.clear()
+    with ffcx.instrumentation.collect() as report:
+        ffcx.codegeneration.jit.compile_forms([a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
+
+    report.dump(tmp_path / "timings.json")
+    with open(tmp_path / "timings.json") as f:
+        timings = json.load(f)
+
+    sections = {s["name"]: s for s in timings["sections"]}
+    assert {"analysis", "intermediate representation", "code generation", "formatting",
+            "C compiler"} <= set(sections)
+    assert all(s["time"] >= 0.0 and s["peak_memory"] >= 0 for s in sections.values())
+
+    integrals = {s["name"]: s for s in sections["intermediate representation"]["sections"]}["integrals"]
+    integral, = integrals["sections"]
+    assert integral["name"].startswith("integral_cell")
+    assert [s["name"] for s in integral["sections"]] == ["build_optimized_tables", "factorization"]
+
+    # Sections are not recorded without collection
+    with ffcx.instrumentation.section("ignored"):
+        pass
+    assert len(report.sections) == len(timings["sections"])
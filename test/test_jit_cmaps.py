@@ -13,13 +13,13 @@ import ufl
 
 
 @pytest.mark.parametrize("degree", [1, 2])
-def test_cmap_triangle(degree, compile_args):
+def test_cmap_triangle(degree, compile_args, tmp_path):
     """Test triangle cell."""
     cell = ufl.triangle
     element = ufl.VectorElement("Lagrange", cell, degree)
     mesh = ufl.Mesh(element)
     compiled_cmap, module = ffcx.codegeneration.jit.compile_coordinate_maps(
-        [mesh], cffi_extra_compile_args=compile_args, cache_dir=".")
+        [mesh], cffi_extra_compile_args=compile_args, cache_dir=tmp_path)
 
     assert compiled_cmap[0].is_affine == (1 if (degree == 1) else 0)
     assert compiled_cmap[0].geometric_dimension == 2
@@ -135,3 +135,35 @@ def test_rank1(compile_args):
     u_correct = np.array([f[1], f[0]]) + gradf0
 
     assert np.allclose(u_ffcx, u_correct)
+
+
+def test_zero_tables(compile_args):
+    """Tests evaluation of a vector-valued expression with zero tables.
+
+    The second derivatives of a P1 function are zero, so their tables
+    are eliminated from the expression [div(grad(f)), f].
+
+    """
+    e = ufl.FiniteElement("P", "triangle", 1)
+    mesh = ufl.Mesh(ufl.VectorElement("P", "triangle", 1))
+    V = ufl.FunctionSpace(mesh, e)
+    f = ufl.Coefficient(V)
+    expr = ufl.as_vector([ufl.div(ufl.grad(f)), f])
+
+    points = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    obj, module = ffcx.codegeneration.jit.compile_expressions([(expr, points)], cffi_extra_compile_args=compile_args)
+
+    ffi = cffi.FFI()
+    kernel = obj[0][0]
+
+    A = np.zeros((2, 3), dtype=np.float64)
+    w = np.array([1.0, 2.0, 3.0], dtype=np.float64)
+    c = np.array([], dtype=np.float64)
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0], dtype=np.float64)
+    kernel.tabulate_expression(
+        ffi.cast('double *', A.ctypes.data),
+        ffi.cast('double *', w.ctypes.data),
+        ffi.cast('double *', c.ctypes.data),
+        ffi.cast('double *', coords.ctypes.data))
+
+    assert np.allclose(A, [[0.0, 0.0, 0.0], [1.0, 2.0, 3.0]])
@@ -4,10 +4,19 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import concurrent.futures
+import os
+import sys
+import time
+
 import numpy as np
 
 import cffi
+import ffcx.analysis
 import ffcx.codegeneration.jit
+import ffcx.compiler
+import ffcx.ir.representation
+import ffcx.parameters
 import pytest
 import ufl
 
@@ -28,6 +37,37 @@ def float_to_type(name):
         raise RuntimeError("Unknown C type for: {}".format(name))
 
 
+def _tabulate_cell_tensors(forms, parameters, w, coords, compile_args, cell_permutations=(0, ), initial_value=0.0):
+    """Compile forms and tabulate the tensors of their default cell integrals.
+
+    Returns one array for each form, with the tensor of each cell
+    permutation. The tensors of functionals have shape (1, ).
+    """
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        forms, parameters=parameters, cffi_extra_compile_args=compile_args)
+
+    ffi = cffi.FFI()
+    c_type, np_type = float_to_type(parameters.get("scalar_type", "double"))
+    w = np.ascontiguousarray(w, dtype=np_type)
+    c = np.array([], dtype=np_type)
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+
+    tensors = []
+    for compiled_form in compiled_forms:
+        form = compiled_form[0]
+        shape = tuple(form.create_finite_element(i).space_dimension for i in range(form.rank)) or (1, )
+        integral = form.create_cell_integral(-1)
+        A = np.full((len(cell_permutations), ) + shape, initial_value, dtype=np_type)
+        for A_cell, cell_permutation in zip(A, cell_permutations):
+            integral.tabulate_tensor(
+                ffi.cast('{type} *'.format(type=c_type), A_cell.ctypes.data),
+                ffi.cast('{type} *'.format(type=c_type), w.ctypes.data),
+                ffi.cast('{type} *'.format(type=c_type), c.ctypes.data),
+                ffi.cast('double *', coords.ctypes.data), ffi.NULL, ffi.NULL, cell_permutation)
+        tensors.append(A)
+    return tensors
+
+
 @pytest.mark.parametrize("mode,expected_result", [
     ("double", np.array([[1.0, -0.5, -0.5], [-0.5, 0.5, 0.0], [-0.5, 0.0, 0.5]], dtype=np.float64)),
     ("double complex",
@@ -267,6 +307,146 @@ def test_form_coefficient(compile_args):
     assert np.isclose(A_diff.min(), 0.0)
 
 
+def test_parallel_compilation(compile_args, tmp_path):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a0 = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + ufl.inner(u, v) * ufl.dx(2)
+    a1 = ufl.inner(u, v) * ufl.dx
+    forms = [a0, a1]
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        forms, cache_dir=tmp_path, cffi_extra_compile_args=compile_args, cffi_jobs=2)
+
+    # At least one translation unit per integral and form
+    assert len(list(tmp_path.glob(module.__name__ + "_unit*.o"))) >= 5
+
+    form0 = compiled_forms[0][0].create_cell_integral(-1)
+    A = np.zeros((3, 3), dtype=np.float64)
+    w = np.array([], dtype=np.float64)
+    c = np.array([], dtype=np.float64)
+
+    ffi = cffi.FFI()
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0], dtype=np.float64)
+    form0.tabulate_tensor(
+        ffi.cast('double  *', A.ctypes.data),
+        ffi.cast('double  *', w.ctypes.data),
+        ffi.cast('double  *', c.ctypes.data),
+        ffi.cast('double  *', coords.ctypes.data), ffi.NULL, ffi.NULL, 0)
+
+    A_analytic = np.array([[1.0, -0.5, -0.5], [-0.5, 0.5, 0.0], [-0.5, 0.0, 0.5]], dtype=np.float64)
+    assert np.allclose(A, A_analytic)
+
+
+def test_parallel_ir(monkeypatch):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(element)
+    a0 = f * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + ufl.inner(u, v) * ufl.dx(2)
+    a1 = ufl.inner(u, v) * ufl.dx
+    L = f * v * ufl.dx(1)
+
+    # Same code as with serial IR computation
+    code = []
+    for ir_jobs in (1, 2):
+        parameters = ffcx.parameters.default_parameters()
+        parameters["ir_jobs"] = ir_jobs
+        code.append(ffcx.compiler.compile_ufl_objects([a0, a1, L], prefix="JIT", parameters=parameters))
+    assert code[0] == code[1]
+
+    # Concurrent calls from several threads don't fork, and don't share
+    # their tasks
+    def no_process_pool(*args, **kwargs):
+        raise AssertionError("Forked worker processes from a threaded process")
+
+    monkeypatch.setattr(ffcx.ir.representation.concurrent.futures, "ProcessPoolExecutor", no_process_pool)
+    parameters = ffcx.parameters.default_parameters()
+    parameters["ir_jobs"] = 2
+    forms = [[a0, a1, L], [a1]]
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(ffcx.compiler.compile_ufl_objects, f, prefix="JIT", parameters=parameters)
+                   for f in forms]
+        threaded_code = [future.result() for future in futures]
+    assert threaded_code[0] == code[0]
+    assert threaded_code[1] == ffcx.compiler.compile_ufl_objects(
+        forms[1], prefix="JIT", parameters=ffcx.parameters.default_parameters())
+
+
+@pytest.mark.parametrize("cffi_jobs", [None, 2])
+def test_recompile_changed_integral(compile_args, tmp_path, cffi_jobs):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a0 = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + ufl.inner(u, v) * ufl.dx(1)
+    a1 = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + 2 * ufl.inner(u, v) * ufl.dx(1)
+
+    # Only the name of the changed integral changes
+    parameters = ffcx.parameters.default_parameters()
+    names = []
+    for a in (a0, a1):
+        analysis = ffcx.analysis.analyze_ufl_objects([a], parameters)
+        ir = ffcx.ir.representation.compute_ir(analysis, {}, "JIT", parameters, False)
+        names.append({integral.name for integral in ir.integrals})
+    assert len(names[0] & names[1]) == 1
+
+    # Object files are reused with the default number of jobs as well
+    kwargs = {} if cffi_jobs is None else {"cffi_jobs": cffi_jobs}
+    modules = []
+    for a in (a0, a1):
+        compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+            [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, **kwargs)
+        assert compiled_forms[0][0].num_cell_integrals == 2
+        modules.append(module.__name__)
+
+    # Only the changed integral and the form are compiled again, the
+    # object files of the other translation units are reused
+    num_units = len(list(tmp_path.glob(modules[0] + "_unit*.o")))
+    assert len(list(tmp_path.glob(modules[1] + "_unit*.o"))) == num_units
+    assert len(list(tmp_path.glob(modules[1] + "_unit*.c"))) == 2
+
+
+def test_compile_forms_async(compile_args, tmp_path):
+    cell = ufl.triangle
+    futures = []
+    for degree in (1, 2, 3):
+        element = ufl.FiniteElement("Lagrange", cell, degree)
+        u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+        a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        futures.append(ffcx.codegeneration.jit.compile_forms_async(
+            [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args))
+
+    for degree, future in zip((1, 2, 3), futures):
+        compiled_forms, module = future.result()
+        form0 = compiled_forms[0][0]
+        assert form0.rank == 2
+        assert form0.create_finite_element(0).space_dimension == (degree + 1) * (degree + 2) // 2
+
+
+def test_compile_forms_async_process_state(compile_args, tmp_path, capsys):
+    element = ufl.FiniteElement("Lagrange", ufl.tetrahedron, 4)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + 5 * ufl.inner(u, v) * ufl.dx
+    cwd = os.getcwd()
+    stdout = sys.stdout
+
+    # The working directory and stdout of the process are not changed
+    # by the compilation in the background
+    future = ffcx.codegeneration.jit.compile_forms_async(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args)
+    pending = 0
+    while not future.done():
+        assert os.getcwd() == cwd
+        assert sys.stdout is stdout
+        print("pending")
+        pending += 1
+        time.sleep(0.01)
+    compiled_forms, module = future.result()
+    assert compiled_forms[0].rank == 2
+
+    assert pending > 0
+    assert capsys.readouterr().out == pending * "pending\n"
+
+
 def test_subdomains(compile_args):
     cell = ufl.triangle
     element = ufl.FiniteElement("Lagrange", cell, 1)
@@ -438,3 +618,244 @@ def test_custom_quadrature(compile_args):
 
     # Check that A is diagonal
     assert np.count_nonzero(A - np.diag(np.diagonal(A))) == 0
+
+
+@pytest.mark.parametrize("cell,coords", [
+    (ufl.quadrilateral, np.array([0.0, 0.0, 2.0, 0.1, 0.1, 1.0, 2.2, 1.5], dtype=np.float64)),
+    (ufl.hexahedron, np.array([0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 1.1, 1.2, 0.0,
+                               0.0, 0.0, 1.0, 1.0, 0.0, 1.0, 0.0, 1.0, 1.0, 1.1, 1.2, 1.3], dtype=np.float64)),
+])
+@pytest.mark.parametrize("vector", [False, True])
+def test_sum_factorization(cell, coords, vector, compile_args):
+    if vector:
+        element = ufl.VectorElement("Q", cell, 2)
+    else:
+        element = ufl.FiniteElement("Q", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(element)
+    if vector:
+        # The components share their tables, but not their dofs
+        a = (ufl.inner(f, f) + 1) * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + ufl.inner(u, v) * ufl.dx
+        L = f[1] * ufl.inner(ufl.grad(f)[:, 0], v) * ufl.dx
+    else:
+        a = (f + 1) * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + u * v * ufl.dx
+        L = f * ufl.grad(f)[0] * v * ufl.dx
+
+    ndofs = element.reference_value_size() * 3 ** cell.topological_dimension()
+    w = np.arange(1.0, ndofs + 1) / ndofs
+    results = [_tabulate_cell_tensors([a, L], {"sum_factorization": sum_factorization}, w, coords, compile_args)
+               for sum_factorization in (False, True)]
+    for A0, A1 in zip(*results):
+        assert np.allclose(A0, A1)
+
+
+@pytest.mark.parametrize("cell,coords", [
+    (ufl.triangle, np.array([0.0, 0.0, 2.0, 0.1, 0.3, 1.0], dtype=np.float64)),
+    (ufl.tetrahedron, np.array([0.0, 0.0, 0.0, 1.0, 0.1, 0.0, 0.2, 1.0, 0.0, 0.1, 0.3, 1.2], dtype=np.float64)),
+])
+def test_preintegration(cell, coords, compile_args):
+    element = ufl.VectorElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(ufl.FiniteElement("DG", cell, 0))
+    g = ufl.Coefficient(element)
+    a = f * ufl.inner(ufl.sym(ufl.grad(u)), ufl.sym(ufl.grad(v))) * ufl.dx + ufl.div(u) * ufl.div(v) * ufl.dx \
+        + ufl.inner(g, u) * v[0] * ufl.dx
+    L = f * ufl.inner(ufl.grad(v), ufl.Identity(cell.geometric_dimension())) * ufl.dx
+
+    tdim = cell.topological_dimension()
+    ndofs = element.reference_value_size() * (tdim + 1) * (tdim + 2) // 2
+    w = np.arange(1.0, ndofs + 2) / ndofs
+    results = [_tabulate_cell_tensors([a, L], {"preintegration": preintegration}, w, coords, compile_args)
+               for preintegration in (False, True)]
+    for A0, A1 in zip(*results):
+        assert np.allclose(A0, A1)
+
+
+def test_tabulate_tensor_batch(compile_args):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("N1curl", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(ufl.FiniteElement("Lagrange", cell, 1))
+    a = f * ufl.inner(u, v) * ufl.dx + ufl.inner(ufl.curl(u), ufl.curl(v)) * ufl.dx
+
+    batch_size = 4
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        [a], parameters={"batch_size": batch_size}, cffi_extra_compile_args=compile_args)
+    integral = compiled_forms[0][0].create_cell_integral(-1)
+    assert integral.batch_size == batch_size
+
+    ffi = cffi.FFI()
+    ndofs = 8
+    w = np.array([[1.0, 2.0, 3.0], [0.5, 0.1, 0.2], [1.0, 1.0, 1.0], [3.0, 2.0, 1.0]])
+    c = np.array([], dtype=np.float64)
+    coords = np.array([[0.0, 0.0, 1.0, 0.0, 0.0, 1.0],
+                       [0.1, 0.0, 2.0, 0.5, 0.3, 1.0],
+                       [1.0, 1.0, 0.0, 1.0, 1.0, 0.0],
+                       [0.0, 0.0, 0.5, 0.1, 0.2, 3.0]])
+    cell_permutations = np.array([0, 1, 5, 7], dtype=np.uint32)
+
+    # Tabulate each cell separately
+    A = np.zeros((batch_size, ndofs, ndofs))
+    for b in range(batch_size):
+        integral.tabulate_tensor(
+            ffi.cast('double *', A[b].ctypes.data), ffi.cast('double *', w[b].ctypes.data),
+            ffi.cast('double *', c.ctypes.data), ffi.cast('double *', coords[b].ctypes.data),
+            ffi.NULL, ffi.NULL, int(cell_permutations[b]))
+
+    # Tabulate the batch, in structure-of-arrays layout
+    A_batch = np.zeros((ndofs, ndofs, batch_size))
+    w_batch = np.ascontiguousarray(w.T)
+    coords_batch = np.ascontiguousarray(coords.T)
+    integral.tabulate_tensor_batch(
+        ffi.cast('double *', A_batch.ctypes.data), ffi.cast('double *', w_batch.ctypes.data),
+        ffi.cast('double *', c.ctypes.data), ffi.cast('double *', coords_batch.ctypes.data),
+        ffi.NULL, ffi.NULL, ffi.cast('uint32_t *', cell_permutations.ctypes.data))
+
+    assert np.allclose(A_batch, np.moveaxis(A, 0, -1))
+
+
+def test_vector_width(compile_args):
+    cell = ufl.tetrahedron
+    element = ufl.FiniteElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(element)
+    a = f * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    L = f * v * ufl.dx
+
+    w = np.arange(1.0, 11.0) / 10
+    coords = [0.0, 0.0, 0.0, 1.0, 0.1, 0.0, 0.2, 1.0, 0.0, 0.1, 0.3, 1.2]
+    results = [_tabulate_cell_tensors([a, L], {"vector_width": vector_width}, w, coords, compile_args)
+               for vector_width in (0, 4)]
+    for A0, A1 in zip(*results):
+        assert np.allclose(A0, A1)
+
+
+@pytest.mark.parametrize("strategy", ["tables", "post"])
+def test_dof_transformations(compile_args, strategy):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("N1curl", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = ufl.inner(u, v) * ufl.dx + ufl.inner(ufl.curl(u), ufl.curl(v)) * ufl.dx
+    L = ufl.inner(g, v) * ufl.dx
+    M = ufl.inner(g, g) * ufl.dx
+
+    w = np.arange(1.0, 9.0) / 8
+    coords = [0.0, 0.0, 1.0, 0.1, 0.2, 1.3]
+    results = [_tabulate_cell_tensors([a, L, M], {"dof_transformations": dof_transformations}, w, coords,
+                                      compile_args, cell_permutations=range(8))
+               for dof_transformations in ("conditional", strategy)]
+    for A0, A1 in zip(*results):
+        assert np.allclose(A0, A1)
+
+
+@pytest.mark.parametrize("cell,family,degree,coords,cell_permutations", [
+    (ufl.triangle, "N1curl", 2, [0.0, 0.0, 1.0, 0.1, 0.2, 1.3], range(8)),
+    (ufl.tetrahedron, "N2curl", 3, [0.0, 0.0, 0.0, 1.0, 0.1, 0.0, 0.2, 1.3, 0.0, 0.1, 0.2, 1.1],
+     [0, 1, 2, 3, 4, 5, 0o2345, 0o543210, 0o772103])])
+def test_apply_dof_transformation(compile_args, cell, family, degree, coords, cell_permutations):
+    element = ufl.FiniteElement(family, cell, degree)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = ufl.inner(u, v) * ufl.dx
+    L = ufl.inner(g, v) * ufl.dx
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        [a, L], cffi_extra_compile_args=compile_args)
+
+    ffi = module.ffi
+    ndofs = compiled_forms[0][0].create_finite_element(0).space_dimension
+    w = np.arange(1.0, ndofs + 1) / ndofs
+
+    def transform(function, data, block_size, cell_permutation):
+        data = np.array(data, order="C")
+        assert function(ffi.cast('double *', data.ctypes.data), block_size, cell_permutation) == 0
+        return data
+
+    tensors = _tabulate_cell_tensors([a, L], {}, w, coords, compile_args, cell_permutations=[0, *cell_permutations])
+    A_ref = tensors[0][0]
+    for A, b, cell_permutation in zip(tensors[0][1:], tensors[1][1:], cell_permutations):
+        for obj in (compiled_forms[1][0].create_finite_element(1), compiled_forms[1][0].create_dofmap(1)):
+            # Transform the rows, then the columns of the element tensor
+            A_transformed = transform(obj.apply_dof_transformation, A_ref, ndofs, cell_permutation)
+            A_transformed = transform(obj.apply_dof_transformation, A_transformed.T, ndofs, cell_permutation).T
+            assert np.allclose(A, A_transformed)
+
+            # Transform the coefficient to the reference dofs, and the
+            # vector back to the dofs of the cell
+            w_ref = transform(obj.apply_dof_transformation_transpose, w, 1, cell_permutation)
+            b_ref = _tabulate_cell_tensors([L], {}, w_ref, coords, compile_args)[0][0]
+            assert np.allclose(b, transform(obj.apply_dof_transformation, b_ref, 1, cell_permutation))
+
+
+@pytest.mark.parametrize("mode", ["double", "double complex"])
+def test_optimize_loops(mode, compile_args):
+    cell = ufl.triangle
+    element = ufl.VectorElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(ufl.FiniteElement("Lagrange", cell, 2))
+    a = f * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + ufl.inner(u, v) * ufl.dx
+
+    w = [1.0, 2.0, 0.5, 3.0, 1.5, 0.25]
+    coords = [0.0, 0.0, 2.0, 0.5, 0.25, 1.0]
+    A0, A1 = [_tabulate_cell_tensors([a], {'scalar_type': mode, 'optimize_loops': optimize}, w, coords,
+                                     compile_args)[0][0]
+              for optimize in (False, True)]
+    assert np.allclose(A0, A1)
+    assert np.allclose(A1, A1.T)
+
+
+@pytest.mark.parametrize("mode", ["double", "double complex"])
+@pytest.mark.parametrize("symmetric_tensor", ["mirror", "upper"])
+def test_symmetric_tensor(mode, symmetric_tensor, compile_args):
+    cell = ufl.triangle
+    element = ufl.VectorElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    f = ufl.Coefficient(ufl.FiniteElement("Lagrange", cell, 1))
+
+    def eps(w):
+        return ufl.sym(ufl.grad(w))
+
+    a = f * ufl.inner(eps(u), eps(v)) * ufl.dx + ufl.inner(ufl.div(u), ufl.div(v)) * ufl.dx
+    b = ufl.inner(ufl.grad(u[0]), v) * ufl.dx
+
+    # The tensors are initialized to ones, as the mirrored entries are
+    # added to the tensor as well
+    w = [1.0, 2.0, 0.5]
+    coords = [0.0, 0.0, 2.0, 0.5, 0.25, 1.0]
+    parameters = {'scalar_type': mode, 'symmetric_tensor': symmetric_tensor}
+    A_full, B_full = _tabulate_cell_tensors([a, b], {'scalar_type': mode, 'symmetric_tensor': "none"}, w, coords,
+                                            compile_args, initial_value=1.0)
+    A, B = _tabulate_cell_tensors([a, b], parameters, w, coords, compile_args, initial_value=1.0)
+    compiled_forms, module = ffcx.codegeneration.jit.compile_forms(
+        [a, b], parameters=parameters, cffi_extra_compile_args=compile_args)
+    upper_triangle = [form[0].create_cell_integral(-1).upper_triangle for form in compiled_forms]
+
+    # The bilinear form b is not symmetric
+    assert not upper_triangle[1]
+    assert np.allclose(B, B_full)
+
+    assert upper_triangle[0] == (symmetric_tensor == "upper")
+    if symmetric_tensor == "upper":
+        upper = (0, ) + np.triu_indices(12)
+        assert np.allclose(A[upper], A_full[upper])
+    else:
+        assert np.allclose(A, A_full)
+
+
+@pytest.mark.parametrize("mode", ["double", "double complex"])
+def test_coefficient_evaluation(mode, compile_args):
+    cell = ufl.triangle
+    element = ufl.VectorElement("Lagrange", cell, 2)
+    v = ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    f = ufl.Coefficient(ufl.FiniteElement("Lagrange", cell, 2))
+
+    F = ufl.Identity(2) + ufl.grad(g)
+    L = ufl.inner(ufl.det(F) * F, ufl.grad(v)) * ufl.dx + f * ufl.inner(ufl.grad(f), v) * ufl.dx
+
+    w = np.arange(1.0, 19.0) / 18
+    coords = [0.0, 0.0, 2.0, 0.5, 0.25, 1.0]
+    b0, b1 = [_tabulate_cell_tensors([L], {'scalar_type': mode, 'coefficient_evaluation': coefficient_evaluation},
+                                     w, coords, compile_args)[0]
+              for coefficient_evaluation in ("pointwise", "matvec")]
+    assert np.allclose(b0, b1)